@@ -0,0 +1,228 @@
+import os
+import csv
+import queue
+import argparse
+import numpy as np
+import multiprocessing as mp
+from blackjack_utils import load_reward_config
+from score_table import compile_reward_config, batch_rewards
+from batch_env import BatchBlackjackEnv, rollout, rollout_transitions
+from numpy_policy import NumpyPolicy, fold_state_dict
+
+# ---------------------------------------------------------
+# アクター・ラーナー型の学習
+# ---------------------------------------------------------
+# アクター (別プロセス) は最新の重みのコピーでゲームを ε-greedy にまとめて進め、遷移の配列をキューに送る。
+# ラーナー (このプロセス) は DQNAgent を持ち、届いた遷移をリプレイメモリに入れて大きなバッチで学習する。
+#   - アクターは torch を使わない (重みは BatchNorm を畳み込んだ NumPy の MLP として共有メモリで受け取る)
+#   - ラーナーは PUBLISH_EVERY 回学習するごとに重みと ε を共有メモリに書き、アクターは次のバッチの前に読み直す
+#   - キューの長さには上限があるので、ラーナーが追いつかないときはアクターが待つ
+# 出力は train_and_save と同じ model_<性格>.pth と performance_<性格>.csv。
+#
+# 使い方:
+#   python actor_learner.py personality/config_normal.csv --actors 4
+#   python train_all.py --learner actor --actors 4
+
+NUM_ACTORS = max(1, (os.cpu_count() or 2) - 1)
+GAMES_PER_ROLLOUT = 64  # アクターが1回に進めるゲーム数
+QUEUE_SIZE = 16         # 学習待ちのバッチ数の上限
+# DQNAgent (バッチ 32 を1遷移ごと) と同じ量のサンプルを、8倍のバッチで 1/8 の回数だけ学習する
+BATCH_SIZE = 256
+TRAIN_EVERY = 8
+PUBLISH_EVERY = 50      # この回数学習するごとにアクターの重みを更新する
+EVAL_SEED = 42
+
+
+# ---------------------------------------------------------
+# 重みの共有
+# ---------------------------------------------------------
+class SharedWeights:
+    """ラーナーが書き、アクターが読む重み (BatchNorm を畳み込んだ MLP) と ε"""
+
+    def __init__(self, ctx, layout):
+        self.layout = layout  # [(W の形, b の形), ...]
+        size = sum(int(np.prod(w)) + int(np.prod(b)) for w, b in layout)
+        self.buffer = ctx.RawArray('f', size)
+        self.version = ctx.RawValue('i', 0)
+        self.epsilon = ctx.RawValue('d', 1.0)
+        self.lock = ctx.Lock()
+
+    def publish(self, state_dict, epsilon):
+        flat = np.concatenate([a.ravel() for layer in fold_state_dict(state_dict) for a in layer])
+        with self.lock:
+            np.frombuffer(self.buffer, dtype=np.float32)[:] = flat
+            self.epsilon.value = epsilon
+            self.version.value += 1
+
+    def read(self):
+        """(バージョン, 層のリスト, ε)"""
+        with self.lock:
+            flat = np.frombuffer(self.buffer, dtype=np.float32).copy()
+            version, epsilon = self.version.value, self.epsilon.value
+        layers = []
+        pos = 0
+        for w_shape, b_shape in self.layout:
+            w_size, b_size = int(np.prod(w_shape)), int(np.prod(b_shape))
+            w = flat[pos:pos + w_size].reshape(w_shape)
+            b = flat[pos + w_size:pos + w_size + b_size].reshape(b_shape)
+            layers.append((w, b))
+            pos += w_size + b_size
+        return version, layers, epsilon
+
+
+# ---------------------------------------------------------
+# アクター
+# ---------------------------------------------------------
+def _actor(config_path, seed, games_per_rollout, weights, out_queue, stop_event):
+    reward_table = compile_reward_config(load_reward_config(config_path))
+    rng = np.random.default_rng(seed)
+    env = BatchBlackjackEnv(games_per_rollout, seed=rng.integers(2 ** 32))
+    seen = -1
+    policy, epsilon = None, 1.0
+
+    def act(obs, soft):
+        actions = np.argmax(policy.q_values(obs), axis=1)
+        explore = rng.random(len(obs)) < epsilon
+        actions[explore] = rng.integers(0, 2, size=int(explore.sum()))
+        return actions
+
+    while not stop_event.is_set():
+        if weights.version.value != seen:
+            seen, layers, epsilon = weights.read()
+            policy = NumpyPolicy(layers)
+
+        data = rollout(env, act)
+        states, actions, next_states, dones, games = rollout_transitions(data)
+        rewards = batch_rewards(reward_table, env.payoffs, env.player_score)[games]
+        batch = (states.astype(np.int8), actions.astype(np.int8), rewards.astype(np.float32),
+                 next_states.astype(np.int8), dones, games_per_rollout)
+        # ラーナーが止まっていたら抜けられるように、待つときも stop_event を見る
+        while not stop_event.is_set():
+            try:
+                out_queue.put(batch, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+
+# ---------------------------------------------------------
+# ラーナー
+# ---------------------------------------------------------
+def train_actor_learner(config_path, target_personality, num_actors=NUM_ACTORS, num_episodes=50000,
+                        evaluate_every=500, eval_games=10000, games_per_rollout=GAMES_PER_ROLLOUT,
+                        batch_size=BATCH_SIZE, train_every=TRAIN_EVERY, publish_every=PUBLISH_EVERY,
+                        seed=None, save_dir='experiments/blackjack_custom_reward', on_evaluate=None,
+                        converge=False):
+    """num_actors 個のアクタープロセスで経験を集め、このプロセスの DQNAgent で学習する
+
+    on_evaluate / converge は train_and_save と同じ (打ち切ったら performance ログに理由の行を追加する)
+    """
+    import random
+    import torch
+    from rlcard.agents import DQNAgent
+    from replay_buffer import use_ring_memory, feed_batch
+    from evaluation import evaluate_models
+    from convergence import ConvergenceMonitor, policy_actions, min_episode_for
+
+    os.makedirs(save_dir, exist_ok=True)
+    log_path = os.path.join(save_dir, f'performance_{target_personality}.csv')
+
+    seeds = np.random.SeedSequence(seed).spawn(num_actors + 2)
+    torch.manual_seed(int(seeds[0].generate_state(1)[0]))
+    random.seed(int(seeds[1].generate_state(1)[0]))
+
+    agent = DQNAgent(num_actions=2, state_shape=[2], mlp_layers=[128, 128], device=torch.device("cpu"),
+                     batch_size=batch_size, train_every=train_every,
+                     replay_memory_init_size=max(100, batch_size))
+    use_ring_memory(agent)
+
+    def snapshot():
+        return {k: v.detach().cpu().numpy() for k, v in agent.q_estimator.qnet.state_dict().items()}
+
+    def epsilon():
+        return float(agent.epsilons[min(agent.total_t, agent.epsilon_decay_steps - 1)])
+
+    ctx = mp.get_context('spawn')
+    layout = [(w.shape, b.shape) for w, b in fold_state_dict(snapshot())]
+    weights = SharedWeights(ctx, layout)
+    weights.publish(snapshot(), epsilon())
+    out_queue = ctx.Queue(maxsize=QUEUE_SIZE)
+    stop_event = ctx.Event()
+    actors = [ctx.Process(target=_actor, args=(config_path, seeds[2 + i], games_per_rollout, weights,
+                                               out_queue, stop_event), daemon=True)
+              for i in range(num_actors)]
+    for actor in actors:
+        actor.start()
+
+    print(f"Start actor-learner training ({target_personality}) using {config_path} with {num_actors} actors...")
+    monitor = ConvergenceMonitor(min_episode_for(num_episodes)) if converge else None
+    stop = None
+    episode = 0
+    next_eval = 0
+    last_publish = agent.train_t
+    try:
+        while episode < num_episodes:
+            if episode >= next_eval:
+                # train_and_save の tournament と同じく平均払い戻し
+                policy = NumpyPolicy.from_state_dict(snapshot())
+                result = evaluate_models({target_personality: policy}, eval_games, seed=EVAL_SEED)[0]['mean_payoff']
+                print(f'Episode: {episode}, Win Rate: {result:.4f}')
+                with open(log_path, 'a', newline='') as f:
+                    csv.writer(f).writerow([episode, result])
+                next_eval += evaluate_every
+
+                reason = monitor.update(episode, result, policy_actions(policy)) if monitor is not None else None
+                if reason is None and on_evaluate is not None:
+                    reason = on_evaluate(episode, result)
+                    reason = (reason if isinstance(reason, str) else 'stopped early') if reason else None
+                if reason is not None:
+                    stop = (episode, result, reason)
+                    print(f"Stopped early at episode {episode} ({reason})")
+                    break
+
+            states, actions, rewards, next_states, dones, games = out_queue.get()
+            feed_batch(agent, states, actions, rewards, next_states, dones)
+            episode += games
+            if agent.train_t - last_publish >= publish_every:
+                weights.publish(snapshot(), epsilon())
+                last_publish = agent.train_t
+    finally:
+        stop_event.set()
+        # キューが空くまで読み捨てないと、送信途中のアクターが終われない
+        while any(actor.is_alive() for actor in actors):
+            try:
+                out_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in actors:
+            actor.join()
+
+    if stop is not None:
+        with open(log_path, 'a', newline='') as f:
+            csv.writer(f).writerow(list(stop))
+
+    final_save_path = os.path.join(save_dir, f'model_{target_personality}.pth')
+    torch.save(agent.q_estimator.qnet.state_dict(), final_save_path)
+    print(f"\nTraining finished. Model saved to {final_save_path}")
+    return agent
+
+
+def main():
+    from train_all import personality_from_config
+
+    parser = argparse.ArgumentParser(description='複数のアクタープロセスで経験を集めて1つの DQN を学習する')
+    parser.add_argument('config', help='報酬設定 (personality/config_*.csv)')
+    parser.add_argument('--actors', type=int, default=NUM_ACTORS, help='アクタープロセスの数')
+    parser.add_argument('--episodes', type=int, default=50000)
+    parser.add_argument('--eval-games', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--save-dir', default='experiments/blackjack_custom_reward')
+    args = parser.parse_args()
+
+    train_actor_learner(args.config, personality_from_config(args.config), num_actors=args.actors,
+                        num_episodes=args.episodes, eval_games=args.eval_games, seed=args.seed,
+                        save_dir=args.save_dir)
+
+
+if __name__ == '__main__':
+    main()
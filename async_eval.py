@@ -0,0 +1,106 @@
+import csv
+import queue
+import multiprocessing as mp
+
+# ---------------------------------------------------------
+# バックグラウンド評価
+# ---------------------------------------------------------
+# 学習ループは Q-net の重みのスナップショットを渡すだけで、評価と
+# performance_<性格>.csv への書き込みは別プロセスのワーカーが行う。
+
+
+def snapshot_state_dict(qnet):
+    """Q-net の重みを NumPy 配列のコピーとして取り出す (プロセス間で安全に送れる形)"""
+    return {k: v.detach().cpu().numpy().copy() for k, v in qnet.state_dict().items()}
+
+
+def _eval_worker(task_queue, result_queue, log_path, num_games, seed, discard_after):
+    """評価ワーカー: スナップショットを受け取って評価し、1つのバッファ付き writer で記録する
+
+    discard_after (共有の整数) が 0 以上になったら、それより後のエピソードは評価も記録もしない。
+    """
+    import torch
+    from policies import TorchPolicy
+    from evaluation import evaluate_models
+
+    # 学習プロセスの CPU を奪わないように1スレッドで動かす
+    torch.set_num_threads(1)
+    policy = TorchPolicy()
+
+    with open(log_path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            episode, state_dict = task
+            if 0 <= discard_after.value < episode:
+                # 打ち切った後の評価は捨てる (件数を合わせるために結果だけ返す)
+                result_queue.put((episode, None))
+                continue
+            policy.load_state_dict(state_dict)
+            # 毎回同じシードのデッキで評価する (tournament と同じく平均払い戻し)
+            result = evaluate_models({'agent': policy}, num_games, seed=seed)[0]['mean_payoff']
+            # 評価している間に打ち切られていたら記録しない
+            if 0 <= discard_after.value < episode:
+                result_queue.put((episode, None))
+                continue
+            writer.writerow([episode, result])
+            result_queue.put((episode, result))
+            # 待ちのタスクが無いときだけディスクに書き出す
+            if task_queue.empty():
+                f.flush()
+
+
+class AsyncEvaluator:
+    """学習を止めずに評価するためのバックグラウンドワーカー"""
+
+    def __init__(self, log_path, num_games=5000, seed=42):
+        ctx = mp.get_context('spawn')
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.discard_after = ctx.Value('q', -1)
+        self.process = ctx.Process(
+            target=_eval_worker,
+            args=(self.task_queue, self.result_queue, log_path, num_games, seed, self.discard_after),
+            daemon=True,
+        )
+        self.process.start()
+        self.pending = 0
+
+    def submit(self, episode, qnet):
+        """現在の重みで episode 時点の評価を依頼する (すぐに戻る)"""
+        self.task_queue.put((episode, snapshot_state_dict(qnet)))
+        self.pending += 1
+
+    def poll(self):
+        """終わった評価結果 [(episode, result), ...] を待たずに取り出す"""
+        results = []
+        while True:
+            try:
+                results.append(self.result_queue.get_nowait())
+            except queue.Empty:
+                break
+        self.pending -= len(results)
+        return results
+
+    def close(self, discard_after=None):
+        """残りの評価を全て終えてワーカーを止め、未取得の結果を返す
+
+        discard_after を渡すと、それより後のエピソードの評価は行わず、記録も返しもしない
+        (学習を打ち切ったときに、打ち切り位置より後の行をログに残さないため)。
+        """
+        results = []
+        if discard_after is not None:
+            self.discard_after.value = discard_after
+        self.task_queue.put(None)
+        while self.pending > 0:
+            try:
+                results.append(self.result_queue.get(timeout=1.0))
+                self.pending -= 1
+            except queue.Empty:
+                # ワーカーが異常終了していたら待ち続けない
+                if not self.process.is_alive():
+                    break
+        self.process.join()
+        return [(episode, result) for episode, result in results if result is not None]
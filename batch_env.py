@@ -0,0 +1,270 @@
+import numpy as np
+from collections import OrderedDict
+from score_table import CARD_VALUES, CARD_IS_ACE, card_str, hand_score
+
+# 1つの手札に入りうる最大枚数 (無限デッキでAを21枚引いてからバーストしても収まる大きさ)
+MAX_HAND = 24
+
+ACTION_HIT = 0
+ACTION_STAND = 1
+
+
+def make_state(obs):
+    """観測ベクトルから DQNAgent.feed / step に渡せる state 辞書を作る"""
+    return {
+        'obs': obs,
+        'legal_actions': OrderedDict({ACTION_HIT: None, ACTION_STAND: None}),
+        'raw_legal_actions': ['hit', 'stand'],
+    }
+
+
+class BatchBlackjackEnv:
+    """N ゲームのブラックジャックを NumPy 配列でまとめて進める環境
+
+    ルール (配る順番、ディーラーは17以上でスタンド、払い戻し) と観測
+    [プレイヤーのスコア, ディーラーの見えているカードのスコア] は rlcard の
+    blackjack 環境と同じ。num_decks=0 は rlcard と同様に無限デッキを表す。
+    """
+
+    def __init__(self, num_envs, seed=None, num_decks=1):
+        self.num_envs = num_envs
+        self.num_decks = num_decks
+        self.num_actions = 2
+        self.state_shape = [[2]]
+        self.rng = np.random.default_rng(seed)
+
+        self.player_cards = np.full((num_envs, MAX_HAND), -1, dtype=np.int8)
+        self.dealer_cards = np.full((num_envs, MAX_HAND), -1, dtype=np.int8)
+        self.player_count = np.zeros(num_envs, dtype=np.int16)
+        self.dealer_count = np.zeros(num_envs, dtype=np.int16)
+        self.player_raw = np.zeros(num_envs, dtype=np.int16)
+        self.dealer_raw = np.zeros(num_envs, dtype=np.int16)
+        self.player_ace = np.zeros(num_envs, dtype=bool)
+        self.dealer_ace = np.zeros(num_envs, dtype=bool)
+        self.done = np.ones(num_envs, dtype=bool)
+        self.payoffs = np.zeros(num_envs, dtype=np.int8)
+
+        self._deck = None
+        self._deck_pos = np.zeros(num_envs, dtype=np.int16)
+
+    # ---------------------------------------------------------
+    # 内部処理
+    # ---------------------------------------------------------
+    def _shuffle(self):
+        if self.num_decks == 0:
+            self._deck = None
+            return
+        deck_size = 52 * self.num_decks
+        order = np.argsort(self.rng.random((self.num_envs, deck_size)), axis=1)
+        self._deck = (order % 52).astype(np.int8)
+        self._deck_pos[:] = 0
+
+    def _draw(self, idx):
+        if self._deck is None:
+            return self.rng.integers(0, 52, size=len(idx)).astype(np.int8)
+        codes = self._deck[idx, self._deck_pos[idx]]
+        self._deck_pos[idx] += 1
+        return codes
+
+    def _deal_player(self, idx):
+        codes = self._draw(idx)
+        self.player_cards[idx, self.player_count[idx]] = codes
+        self.player_count[idx] += 1
+        self.player_raw[idx] += CARD_VALUES[codes]
+        self.player_ace[idx] |= CARD_IS_ACE[codes]
+
+    def _deal_dealer(self, idx):
+        codes = self._draw(idx)
+        self.dealer_cards[idx, self.dealer_count[idx]] = codes
+        self.dealer_count[idx] += 1
+        self.dealer_raw[idx] += CARD_VALUES[codes]
+        self.dealer_ace[idx] |= CARD_IS_ACE[codes]
+
+    def _finish(self, idx):
+        # ディーラーは17以上になるまで引く (プレイヤーがバーストしていても rlcard と同様に引く)
+        pending = idx
+        while len(pending) > 0:
+            d_score = hand_score(self.dealer_raw[pending], self.dealer_ace[pending])
+            pending = pending[d_score < 17]
+            if len(pending) > 0:
+                self._deal_dealer(pending)
+
+        p_score = self.player_score[idx]
+        d_score = self.dealer_score[idx]
+        payoff = np.where(p_score > d_score, 1, np.where(p_score < d_score, -1, 0))
+        payoff = np.where(d_score > 21, 1, payoff)
+        payoff = np.where(p_score > 21, -1, payoff)
+        self.payoffs[idx] = payoff
+        self.done[idx] = True
+
+    # ---------------------------------------------------------
+    # 公開API (rlcard の Env に合わせた名前)
+    # ---------------------------------------------------------
+    @property
+    def player_score(self):
+        return hand_score(self.player_raw, self.player_ace)
+
+    @property
+    def dealer_score(self):
+        return hand_score(self.dealer_raw, self.dealer_ace)
+
+    @property
+    def player_soft(self):
+        """プレイヤーの手札がソフト (Aを11として数えている) かどうか"""
+        return self.player_ace & (self.player_raw <= 11)
+
+    @property
+    def dealer_up(self):
+        """ディーラーの見えているカードの点数 (Aは11)"""
+        up = CARD_VALUES[self.dealer_cards[:, 1]]
+        return np.where(up == 1, 11, up)
+
+    @property
+    def active(self):
+        """まだ終わっていないゲームのインデックス"""
+        return np.flatnonzero(~self.done)
+
+    def get_obs(self):
+        # 対戦中はディーラーの2枚目だけが見える / 終了後は全カードのスコア (rlcard と同じ)
+        dealer = np.where(self.done, self.dealer_score, self.dealer_up)
+        return np.stack([self.player_score, dealer], axis=1).astype(np.int64)
+
+    def reset(self):
+        self._shuffle()
+        self.player_cards[:] = -1
+        self.dealer_cards[:] = -1
+        self.player_count[:] = 0
+        self.dealer_count[:] = 0
+        self.player_raw[:] = 0
+        self.dealer_raw[:] = 0
+        self.player_ace[:] = False
+        self.dealer_ace[:] = False
+        self.payoffs[:] = 0
+        self.done[:] = False
+
+        # rlcard と同じく プレイヤー -> ディーラー -> プレイヤー -> ディーラー の順に配る
+        idx = np.arange(self.num_envs)
+        for _ in range(2):
+            self._deal_player(idx)
+            self._deal_dealer(idx)
+        return self.get_obs()
+
+    def step(self, actions):
+        """全ゲームに行動 (0: Hit, 1: Stand) を適用する。終了済みのゲームは無視される"""
+        actions = np.asarray(actions)
+        live = ~self.done
+        hit = np.flatnonzero(live & (actions == ACTION_HIT))
+        stand = np.flatnonzero(live & (actions != ACTION_HIT))
+
+        if len(hit) > 0:
+            self._deal_player(hit)
+            bust = hit[self.player_score[hit] > 21]
+        else:
+            bust = hit
+        finishing = np.concatenate([stand, bust])
+        if len(finishing) > 0:
+            self._finish(finishing)
+        return self.get_obs(), self.done.copy()
+
+    def is_over(self):
+        return bool(self.done.all())
+
+    def get_payoffs(self):
+        return self.payoffs.astype(np.int64)
+
+    def player_hand(self, i):
+        """ゲーム i のプレイヤーの手札 (rlcard 形式の文字列リスト)"""
+        return [card_str(c) for c in self.player_cards[i, :self.player_count[i]]]
+
+    def dealer_hand(self, i):
+        """ゲーム i のディーラーの手札 (対戦中は rlcard と同じく1枚目を伏せる)"""
+        cards = [card_str(c) for c in self.dealer_cards[i, :self.dealer_count[i]]]
+        return cards if self.done[i] else cards[1:]
+
+
+# ---------------------------------------------------------
+# エージェントとの接続
+# ---------------------------------------------------------
+def greedy_actions(q_fn, obs):
+    """Q値関数 (obs のバッチ -> (N, 2)) で貪欲に行動を選ぶ"""
+    return np.argmax(q_fn(obs), axis=1)
+
+
+def epsilon_greedy_actions(agent, obs, rng):
+    """DQNAgent.step と同じ ε スケジュールでバッチの行動を選ぶ"""
+    epsilon = agent.epsilons[min(agent.total_t, agent.epsilon_decay_steps - 1)]
+    actions = greedy_actions(agent.q_estimator.predict_nograd, obs)
+    explore = rng.random(len(obs)) < epsilon
+    actions[explore] = rng.integers(0, agent.num_actions, size=int(explore.sum()))
+    return actions
+
+
+def rollout(env, act_fn):
+    """全ゲームを最後まで進め、各ステップの観測・行動を配列で返す
+
+    act_fn は (稼働中ゲームの観測, ソフトフラグ) -> 行動配列 を返す関数。
+    返り値の obs / soft / actions / valid は (ステップ数, N) 方向に並ぶ。
+    """
+    obs = env.reset()
+    obs_steps, soft_steps, action_steps, valid_steps = [], [], [], []
+    while not env.is_over():
+        active = env.active
+        soft = env.player_soft
+        actions = np.full(env.num_envs, ACTION_STAND, dtype=np.int8)
+        actions[active] = act_fn(obs[active], soft[active])
+        valid = ~env.done
+        obs_steps.append(obs)
+        soft_steps.append(soft)
+        action_steps.append(actions)
+        valid_steps.append(valid)
+        obs, _ = env.step(actions)
+    return {
+        'obs': np.stack(obs_steps),
+        'soft': np.stack(soft_steps),
+        'actions': np.stack(action_steps),
+        'valid': np.stack(valid_steps),
+        'final_obs': obs,
+        'payoffs': env.get_payoffs(),
+    }
+
+
+def rollout_transitions(data):
+    """rollout の結果を、ゲームごとに古い順に並べた遷移の配列にする
+
+    Returns:
+        tuple: (states, actions, next_states, dones, game_index)
+    """
+    valid = data['valid']
+    # 次の状態は1つ後のステップの観測 (最後のステップの後は終了時の観測)
+    next_obs = np.concatenate([data['obs'][1:], data['final_obs'][None]])
+    next_valid = np.zeros_like(valid)
+    next_valid[:-1] = valid[1:]
+    # (ゲーム, ステップ) の順に取り出して、エピソードごとに遷移が並ぶようにする
+    games, steps = np.nonzero(valid.T)
+    return (data['obs'][steps, games], data['actions'][steps, games], next_obs[steps, games],
+            ~next_valid[steps, games], games)
+
+
+def play_games(env, act_fn):
+    """記録を取らずに全ゲームを最後まで進め、払い戻しを返す"""
+    obs = env.reset()
+    while not env.is_over():
+        active = env.active
+        actions = np.full(env.num_envs, ACTION_STAND, dtype=np.int8)
+        actions[active] = act_fn(obs[active], env.player_soft[active])
+        obs, _ = env.step(actions)
+    return env.get_payoffs()
+
+
+def batch_tournament(agent, num_games, batch_size=65536, seed=None):
+    """rlcard.utils.tournament のバッチ版 (平均払い戻しを返す)"""
+    q_fn = agent.q_estimator.predict_nograd
+    env = BatchBlackjackEnv(min(batch_size, num_games), seed=seed)
+    total = 0
+    played = 0
+    while played < num_games:
+        n = min(env.num_envs, num_games - played)
+        payoffs = play_games(env, lambda obs, soft: greedy_actions(q_fn, obs))
+        total += int(payoffs[:n].sum())
+        played += n
+    return total / played
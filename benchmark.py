@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+import numpy as np
+
+# ---------------------------------------------------------
+# ベンチマーク
+# ---------------------------------------------------------
+# シミュレーション・学習・評価・描画の処理速度を測る。
+# 各項目は毎回同じシードから始め、REPEAT 回測って一番速い値を使う。
+# 結果は JSON で保存でき、--baseline で前回の結果と比較できる。
+#
+# 使い方:
+#   python benchmark.py --output bench.json
+#   python benchmark.py --baseline bench.json
+
+SEED = 42
+REPEAT = 3
+CONFIG_PATH = 'personality/config_normal.csv'
+
+# 各項目の仕事量 (--quick では 1/QUICK_FACTOR にする)
+WORK = {
+    'score_reward': 200000,    # get_score + calculate_custom_reward の呼び出し回数
+    'single_env': 5000,        # rlcard 環境で遊ぶハンド数
+    'train': 2000,             # train_and_save のエピソード数
+    'evaluate': 500000,        # evaluate_models のゲーム数
+    'policy_table': 500,       # extract_policy の回数
+    'replay_frame': 500,       # create_frame の回数
+}
+QUICK_FACTOR = 10
+
+# 比較でこれ以上遅くなったら遅くなったと表示する (割合)
+TOLERANCE = 0.10
+
+
+def seed_everything(seed):
+    import torch
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+@contextlib.contextmanager
+def quiet():
+    """学習ログなどの出力を捨てる"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _random_hands(n, rng):
+    """ランダムな手札 (2〜5枚) と払い戻しを作る"""
+    from score_table import card_str
+    hands = []
+    for _ in range(n):
+        size = int(rng.integers(2, 6))
+        hands.append([card_str(c) for c in rng.choice(52, size=size, replace=False)])
+    payoffs = rng.integers(-1, 2, size=n).tolist()
+    return hands, payoffs
+
+
+def _random_policy():
+    """シード固定の未学習 Q-net (中身に関係なく推論の速さだけを測る)"""
+    from policies import TorchPolicy
+    return TorchPolicy()
+
+
+# ---------------------------------------------------------
+# 各ベンチマーク (仕事量 n を受け取り、(処理数, 単位, 秒数) を返す)
+# ---------------------------------------------------------
+def bench_score_reward(n):
+    from blackjack_utils import load_reward_config, get_score
+    from custom_reward import calculate_custom_reward
+    with quiet():
+        reward_config = load_reward_config(CONFIG_PATH)
+    hands, payoffs = _random_hands(n, np.random.default_rng(SEED))
+    states = [{'raw_obs': {'player0 hand': hand}} for hand in hands]
+
+    start = time.perf_counter()
+    for hand, payoff, state in zip(hands, payoffs, states):
+        get_score(hand)
+        calculate_custom_reward(payoff, state, reward_config)
+    return n, 'calls/s', time.perf_counter() - start
+
+
+def bench_single_env(n):
+    import rlcard
+    env = rlcard.make('blackjack', config={'seed': SEED})
+
+    start = time.perf_counter()
+    for _ in range(n):
+        state, player_id = env.reset()
+        while not env.is_over():
+            # 17 未満なら Hit (環境そのものの速さを測るので方策は固定)
+            action = 0 if state['obs'][0] < 17 else 1
+            state, player_id = env.step(action)
+        env.get_payoffs()
+    return n, 'hands/s', time.perf_counter() - start
+
+
+def bench_train(n):
+    from train_and_save import train_and_save
+    with tempfile.TemporaryDirectory() as save_dir, quiet():
+        start = time.perf_counter()
+        train_and_save(CONFIG_PATH, 'benchmark', num_episodes=n, evaluate_every=n, save_dir=save_dir)
+        elapsed = time.perf_counter() - start
+    return n, 'episodes/s', elapsed
+
+
+def bench_evaluate(n):
+    from evaluation import evaluate_models
+    policy = _random_policy()
+
+    start = time.perf_counter()
+    evaluate_models({'benchmark': policy}, n, seed=SEED)
+    return n, 'games/s', time.perf_counter() - start
+
+
+def bench_policy_table(n):
+    from policy_table import extract_policy
+    policy = _random_policy()
+
+    start = time.perf_counter()
+    for _ in range(n):
+        extract_policy(policy)
+    return n, 'tables/s', time.perf_counter() - start
+
+
+def bench_replay_frame(n):
+    import replay_gif
+    from replay_gif import create_frame
+    from score_table import card_str
+    dealer_hand = ['CT', 'BACK']
+    # 繰り返しの2回目以降が前回のフレームのキャッシュに当たらないよう、毎回空にする
+    # (カードのスプライトのキャッシュは残すので、測るのは毎フレームの合成)
+    if replay_gif._renderer is not None:
+        replay_gif._renderer.frames.clear()
+
+    start = time.perf_counter()
+    for i in range(n):
+        # 毎回違う手札にして、同じフレームの使い回しではなく描画の速さを測る
+        player_hand = [card_str(i % 52), card_str(i // 52 % 52), card_str(5)]
+        action_text = 'Hit' if i % 2 == 0 else None
+        result_text = None if i % 2 == 0 else 'WIN 🏆'
+        create_frame(player_hand, dealer_hand, action_text, result_text, 21, 'benchmark')
+    return n, 'frames/s', time.perf_counter() - start
+
+
+BENCHMARKS = {
+    'score_reward': bench_score_reward,
+    'single_env': bench_single_env,
+    'train': bench_train,
+    'evaluate': bench_evaluate,
+    'policy_table': bench_policy_table,
+    'replay_frame': bench_replay_frame,
+}
+
+
+def run_benchmark(name, quick=False, repeat=REPEAT):
+    """同じシードで repeat 回測り、一番速かった回の結果を返す"""
+    n = WORK[name] // QUICK_FACTOR if quick else WORK[name]
+    n = max(n, 1)
+    best = None
+    for _ in range(repeat):
+        seed_everything(SEED)
+        count, unit, seconds = BENCHMARKS[name](n)
+        if best is None or seconds < best['seconds']:
+            best = {'value': count / seconds, 'unit': unit, 'seconds': seconds, 'work': count}
+    return best
+
+
+def machine_info():
+    import torch
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """前回の結果との比較表と、遅くなった項目の一覧を返す"""
+    lines = [f"{'benchmark':<14}{'baseline':>14}{'current':>14}{'change':>10}"]
+    slower = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            lines.append(f"{name:<14}{'-':>14}{result['value']:>14.1f}{'new':>10}")
+            continue
+        change = result['value'] / base['value'] - 1.0
+        mark = ''
+        if change < -tolerance:
+            mark = '  slower'
+            slower.append(name)
+        elif change > tolerance:
+            mark = '  faster'
+        lines.append(f"{name:<14}{base['value']:>14.1f}{result['value']:>14.1f}{change:>+10.1%}{mark}")
+    return '\n'.join(lines), slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='シミュレーション・学習・評価・描画の速度を測る')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help='実行するベンチマーク')
+    parser.add_argument('--quick', action='store_true', help=f'仕事量を 1/{QUICK_FACTOR} にする')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='各項目を測る回数 (最速値を使う)')
+    parser.add_argument('--output', help='結果を保存する JSON ファイル')
+    parser.add_argument('--baseline', help='比較する前回の結果 (JSON)')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='これ以上遅くなったら終了コード 1 にする割合')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only:
+        print(f"Running {name}...", flush=True)
+        results[name] = run_benchmark(name, quick=args.quick, repeat=args.repeat)
+        r = results[name]
+        print(f"  {r['value']:.1f} {r['unit']} ({r['work']} in {r['seconds']:.3f}s)")
+
+    report = {
+        'seed': SEED,
+        'quick': args.quick,
+        'repeat': args.repeat,
+        'machine': machine_info(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nSaved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('quick') != args.quick:
+            print("\nWarning: baseline was measured with a different --quick setting")
+        table, slower = compare(results, baseline, args.tolerance)
+        print('\n' + table)
+        if slower:
+            print(f"\nSlower than baseline: {', '.join(slower)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
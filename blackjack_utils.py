@@ -43,6 +43,21 @@ def get_score(hand):
         aces -= 1
     return score
 
+def is_soft_hand(hand):
+    # Aを11として数えている (もう1枚引いてもバーストしない) ならソフトハンド
+    raw_sum = 0
+    has_ace = False
+    for card in hand:
+        rank = card[1:]
+        if rank == 'A':
+            has_ace = True
+            raw_sum += 1
+        elif rank in ['T', 'J', 'Q', 'K']:
+            raw_sum += 10
+        else:
+            raw_sum += int(rank)
+    return has_ace and raw_sum <= 11
+
 def decode_card(card_str):
     suit_map = {'S': '♠', 'H': '♥', 'D': '♦', 'C': '♣'}
     suit = suit_map.get(card_str[0], card_str[0])
@@ -0,0 +1,196 @@
+import numpy as np
+from PIL import Image
+
+# --- GUIエラー回避用設定 ---
+import matplotlib
+matplotlib.use('Agg') # 画面表示せず描画するモード
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+
+# ---------------------------------------------------------
+# スプライトをキャッシュするリプレイ描画
+# ---------------------------------------------------------
+# カード・裏面・文字の部品は最初に1回だけ matplotlib で描いて透明な PIL 画像 (スプライト) にし、
+# 以降のフレームはテーブルの背景に貼り合わせるだけで作る。
+# 部品は元の create_frame と同じ図 (6x6 インチ, 0〜6 の座標) の上で描くので、位置と見た目は変わらない。
+
+FIG_SIZE = 6
+DPI = 100
+TABLE_COLOR = '#006400' # カジノっぽい緑色の背景
+CARD_WIDTH = 0.8
+CARD_HEIGHT = 1.2
+
+# カードを並べる位置 (座標)
+CARD_X = 1.5
+CARD_STEP = 1.0
+DEALER_Y = 3.5
+PLAYER_Y = 0.5
+
+# 同じフレームを使い回すために覚えておく枚数
+FRAME_CACHE_SIZE = 64
+
+
+def draw_card(ax, x, y, card_str):
+    """カード1枚を描画する関数"""
+    # カードの枠
+    rect = patches.Rectangle((x, y), CARD_WIDTH, CARD_HEIGHT, linewidth=1, edgecolor='black', facecolor='white', zorder=2)
+    ax.add_patch(rect)
+
+    # スートと数字の変換
+    if card_str == 'BACK':
+        # 裏面
+        pattern = patches.Rectangle((x+0.1, y+0.1), 0.6, 1.0, facecolor='firebrick', zorder=3)
+        ax.add_patch(pattern)
+        return
+
+    suit_map = {'S': '♠', 'H': '♥', 'D': '♦', 'C': '♣'}
+    color_map = {'S': 'black', 'H': 'red', 'D': 'red', 'C': 'black'}
+
+    suit_char = card_str[0]
+    rank_char = card_str[1:]
+
+    suit = suit_map.get(suit_char, suit_char)
+    color = color_map.get(suit_char, 'black')
+
+    # 中央の文字
+    ax.text(x + 0.4, y + 0.6, f"{rank_char}\n{suit}", fontsize=15,
+            ha='center', va='center', color=color, zorder=4)
+    # 左上の文字
+    ax.text(x + 0.1, y + 1.0, rank_char, fontsize=8, color=color, zorder=4)
+
+
+def result_text(payoff):
+    return "WIN 🏆" if payoff > 0 else ("LOSE 💀" if payoff < 0 else "DRAW 🤝")
+
+
+class CardRenderer:
+    """盤面の画像を作る (部品のスプライトとフレームをキャッシュする)"""
+
+    def __init__(self, table_color=TABLE_COLOR):
+        self.fig, self.ax = plt.subplots(figsize=(FIG_SIZE, FIG_SIZE), dpi=DPI)
+        self.fig.patch.set_alpha(0)
+        self.ax.set_xlim(0, FIG_SIZE)
+        self.ax.set_ylim(0, FIG_SIZE)
+        self.ax.axis('off') # 軸を消す
+
+        self.size = (FIG_SIZE * DPI, FIG_SIZE * DPI)
+        self.background = Image.new('RGBA', self.size, table_color)
+        # カード1枚分の横方向のずれ (ピクセル) と、カードが切れる右端 (軸の範囲外は描かれない)
+        x0, _ = self._to_pixel(0, 0)
+        x1, _ = self._to_pixel(CARD_STEP, 0)
+        self.card_step_px = x1 - x0
+        self.clip_right = int(round(self._to_pixel(FIG_SIZE, 0)[0]))
+
+        self.sprites = {}
+        self.frames = {}
+
+    def _to_pixel(self, x, y):
+        """データ座標 -> 画像のピクセル座標 (左上原点)"""
+        px, py = self.ax.transData.transform((x, y))
+        return px, self.size[1] - py
+
+    def _render_sprite(self, draw):
+        """draw(ax) で描いたものを、透明な部分を切り落とした (左上位置, 画像) にする"""
+        before = set(self.ax.get_children())
+        draw(self.ax)
+        self.fig.canvas.draw()
+        image = np.asarray(self.fig.canvas.buffer_rgba()).copy()
+        for artist in set(self.ax.get_children()) - before:
+            artist.remove()
+
+        rows = np.flatnonzero(image[..., 3].any(axis=1))
+        cols = np.flatnonzero(image[..., 3].any(axis=0))
+        if len(rows) == 0:
+            return (0, 0), None
+        top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        return (int(left), int(top)), Image.fromarray(image[top:bottom, left:right])
+
+    def sprite(self, key, draw):
+        if key not in self.sprites:
+            self.sprites[key] = self._render_sprite(draw)
+        return self.sprites[key]
+
+    def card_sprite(self, card, y):
+        """1枚目の位置に描いたカード (2枚目以降は横にずらして貼る)"""
+        return self.sprite(('card', card, y), lambda ax: draw_card(ax, CARD_X, y, card))
+
+    def text_sprite(self, x, y, text, **kwargs):
+        key = ('text', x, y, text, tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+        return self.sprite(key, lambda ax: ax.text(x, y, text, **kwargs))
+
+    def _paste(self, frame, sprite, dx=0, clip=False):
+        (left, top), image = sprite
+        if image is None:
+            return
+        left += dx
+        if clip and left + image.width > self.clip_right:
+            # matplotlib と同じく軸の右端からはみ出した部分は描かない
+            if left >= self.clip_right:
+                return
+            image = image.crop((0, 0, self.clip_right - left, image.height))
+        frame.alpha_composite(image, (left, top))
+
+    def _paste_hand(self, frame, hand, y):
+        for i, card in enumerate(hand):
+            self._paste(frame, self.card_sprite(card, y), int(round(i * self.card_step_px)), clip=True)
+
+    def _compose(self, player_hand, dealer_hand, action_text, result_text, score, personality):
+        frame = self.background.copy()
+
+        # タイトル
+        self._paste(frame, self.text_sprite(3, 5.5, f"Agent: {personality}", fontsize=16, ha='center', color='white', fontweight='bold'))
+
+        # --- ディーラーの描画 (上段) ---
+        self._paste(frame, self.text_sprite(0.5, 4.5, "Dealer", fontsize=12, color='white'))
+        self._paste_hand(frame, dealer_hand, DEALER_Y)
+
+        # --- プレイヤーの描画 (下段) ---
+        self._paste(frame, self.text_sprite(0.5, 1.5, f"Player\nScore: {score}", fontsize=12, color='white'))
+        self._paste_hand(frame, player_hand, PLAYER_Y)
+
+        # --- アクション/結果の表示 ---
+        if result_text:
+            # 結果が出ている場合
+            box_color = 'gold' if "WIN" in result_text else 'gray'
+            self._paste(frame, self.text_sprite(3, 2.5, result_text, fontsize=24, color='blue', ha='center',
+                                                bbox=dict(facecolor=box_color, alpha=0.8)))
+        elif action_text:
+            # 行動中の場合
+            self._paste(frame, self.text_sprite(3, 2.5, f"Action: {action_text}", fontsize=18, color='yellow', ha='center', fontweight='bold'))
+        return frame
+
+    def render(self, player_hand, dealer_hand, action_text, result_text, score, personality):
+        """現在の盤面を画像として生成する (replay_gif.create_frame と同じ引数)
+
+        同じ盤面なら前に作った Image オブジェクトをそのまま返す。
+        """
+        key = (tuple(player_hand), tuple(dealer_hand), action_text, result_text, score, personality)
+        frame = self.frames.get(key)
+        if frame is None:
+            if len(self.frames) >= FRAME_CACHE_SIZE:
+                self.frames.pop(next(iter(self.frames)))
+            frame = self.frames[key] = self._compose(player_hand, dealer_hand, action_text, result_text, score, personality)
+        return frame
+
+    def close(self):
+        plt.close(self.fig)
+
+
+def merge_frames(frames, duration):
+    """連続する同じフレームを1枚にまとめ、表示時間を足し合わせる"""
+    merged = []
+    durations = []
+    for frame in frames:
+        if merged and frame is merged[-1]:
+            durations[-1] += duration
+        else:
+            merged.append(frame)
+            durations.append(duration)
+    return merged, durations
+
+
+def save_gif(path, frames, duration=800):
+    """フレームを GIF で保存する (同じフレームは再エンコードしない)"""
+    merged, durations = merge_frames(frames, duration)
+    merged[0].save(path, save_all=True, append_images=merged[1:], optimize=False,
+                   duration=durations if len(durations) > 1 else durations[0], loop=0)
@@ -0,0 +1,84 @@
+import os
+import csv
+import random
+import numpy as np
+import torch
+
+# ---------------------------------------------------------
+# 学習の途中保存と再開
+# ---------------------------------------------------------
+# DQNAgent の Q-net / ターゲットネット / オプティマイザ / リプレイメモリ / ステップ数 (εの位置)、
+# 乱数の状態 (python, numpy, torch, 環境) とエピソード番号をまとめて保存する。
+# 読み込めば中断しなかった場合と同じ乱数列で学習を続けられる。
+
+
+def _memory_state(memory):
+    # replay_buffer.RingMemory は配列のまま、rlcard の Memory は Transition のリストで保存する
+    if hasattr(memory, 'state_dict'):
+        return memory.state_dict()
+    return list(memory.memory)
+
+
+def _load_memory(memory, saved):
+    if isinstance(saved, dict):
+        memory.load_state_dict(saved)
+    elif hasattr(memory, 'load_transitions'):
+        memory.load_transitions(saved)
+    else:
+        memory.memory = list(saved)
+
+
+def save_checkpoint(path, agent, env, eval_env, episode):
+    """episode = 次に実行するエピソード番号"""
+    state = {
+        'episode': episode,
+        'q_net': agent.q_estimator.qnet.state_dict(),
+        'q_optimizer': agent.q_estimator.optimizer.state_dict(),
+        'target_net': agent.target_estimator.qnet.state_dict(),
+        'target_optimizer': agent.target_estimator.optimizer.state_dict(),
+        'memory': _memory_state(agent.memory),
+        'total_t': agent.total_t,
+        'train_t': agent.train_t,
+        'rng': {
+            'python': random.getstate(),
+            'numpy': np.random.get_state(),
+            'torch': torch.get_rng_state(),
+            'env': env.np_random.get_state(),
+            'eval_env': eval_env.np_random.get_state(),
+        },
+    }
+    # 書き込み途中で落ちても前のチェックポイントが壊れないように、一時ファイルから置き換える
+    tmp_path = path + '.tmp'
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, agent, env, eval_env):
+    """チェックポイントを agent / env に復元し、次に実行するエピソード番号を返す"""
+    state = torch.load(path, weights_only=False)
+
+    agent.q_estimator.qnet.load_state_dict(state['q_net'])
+    agent.q_estimator.optimizer.load_state_dict(state['q_optimizer'])
+    agent.target_estimator.qnet.load_state_dict(state['target_net'])
+    agent.target_estimator.optimizer.load_state_dict(state['target_optimizer'])
+    _load_memory(agent.memory, state['memory'])
+    agent.total_t = state['total_t']
+    agent.train_t = state['train_t']
+
+    rng = state['rng']
+    random.setstate(rng['python'])
+    np.random.set_state(rng['numpy'])
+    torch.set_rng_state(rng['torch'])
+    env.np_random.set_state(rng['env'])
+    eval_env.np_random.set_state(rng['eval_env'])
+    return state['episode']
+
+
+def truncate_log(log_path, episode):
+    """再開位置以降に書かれた評価行を performance ログから取り除く (二重記録を防ぐ)"""
+    if not os.path.exists(log_path):
+        return
+    with open(log_path, 'r', newline='') as f:
+        rows = [row for row in csv.reader(f) if row and int(row[0]) < episode]
+    with open(log_path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
@@ -0,0 +1,48 @@
+import sys
+import argparse
+import importlib
+
+# ---------------------------------------------------------
+# まとめたコマンドライン
+# ---------------------------------------------------------
+# サブコマンドのモジュールは選ばれたときに初めて import するので、
+# 使い方の表示や軽いコマンドは rlcard / torch / matplotlib を読み込まずにすぐ動く。
+# 各サブコマンドの引数はそれぞれのモジュールの main(argv, prog) が解釈する。
+#
+# 使い方:
+#   python cli.py train personality/config_normal.csv --episodes 20000
+#   python cli.py train-all --workers 3
+#   python cli.py eval --games 50000 --seed 0
+#   python cli.py plot --result-dir result
+#   python cli.py replay-text --games 10
+#   python cli.py replay-gif
+#   python cli.py dashboard --interval 10
+#   python cli.py <サブコマンド> --help
+
+# サブコマンド -> (モジュール, 説明)
+COMMANDS = {
+    'train': ('train_and_save', '1つの報酬設定で DQN を学習する'),
+    'train-all': ('train_all', 'personality フォルダの全設定で学習する'),
+    'eval': ('show_result', '学習済みモデルを同じデッキで対戦させて勝率を比べる'),
+    'plot': ('plot', '戦略表をヒートマップの画像にする'),
+    'replay-text': ('replay_text', 'ゲームをテキストのログに書き出す'),
+    'replay-gif': ('replay_gif', 'ゲームを GIF アニメにする'),
+    'dashboard': ('dashboard', '学習中の曲線を追いかけてレポートを更新する'),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    epilog = 'サブコマンド:\n' + '\n'.join(f'  {name:<12} {desc}' for name, (_, desc) in COMMANDS.items())
+    parser = argparse.ArgumentParser(prog='cli.py', description='ブラックジャックの性格別 AI の学習・評価・可視化',
+                                     epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=COMMANDS, metavar='command', help='実行するサブコマンド')
+    # サブコマンド名だけをここで解釈し、残りはそのモジュールに渡す (--help もサブコマンドのものを表示する)
+    args = parser.parse_args(argv[:1])
+
+    module = importlib.import_module(COMMANDS[args.command][0])
+    module.main(argv[1:], prog=f'{parser.prog} {args.command}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import numpy as np
+from policy_table import extract_policy
+
+# ---------------------------------------------------------
+# 収束の判定
+# ---------------------------------------------------------
+# 評価のたびに (エピソード, 評価結果, 戦略表) を渡し、次のどちらかを満たしたら学習を止める理由を返す。
+#   1. Hit/Stand の戦略表が POLICY_PATIENCE 回続けて変わらない
+#   2. 評価結果の直近 PLATEAU_WINDOW 回を前半と後半に分けたとき、後半の伸びの信頼区間の上限が
+#      MIN_IMPROVEMENT 未満 (これ以上良くなっているとは言えない)
+# 評価のゲーム数が少ないと 2. の信頼区間が広くなり、ほとんど成立しない (その場合は 1. で止まる)。
+
+POLICY_PATIENCE = 10
+PLATEAU_WINDOW = 20
+MIN_IMPROVEMENT = 0.01
+Z_SCORE = 1.96
+# 学習の最初のこの割合は止めない
+MIN_FRACTION = 0.1
+
+
+class _AgentPolicy:
+    """DQNAgent の Q-net を extract_policy に渡すための薄いラッパー"""
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def q_values(self, obs, soft=None):
+        return self.agent.q_estimator.predict_nograd(np.asarray(obs))
+
+
+def policy_actions(policy):
+    """戦略表の行動 (Hard と Soft を並べた配列)。DQNAgent はそのまま渡せる"""
+    if not hasattr(policy, 'q_values'):
+        policy = _AgentPolicy(policy)
+    table = extract_policy(policy)
+    return np.concatenate([table['hard'].ravel(), table['soft'].ravel()])
+
+
+class ConvergenceMonitor:
+    """戦略表の安定と評価結果の頭打ちで収束を判定する"""
+
+    def __init__(self, min_episode=0, policy_patience=POLICY_PATIENCE, plateau_window=PLATEAU_WINDOW,
+                 min_improvement=MIN_IMPROVEMENT, z_score=Z_SCORE):
+        self.min_episode = min_episode
+        self.policy_patience = policy_patience
+        self.plateau_window = plateau_window
+        self.min_improvement = min_improvement
+        self.z_score = z_score
+        self.results = []
+        self.last_actions = None
+        self.stable_count = 0
+
+    def _policy_reason(self, actions):
+        if self.last_actions is not None and np.array_equal(actions, self.last_actions):
+            self.stable_count += 1
+        else:
+            self.stable_count = 0
+        self.last_actions = actions
+        if self.policy_patience and self.stable_count >= self.policy_patience:
+            return f'converged: policy table unchanged for {self.stable_count} evaluations'
+        return None
+
+    def _plateau_reason(self):
+        if not self.plateau_window or len(self.results) < self.plateau_window:
+            return None
+        recent = np.array(self.results[-self.plateau_window:])
+        half = self.plateau_window // 2
+        before, after = recent[:half], recent[half:]
+        improvement = after.mean() - before.mean()
+        se = np.sqrt(before.var(ddof=1) / len(before) + after.var(ddof=1) / len(after))
+        if improvement + self.z_score * se < self.min_improvement:
+            return (f'converged: win rate plateau at {after.mean():.4f} '
+                    f'(change {improvement:+.4f} ± {self.z_score * se:.4f})')
+        return None
+
+    def update(self, episode, result, actions):
+        """評価1回分を記録し、止めるべきならその理由 (文字列) を、そうでなければ None を返す
+
+        actions は policy_actions() で求めた戦略表の行動。
+        """
+        self.results.append(result)
+        policy_reason = self._policy_reason(actions)
+        if episode < self.min_episode:
+            return None
+        return policy_reason or self._plateau_reason()
+
+
+def min_episode_for(num_episodes):
+    return int(num_episodes * MIN_FRACTION)
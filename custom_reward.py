@@ -7,10 +7,12 @@ def calculate_custom_reward(payoff, state,reward_config):
     if hand is None: return payoff
 
     score = get_score(hand)
-    
+    return reward_from_score(payoff, score, reward_config)
+
+def reward_from_score(payoff, score, reward_config):
+    # 報酬は (払い戻し, 最終スコア) だけで決まる
     # 辞書から値を取得（なければデフォルト値）
-    def get_val(key, default):
-        return reward_config.get(key, default)
+    get_val = reward_config.get
 
     # === 勝った場合 ===
     if payoff > 0:
@@ -0,0 +1,385 @@
+import os
+import csv
+import html
+import time
+import argparse
+import numpy as np
+from stat_eval import z_value
+
+# ---------------------------------------------------------
+# 学習曲線のライブ表示
+# ---------------------------------------------------------
+# root 以下の performance_<性格>.csv (seeds/ や sweep のサブフォルダも含む) を追いかけて読み、
+# 性格ごとに全ての学習の曲線 (移動平均と信頼区間) を1枚の PNG と HTML のレポートにまとめて定期的に書き直す。
+#   - 各ファイルは前回読んだ位置から増えた分だけ読む (書きかけの最後の行は次回に回す)
+#   - ファイルが短くなったり置き換わったりしたら (--resume の truncate_log など) 最初から読み直す
+#   - 評価の記録は最大 MAX_POINTS 個のバケツに入れ、あふれたら隣どうしをまとめる。
+#     バケツは個数・和・2乗和を持つので、間引いた後も移動平均と信頼区間を計算できる
+#   - 何も増えていなければ描き直さない
+# profile_<性格>.csv (train_and_save --profile) があれば学習時間と速度も表に載せる。
+#
+# 使い方:
+#   python dashboard.py --root experiments/blackjack_custom_reward --interval 10
+#   python cli.py dashboard --once
+
+ROOT = 'experiments/blackjack_custom_reward'
+OUT_DIR = 'result'
+INTERVAL = 10.0     # レポートを書き直す間隔 (秒)
+WINDOW = 10         # 移動平均をとる評価の回数
+MAX_POINTS = 512    # 1つの学習で覚えておく点の数 (描画の点数の上限)
+CONFIDENCE = 0.95
+MAX_BANDS = 8       # 1つのグラフの学習がこれ以下なら信頼区間の帯も描く
+
+
+# ---------------------------------------------------------
+# 間引きながら貯める評価の記録
+# ---------------------------------------------------------
+class BucketSeries:
+    """評価 (エピソード, 結果) を最大 max_points 個のバケツにまとめて持つ
+
+    1つのバケツには連続した width 回分の評価が入る。バケツが足りなくなったら隣り合う2つをまとめて
+    width を2倍にするので、評価が何回あってもメモリと描画の手間は max_points で頭打ちになる。
+    """
+
+    def __init__(self, max_points=MAX_POINTS):
+        self.max_points = max_points
+        self.width = 1
+        self.n = 0
+        self.episode = np.zeros(max_points, dtype=np.int64)  # バケツの最後の評価のエピソード
+        self.count = np.zeros(max_points, dtype=np.int64)
+        self.sum = np.zeros(max_points)
+        self.sumsq = np.zeros(max_points)
+        self.total = 0
+        self.best = -np.inf
+        self.last = (None, None)
+
+    def __len__(self):
+        return self.total
+
+    def add(self, episode, value):
+        if self.n == 0 or self.count[self.n - 1] >= self.width:
+            if self.n == self.max_points:
+                self._compact()
+            if self.n == 0 or self.count[self.n - 1] >= self.width:
+                self.n += 1
+        i = self.n - 1
+        self.episode[i] = episode
+        self.count[i] += 1
+        self.sum[i] += value
+        self.sumsq[i] += value * value
+        self.total += 1
+        self.best = max(self.best, value)
+        self.last = (episode, value)
+
+    def _compact(self):
+        """隣り合うバケツを2つずつまとめる (奇数個なら最後の1つはそのまま)"""
+        n = self.n
+        pairs = n // 2
+        for array in (self.count, self.sum, self.sumsq):
+            merged = array[0:2 * pairs:2] + array[1:2 * pairs:2]
+            if n % 2:
+                merged = np.append(merged, array[n - 1])
+            array[:len(merged)] = merged
+            array[len(merged):] = 0
+        episodes = self.episode[1:2 * pairs:2]
+        if n % 2:
+            episodes = np.append(episodes, self.episode[n - 1])
+        self.episode[:len(episodes)] = episodes
+        self.n = pairs + n % 2
+        self.width *= 2
+
+    def rolling(self, window=WINDOW, confidence=CONFIDENCE):
+        """直近 window 回分 (バケツ単位で切り上げ) の移動平均と信頼区間
+
+        Returns:
+            dict: 'episode', 'mean', 'low', 'high' の配列 (バケツごと)
+        """
+        n = self.n
+        count = np.concatenate([[0], np.cumsum(self.count[:n])])
+        total = np.concatenate([[0.0], np.cumsum(self.sum[:n])])
+        total_sq = np.concatenate([[0.0], np.cumsum(self.sumsq[:n])])
+        # バケツ i で終わる窓の始まり j: count[i+1] - count[j] >= window となる一番後ろの j
+        start = np.searchsorted(count, count[1:] - window, side='right') - 1
+        start = np.maximum(start, 0)
+        end = np.arange(1, n + 1)
+        k = count[end] - count[start]
+        mean = (total[end] - total[start]) / k
+        var = np.maximum((total_sq[end] - total_sq[start]) / k - mean ** 2, 0.0)
+        var = np.where(k > 1, var * k / np.maximum(k - 1, 1), 0.0)
+        half = z_value(confidence) * np.sqrt(var / k)
+        return {'episode': self.episode[:n].copy(), 'mean': mean, 'low': mean - half, 'high': mean + half}
+
+
+# ---------------------------------------------------------
+# ファイルの追いかけ読み
+# ---------------------------------------------------------
+class CurveTail:
+    """1つの performance_<性格>.csv を前回の続きから読む"""
+
+    def __init__(self, path, max_points=MAX_POINTS):
+        self.path = path
+        self.max_points = max_points
+        self.reset()
+
+    def reset(self, inode=None):
+        self.inode = inode
+        self.offset = 0
+        self.partial = b''
+        self.series = BucketSeries(self.max_points)
+        self.stop = None  # 打ち切りの行 (エピソード, 理由)
+        self.updated = None
+
+    def poll(self):
+        """増えた分を読み、新しく読んだ行数を返す (-1 ならファイルが消えた)"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return -1
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            # 置き換わった / 切り詰められたので最初から
+            self.reset(st.st_ino)
+        if st.st_size == self.offset:
+            return 0
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+        self.offset += len(data)
+        data = self.partial + data
+        lines = data.split(b'\n')
+        # 改行で終わっていない最後の行は書きかけなので次回に回す
+        self.partial = lines.pop()
+
+        added = 0
+        for row in csv.reader(line.decode('utf-8', 'replace') for line in lines if line.strip()):
+            try:
+                if len(row) == 2:
+                    self.series.add(int(row[0]), float(row[1]))
+                    added += 1
+                elif len(row) == 3:
+                    self.stop = (int(row[0]), row[2])
+                    added += 1
+            except ValueError:
+                continue
+        if added:
+            self.updated = st.st_mtime
+        return added
+
+
+def read_profile(path):
+    """profile_<性格>.csv から学習時間と速度を読む (なければ None)"""
+    try:
+        with open(path, 'r', newline='') as f:
+            rows = list(csv.reader(f))
+    except OSError:
+        return None
+    profile = {}
+    for row in rows[1:]:
+        if len(row) < 4:
+            continue
+        kind, name, value, rate = row[:4]
+        try:
+            if kind == 'total' and name == 'seconds':
+                profile['seconds'] = float(value)
+            elif kind == 'counter' and name == 'episodes':
+                profile['episodes_per_second'] = float(rate)
+            elif kind == 'memory' and name == 'peak_mb':
+                profile['peak_mb'] = float(value)
+        except ValueError:
+            continue
+    return profile or None
+
+
+# ---------------------------------------------------------
+# ダッシュボード
+# ---------------------------------------------------------
+class Dashboard:
+    """root 以下の学習ログを集め、変化があったときだけレポートを書き直す"""
+
+    def __init__(self, root=ROOT, out_dir=OUT_DIR, window=WINDOW, max_points=MAX_POINTS, confidence=CONFIDENCE):
+        self.root = root
+        self.out_dir = out_dir
+        self.window = window
+        self.max_points = max_points
+        self.confidence = confidence
+        self.tails = {}     # パス -> CurveTail
+        self.profiles = {}  # パス -> (mtime, 内容)
+
+    def discover(self):
+        """新しくできた performance_*.csv を追加し、新しいファイルがあれば True"""
+        found = False
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith('performance_') and name.endswith('.csv'):
+                    path = os.path.join(dirpath, name)
+                    if path not in self.tails:
+                        self.tails[path] = CurveTail(path, self.max_points)
+                        found = True
+        return found
+
+    def _profile(self, curve_path):
+        path = os.path.join(os.path.dirname(curve_path),
+                            'profile_' + os.path.basename(curve_path)[len('performance_'):])
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self.profiles.pop(path, None)
+            return None, False
+        cached = self.profiles.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], False
+        self.profiles[path] = (mtime, read_profile(path))
+        return self.profiles[path][1], True
+
+    def poll(self):
+        """全ファイルの増えた分を読み、描き直す必要があれば True"""
+        changed = self.discover()
+        for path, tail in list(self.tails.items()):
+            added = tail.poll()
+            if added < 0:
+                del self.tails[path]
+                changed = True
+            elif added:
+                changed = True
+            changed |= self._profile(path)[1]
+        return changed
+
+    def runs(self):
+        """[{'personality', 'label', 'tail', 'profile'}, ...] (性格、ラベルの順)"""
+        runs = []
+        for path, tail in self.tails.items():
+            personality = os.path.basename(path)[len('performance_'):-len('.csv')]
+            label = os.path.relpath(os.path.dirname(path), self.root)
+            runs.append({'personality': personality, 'label': '' if label == '.' else label,
+                         'tail': tail, 'profile': self._profile(path)[0]})
+        runs.sort(key=lambda r: (r['personality'], r['label']))
+        return runs
+
+    # --- 描画 ---
+    def render(self, refresh=None):
+        """PNG と HTML を書き直して、それぞれのパスを返す (refresh 秒ごとにブラウザが読み直す HTML にする)"""
+        os.makedirs(self.out_dir, exist_ok=True)
+        runs = self.runs()
+        png_path = os.path.join(self.out_dir, 'dashboard.png')
+        html_path = os.path.join(self.out_dir, 'dashboard.html')
+        self._render_png(runs, png_path)
+        self._render_html(runs, html_path, os.path.basename(png_path), refresh)
+        return png_path, html_path
+
+    def _render_png(self, runs, path):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        groups = {}
+        for run in runs:
+            if len(run['tail'].series):
+                groups.setdefault(run['personality'], []).append(run)
+        ncols = min(3, max(len(groups), 1))
+        nrows = max(1, -(-len(groups) // ncols))
+        fig, axes = plt.subplots(nrows, ncols, figsize=(6 * ncols, 4 * nrows), squeeze=False)
+        for ax in axes.ravel()[len(groups):]:
+            ax.axis('off')
+
+        for ax, (personality, group) in zip(axes.ravel(), groups.items()):
+            for run in group:
+                curve = run['tail'].series.rolling(self.window, self.confidence)
+                line, = ax.plot(curve['episode'], curve['mean'], linewidth=1.0,
+                                label=run['label'] or personality)
+                if len(group) <= MAX_BANDS:
+                    ax.fill_between(curve['episode'], curve['low'], curve['high'], color=line.get_color(),
+                                    alpha=0.15)
+            ax.set_title(f'{personality} ({len(group)} runs)' if len(group) > 1 else personality)
+            ax.set_xlabel('Episode')
+            ax.set_ylabel('Win Rate')
+            if 1 < len(group) <= MAX_BANDS:
+                ax.legend(fontsize=8)
+        if not groups:
+            axes[0, 0].text(0.5, 0.5, f'No performance logs in {self.root}', ha='center', va='center')
+        fig.suptitle(f'Learning curves (rolling mean of {self.window} evals, {self.confidence:.0%} CI)')
+        fig.tight_layout()
+        # 書きかけの画像を見せないよう、別名で書いてから置き換える
+        tmp_path = path + '.tmp'
+        fig.savefig(tmp_path, format='png')
+        plt.close(fig)
+        os.replace(tmp_path, path)
+
+    def _render_html(self, runs, path, png_name, refresh=None):
+        now = time.time()
+        rows = []
+        for run in runs:
+            tail, profile = run['tail'], run['profile']
+            series = tail.series
+            if len(series):
+                curve = series.rolling(self.window, self.confidence)
+                latest = f"{curve['mean'][-1]:+.4f} [{curve['low'][-1]:+.4f}, {curve['high'][-1]:+.4f}]"
+                last_episode, best = series.last[0], f'{series.best:+.4f}'
+            else:
+                latest, last_episode, best = '-', '-', '-'
+            if tail.stop is not None:
+                status = f'stopped at {tail.stop[0]} ({tail.stop[1]})'
+            elif tail.updated is not None:
+                status = f'updated {now - tail.updated:.0f}s ago'
+            else:
+                status = 'waiting'
+            timing = '-'
+            if profile is not None:
+                timing = f"{profile.get('seconds', 0):.1f}s"
+                if 'episodes_per_second' in profile:
+                    timing += f", {profile['episodes_per_second']:.0f} ep/s"
+            cells = [run['personality'], run['label'] or '.', len(series), last_episode, latest, best, status, timing]
+            rows.append('<tr>' + ''.join(f'<td>{html.escape(str(c))}</td>' for c in cells) + '</tr>')
+
+        header = ['Personality', 'Run', 'Evals', 'Episode', f'Rolling mean ({self.confidence:.0%} CI)',
+                  'Best', 'Status', 'Timing']
+        refresh_tag = f'<meta http-equiv="refresh" content="{refresh:.0f}">' if refresh else ''
+        page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8">{refresh_tag}<title>Training dashboard</title>
+<style>body{{font-family:sans-serif}} table{{border-collapse:collapse}} td,th{{border:1px solid #ccc;padding:2px 8px}}</style>
+</head><body>
+<h1>Training dashboard</h1>
+<p>{html.escape(self.root)} &mdash; {len(runs)} runs, updated {time.strftime('%Y-%m-%d %H:%M:%S')}</p>
+<img src="{html.escape(png_name)}?t={int(now)}">
+<table><tr>{''.join(f'<th>{html.escape(h)}</th>' for h in header)}</tr>
+{chr(10).join(rows)}
+</table></body></html>
+"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(page)
+        os.replace(tmp_path, path)
+
+    def run(self, interval=INTERVAL, once=False):
+        """interval 秒ごとに読み進め、変化があればレポートを書き直す (once なら1回だけ)"""
+        while True:
+            start = time.perf_counter()
+            if self.poll() or once:
+                _, html_path = self.render(refresh=None if once else interval)
+                total = sum(len(t.series) for t in self.tails.values())
+                print(f"[{time.strftime('%H:%M:%S')}] {len(self.tails)} runs, {total} evals "
+                      f"-> {html_path} ({time.perf_counter() - start:.2f}s)")
+            if once:
+                return
+            time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='学習中の performance_*.csv を追いかけて学習曲線のレポートを更新する')
+    parser.add_argument('--root', default=ROOT, help='performance_*.csv を探すフォルダ (サブフォルダも含む)')
+    parser.add_argument('--out-dir', default=OUT_DIR, help='dashboard.png / dashboard.html の保存先')
+    parser.add_argument('--interval', type=float, default=INTERVAL, help='書き直す間隔 (秒)')
+    parser.add_argument('--window', type=int, default=WINDOW, help='移動平均をとる評価の回数')
+    parser.add_argument('--max-points', type=int, default=MAX_POINTS, help='1つの学習で描く点の数の上限')
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE, help='信頼区間の信頼度')
+    parser.add_argument('--once', action='store_true', help='1回だけ書き出して終わる')
+    args = parser.parse_args(argv)
+
+    dashboard = Dashboard(args.root, args.out_dir, args.window, args.max_points, args.confidence)
+    try:
+        dashboard.run(args.interval, once=args.once)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+from functools import lru_cache
+import numpy as np
+from score_table import compile_reward_config, MAX_SCORE
+from policy_table import PLAYER_RANGE, DEALER_RANGE
+
+# ---------------------------------------------------------
+# 動的計画法による最適戦略と期待報酬の厳密解
+# ---------------------------------------------------------
+# calculate_custom_reward の報酬で、各状態 (プレイヤー合計, ディーラーのアップカード, ソフトか)
+# の Hit / Stand の期待報酬を厳密に計算する。
+# カードは無限デッキ (各ランク 1/13 で独立) を仮定する。rlcard の1デッキ環境とは
+# 使用済みカードの分だけ確率がわずかに異なる。
+
+# カードの点数 (Aは1) とその確率
+CARD_POINTS = np.arange(1, 11)
+CARD_PROBS = np.array([1, 1, 1, 1, 1, 1, 1, 1, 1, 4]) / 13.0
+
+# ディーラーの最終結果: 17, 18, 19, 20, 21, バースト
+DEALER_FINALS = (17, 18, 19, 20, 21, 22)
+
+ACTION_HIT = 0
+ACTION_STAND = 1
+
+
+def _score(raw, has_ace):
+    return raw + 10 if has_ace and raw <= 11 else raw
+
+
+@lru_cache(maxsize=None)
+def _dealer_from(raw, has_ace):
+    """ディーラーの手札 (raw, has_ace) から引き切ったときの最終結果の分布"""
+    score = _score(raw, has_ace)
+    if score > 21:
+        return (0.0,) * 5 + (1.0,)
+    if score >= 17:
+        dist = [0.0] * 6
+        dist[score - 17] = 1.0
+        return tuple(dist)
+    dist = np.zeros(6)
+    for point, prob in zip(CARD_POINTS, CARD_PROBS):
+        dist += prob * np.array(_dealer_from(raw + point, has_ace or point == 1))
+    return tuple(dist)
+
+
+@lru_cache(maxsize=None)
+def dealer_distribution(up):
+    """アップカード up (2〜11, 11=A) に対するディーラーの最終結果の分布 (17〜21, バースト)"""
+    up_point = 1 if up == 11 else up
+    dist = np.zeros(6)
+    # 伏せ札も同じ分布から引かれる
+    for point, prob in zip(CARD_POINTS, CARD_PROBS):
+        dist += prob * np.array(_dealer_from(up_point + point, up_point == 1 or point == 1))
+    return tuple(dist)
+
+
+def _config_key(reward_config):
+    return tuple(sorted((reward_config or {}).items()))
+
+
+class _Rewards:
+    """報酬テーブル (score_table.compile_reward_config) を勝ち / 負け / 引き分けで引く"""
+
+    def __init__(self, reward_config):
+        self.table = compile_reward_config(reward_config)
+
+    def win(self, score):
+        return self.table[2, min(score, MAX_SCORE)]
+
+    def loss(self, score):
+        return self.table[0, min(score, MAX_SCORE)]
+
+    def draw(self, score):
+        return self.table[1, min(score, MAX_SCORE)]
+
+
+def _stand_value(rewards, score, up):
+    """スコア score で Stand したときの期待報酬"""
+    dist = dealer_distribution(up)
+    value = dist[5] * rewards.win(score)
+    for final, prob in zip(DEALER_FINALS[:5], dist[:5]):
+        if score > final:
+            value += prob * rewards.win(score)
+        elif score < final:
+            value += prob * rewards.loss(score)
+        else:
+            value += prob * rewards.draw(score)
+    return value
+
+
+def _initial_expectation(state_value):
+    """初手の期待報酬: プレイヤーの2枚とアップカードは独立に配られる"""
+    expected = 0.0
+    for up_point, up_prob in zip(CARD_POINTS, CARD_PROBS):
+        up = 11 if up_point == 1 else up_point
+        for p1, prob1 in zip(CARD_POINTS, CARD_PROBS):
+            for p2, prob2 in zip(CARD_POINTS, CARD_PROBS):
+                expected += up_prob * prob1 * prob2 * state_value(p1 + p2, p1 == 1 or p2 == 1, up)
+    return expected
+
+
+@lru_cache(maxsize=None)
+def _solve(config_key):
+    rewards = _Rewards(dict(config_key))
+    values = {} # (raw, has_ace, up) -> (hit の期待値, stand の期待値)
+
+    def state_value(raw, has_ace, up):
+        score = _score(raw, has_ace)
+        if score > 21:
+            return rewards.loss(score)
+        return max(action_values(raw, has_ace, up))
+
+    def action_values(raw, has_ace, up):
+        key = (raw, has_ace, up)
+        if key not in values:
+            hit = 0.0
+            for point, prob in zip(CARD_POINTS, CARD_PROBS):
+                hit += prob * state_value(raw + point, has_ace or point == 1, up)
+            values[key] = (hit, _stand_value(rewards, _score(raw, has_ace), up))
+        return values[key]
+
+    # 全状態を計算しておく (プレイヤー合計 4〜21 のハード / 12〜21 のソフト)
+    for up in DEALER_RANGE:
+        for raw in range(21, 1, -1):
+            action_values(raw, False, up)
+            if raw <= 11:
+                action_values(raw, True, up)
+
+    return values, _initial_expectation(state_value)
+
+
+def solve(reward_config):
+    """報酬設定に対する最適戦略を求める
+
+    Returns:
+        dict: 'hard' / 'soft' は最適行動 (0=Hit, 1=Stand) の表、'hard_q' / 'soft_q' は
+              各行動の期待報酬 (policy_table.extract_policy と同じ並び)、
+              'expected_reward' は最適戦略での1ゲームあたりの期待報酬、
+              'policy' は (プレイヤー合計, アップカード, ソフトか) -> 行動 の辞書
+    """
+    values, expected = _solve(_config_key(reward_config))
+
+    policy = {}
+    for (raw, has_ace, up), q in values.items():
+        soft = has_ace and raw <= 11
+        policy[(_score(raw, has_ace), up, soft)] = int(np.argmax(q))
+
+    shape = (len(PLAYER_RANGE), len(DEALER_RANGE))
+    hard_q = np.zeros(shape + (2,))
+    soft_q = np.zeros(shape + (2,))
+    for i, total in enumerate(PLAYER_RANGE):
+        for j, up in enumerate(DEALER_RANGE):
+            hard_q[i, j] = values[(total, False, up)]
+            soft_q[i, j] = values[(total - 10, True, up)]
+
+    return {
+        'hard': np.argmax(hard_q, axis=2),
+        'soft': np.argmax(soft_q, axis=2),
+        'hard_q': hard_q,
+        'soft_q': soft_q,
+        'expected_reward': expected,
+        'policy': policy,
+    }
+
+
+def policy_value(table, reward_config):
+    """戦略表 (extract_policy の結果など) に従ったときの厳密な期待報酬
+
+    表にない合計11以下のハードハンドでは Hit するものとする。
+    """
+    rewards = _Rewards(reward_config or {})
+    memo = {}
+
+    def act(raw, has_ace, up):
+        score = _score(raw, has_ace)
+        if score < 12:
+            return ACTION_HIT
+        row = PLAYER_RANGE.index(score)
+        col = DEALER_RANGE.index(up)
+        soft = has_ace and raw <= 11
+        return int(table['soft'][row][col] if soft else table['hard'][row][col])
+
+    def value(raw, has_ace, up):
+        score = _score(raw, has_ace)
+        if score > 21:
+            return rewards.loss(score)
+        key = (raw, has_ace, up)
+        if key in memo:
+            return memo[key]
+        if act(raw, has_ace, up) == ACTION_HIT:
+            result = sum(prob * value(raw + point, has_ace or point == 1, up)
+                         for point, prob in zip(CARD_POINTS, CARD_PROBS))
+        else:
+            result = _stand_value(rewards, score, up)
+        memo[key] = result
+        return result
+
+    return _initial_expectation(value)
+
+
+def agreement(table, solution):
+    """戦略表が最適戦略と一致しているマスの割合 (hard, soft)"""
+    hard = float(np.mean(np.asarray(table['hard']) == solution['hard']))
+    soft = float(np.mean(np.asarray(table['soft']) == solution['soft']))
+    return hard, soft
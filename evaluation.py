@@ -0,0 +1,67 @@
+import numpy as np
+from batch_env import BatchBlackjackEnv, play_games
+
+# ---------------------------------------------------------
+# 複数モデルのバッチ評価
+# ---------------------------------------------------------
+# 各モデルについて batch_size ゲームをまとめて進め、1手ごとに稼働中の全ゲームを
+# 1回の推論で判断する。同じバッチ番号では全モデルが同じシードのデッキを使う。
+
+BATCH_SIZE = 65536
+
+
+def policy_act_fn(policy):
+    """ポリシーを batch_env の act_fn (obs, soft) -> 行動 に変換する"""
+    def act(obs, soft):
+        # DQNAgent.eval_step と同じく np.argmax (同点なら Hit)
+        return np.argmax(policy.q_values(obs, soft=soft), axis=1)
+    return act
+
+
+def win_rate(win, lose):
+    # 引き分けを除いた勝率 (Win / (Win + Lose))
+    decisive_games = win + lose
+    return win / decisive_games if decisive_games > 0 else 0.0
+
+
+def evaluate_models(policies, num_games, batch_size=BATCH_SIZE, seed=None, on_batch=None):
+    """全モデルを num_games ゲームずつ対戦させて W/L/D を数える
+
+    Args:
+        policies (dict): 性格名 -> ポリシー
+        on_batch (callable): (性格名, バッチ番号, 終了した環境) を受け取るコールバック (ログ表示用)
+
+    Returns:
+        list: 性格ごとの {'name', 'rate', 'win', 'lose', 'draw', 'mean_payoff'}
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+
+    counts = {name: np.zeros(3, dtype=np.int64) for name in policies}
+    act_fns = {name: policy_act_fn(policy) for name, policy in policies.items()}
+
+    played = 0
+    batch_no = 0
+    while played < num_games:
+        n = min(batch_size, num_games - played)
+        for name in policies:
+            # 同じバッチ番号なら全モデルが同じカードの並びで対戦する
+            env = BatchBlackjackEnv(n, seed=[seed, batch_no])
+            payoffs = play_games(env, act_fns[name])
+            counts[name] += np.bincount(payoffs + 1, minlength=3)
+            if on_batch is not None:
+                on_batch(name, batch_no, env)
+        played += n
+        batch_no += 1
+
+    results = []
+    for name, (lose, draw, win) in counts.items():
+        results.append({
+            'name': name,
+            'rate': win_rate(win, lose),
+            'win': int(win),
+            'lose': int(lose),
+            'draw': int(draw),
+            'mean_payoff': (win - lose) / played,
+        })
+    return results
@@ -0,0 +1,316 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import numpy as np
+from score_table import card_str, batch_scores, CARD_VALUES
+
+# ---------------------------------------------------------
+# ハンド履歴データベース (SQLite)
+# ---------------------------------------------------------
+# シミュレーションした全ハンドを1行ずつ保存し、
+# 「aggressive がソフト18 vs ディーラー10 でスタンドして負けたハンド」のような条件で検索できるようにする。
+# 見つかったハンドは replay_text.py / replay_gif.py と同じ形式で書き出せる。
+#
+# 使い方:
+#   python hand_history.py ingest --games 1000000
+#   python hand_history.py query --personality aggressive --player 18 --soft --dealer 10 --actions S --outcome lose
+#   python hand_history.py query ... --render text --limit 20
+
+DB_PATH = 'experiments/blackjack_custom_reward/hands.sqlite'
+SAVE_DIR = 'experiments/blackjack_custom_reward'
+NUM_GAMES = 1000000
+SEED = 42
+# 1回の executemany で入れる行数
+INSERT_CHUNK = 200000
+
+OUTCOMES = {'win': 1, 'lose': -1, 'draw': 0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS personalities (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hands (
+    id INTEGER PRIMARY KEY,
+    personality_id INTEGER NOT NULL,
+    game INTEGER NOT NULL,          -- 記録したときのゲーム番号
+    player_start INTEGER NOT NULL,  -- 最初の2枚の合計
+    start_soft INTEGER NOT NULL,    -- 最初の2枚がソフトハンドか (0/1)
+    dealer_up INTEGER NOT NULL,     -- ディーラーのアップカード (2〜11, A=11)
+    actions TEXT NOT NULL,          -- 行動の並び (H=Hit, S=Stand, 例: 'HHS')
+    player_final INTEGER NOT NULL,
+    dealer_final INTEGER NOT NULL,
+    payoff INTEGER NOT NULL,        -- 1=勝ち, -1=負け, 0=引き分け
+    player_cards BLOB NOT NULL,     -- カードコード (int8) の並び
+    dealer_cards BLOB NOT NULL
+);
+"""
+
+# 検索でよく使う条件の組み合わせ (性格を指定する場合 / しない場合)
+INDEXES = {
+    'idx_hands_personality': 'hands (personality_id, dealer_up, player_start, start_soft, actions, payoff)',
+    'idx_hands_situation': 'hands (dealer_up, player_start, start_soft, actions, payoff)',
+    'idx_hands_actions': 'hands (actions, personality_id, payoff)',
+    'idx_hands_outcome': 'hands (payoff, personality_id)',
+}
+
+
+def connect(path=DB_PATH):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _personality_id(conn, name):
+    conn.execute('INSERT OR IGNORE INTO personalities (name) VALUES (?)', (name,))
+    return conn.execute('SELECT id FROM personalities WHERE name = ?', (name,)).fetchone()[0]
+
+
+def _drop_indexes(conn):
+    for name in INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def _create_indexes(conn):
+    for name, columns in INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {columns}')
+    conn.execute('ANALYZE')
+
+
+# ---------------------------------------------------------
+# 取り込み
+# ---------------------------------------------------------
+def hand_rows(personality_id, columns, first_game=0):
+    """trajectory_store の列 (record_policy の返り値) を hands テーブルの行にする"""
+    player_cards = np.asarray(columns['player_cards'])
+    dealer_cards = np.asarray(columns['dealer_cards'])
+    player_count = np.asarray(columns['player_count'])
+    dealer_count = np.asarray(columns['dealer_count'])
+    actions = np.asarray(columns['actions'])
+    payoffs = np.asarray(columns['payoffs'])
+
+    start_score, start_soft = batch_scores(player_cards[:, :2])
+    player_final, _ = batch_scores(player_cards)
+    dealer_final, _ = batch_scores(dealer_cards)
+    dealer_up = CARD_VALUES[dealer_cards[:, 1]]
+    dealer_up = np.where(dealer_up == 1, 11, dealer_up)
+
+    # 行動の配列 (-1 は空き) を 'H' / 'S' の文字列にまとめて変換する (末尾の \0 は bytes 変換で落ちる)
+    letters = np.where(actions == 0, ord('H'), np.where(actions == 1, ord('S'), 0)).astype(np.uint8)
+    action_strings = np.ascontiguousarray(letters).view(f'S{letters.shape[1]}').ravel().astype(str)
+
+    for i in range(len(payoffs)):
+        yield (
+            personality_id, first_game + i, int(start_score[i]), int(start_soft[i]), int(dealer_up[i]),
+            action_strings[i], int(player_final[i]), int(dealer_final[i]), int(payoffs[i]),
+            player_cards[i, :player_count[i]].tobytes(), dealer_cards[i, :dealer_count[i]].tobytes(),
+        )
+
+
+def ingest(conn, name, columns, replace=True):
+    """1つの性格のハンドをまとめて追加する (インデックスは入れ終わってから作り直す)"""
+    # 大量に入れる間はジャーナルと同期を切る (失敗したら取り込み直せばよい)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    personality_id = _personality_id(conn, name)
+    _drop_indexes(conn)
+    if replace:
+        conn.execute('DELETE FROM hands WHERE personality_id = ?', (personality_id,))
+
+    rows = hand_rows(personality_id, columns)
+    sql = 'INSERT INTO hands (personality_id, game, player_start, start_soft, dealer_up, actions, ' \
+          'player_final, dealer_final, payoff, player_cards, dealer_cards) VALUES (?,?,?,?,?,?,?,?,?,?,?)'
+    while True:
+        chunk = [row for _, row in zip(range(INSERT_CHUNK), rows)]
+        if not chunk:
+            break
+        conn.executemany(sql, chunk)
+    conn.commit()
+
+
+def ingest_models(model_files, path=DB_PATH, num_games=NUM_GAMES, seed=SEED, store=None):
+    """全モデルのハンドを取り込む (store があれば記録済みの軌跡を、なければシミュレーションする)"""
+    from policies import load_policy, personality_from_model
+    from trajectory_store import record_policy
+
+    conn = connect(path)
+    for model_path in model_files:
+        name = personality_from_model(model_path)
+        start = time.perf_counter()
+        if store is not None:
+            columns = store[name]
+        else:
+            columns = record_policy(load_policy(model_path), num_games, seed=seed)
+        ingest(conn, name, columns)
+        print(f"  {name}: {len(columns['payoffs'])} hands ({time.perf_counter() - start:.1f}s)")
+
+    print("Creating indexes...")
+    _create_indexes(conn)
+    conn.commit()
+    conn.close()
+
+
+# ---------------------------------------------------------
+# 検索
+# ---------------------------------------------------------
+def _where(personality=None, player=None, soft=None, dealer=None, actions=None, outcome=None):
+    clauses, params = [], []
+    if personality is not None:
+        clauses.append('h.personality_id = (SELECT id FROM personalities WHERE name = ?)')
+        params.append(personality)
+    if player is not None:
+        clauses.append('h.player_start = ?')
+        params.append(player)
+    if soft is not None:
+        clauses.append('h.start_soft = ?')
+        params.append(int(soft))
+    if dealer is not None:
+        clauses.append('h.dealer_up = ?')
+        params.append(dealer)
+    if actions is not None:
+        prefix = actions[:-1]
+        if actions.endswith('%') and '%' not in prefix and '_' not in prefix:
+            # 'HH%' のような前方一致は範囲検索にしてインデックスを使う
+            clauses.append('h.actions >= ? AND h.actions < ?')
+            params.extend([prefix, prefix + '\uffff'])
+        else:
+            # それ以外の % / _ を含むパターンは LIKE で検索する
+            clauses.append('h.actions LIKE ?' if '%' in actions or '_' in actions else 'h.actions = ?')
+            params.append(actions)
+    if outcome is not None:
+        clauses.append('h.payoff = ?')
+        params.append(OUTCOMES[outcome] if isinstance(outcome, str) else outcome)
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def count_hands(conn, **filters):
+    where, params = _where(**filters)
+    sql = f'SELECT COUNT(*) FROM hands h{where}'
+    return conn.execute(sql, params).fetchone()[0]
+
+
+def query_hands(conn, limit=100, **filters):
+    """条件に合うハンドを trajectory_store の game 形式の辞書で返す
+
+    filters: personality, player (最初の2枚の合計), soft (True/False), dealer (アップカード, A=11),
+             actions ('S', 'HS' など。% で LIKE 検索), outcome ('win' / 'lose' / 'draw')
+    """
+    where, params = _where(**filters)
+    sql = ('SELECT p.name, h.game, h.actions, h.payoff, h.player_cards, h.dealer_cards '
+           f'FROM hands h JOIN personalities p ON p.id = h.personality_id{where} ORDER BY h.id')
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params = params + [limit]
+    return [_row_to_game(*row) for row in conn.execute(sql, params)]
+
+
+def _row_to_game(name, game_no, actions, payoff, player_blob, dealer_blob):
+    player_hand = [card_str(c) for c in np.frombuffer(player_blob, dtype=np.int8)]
+    dealer_hand = [card_str(c) for c in np.frombuffer(dealer_blob, dtype=np.int8)]
+    steps = [{
+        'player_hand': player_hand[:2 + k],
+        'dealer_up': dealer_hand[1],
+        'action': 0 if letter == 'H' else 1,
+    } for k, letter in enumerate(actions)]
+    return {
+        'personality': name,
+        'game_no': game_no,
+        'steps': steps,
+        'player_hand': player_hand,
+        'dealer_hand': dealer_hand,
+        'payoff': payoff,
+    }
+
+
+# ---------------------------------------------------------
+# 検索結果の書き出し
+# ---------------------------------------------------------
+def render_text(games, path, title):
+    from replay_text import write_log
+    write_log(path, title, games)
+
+
+def render_gif(games, path, title):
+    from replay_gif import game_frames
+    from card_renderer import save_gif
+    frames = []
+    for game in games:
+        frames.extend(game_frames(game, game['personality']))
+    save_gif(path, frames, duration=800)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ハンド履歴データベースの作成と検索')
+    parser.add_argument('--db', default=DB_PATH, help='データベースファイル')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_ingest = sub.add_parser('ingest', help='全モデルのハンドを取り込む')
+    p_ingest.add_argument('--save-dir', default=SAVE_DIR, help='モデルがある場所')
+    p_ingest.add_argument('--games', type=int, default=NUM_GAMES, help='モデルごとのハンド数')
+    p_ingest.add_argument('--seed', type=int, default=SEED)
+    p_ingest.add_argument('--from-store', metavar='DIR',
+                          help='シミュレーションせずに trajectory_store.py の記録を取り込む')
+
+    p_query = sub.add_parser('query', help='条件に合うハンドを検索する')
+    p_query.add_argument('--personality')
+    p_query.add_argument('--player', type=int, help='最初の2枚の合計')
+    soft = p_query.add_mutually_exclusive_group()
+    soft.add_argument('--soft', dest='soft', action='store_true', default=None, help='ソフトハンドのみ')
+    soft.add_argument('--hard', dest='soft', action='store_false', help='ハードハンドのみ')
+    p_query.add_argument('--dealer', type=int, help='ディーラーのアップカード (A=11)')
+    p_query.add_argument('--actions', help="行動の並び (例: S, HS, 'H%%')")
+    p_query.add_argument('--outcome', choices=list(OUTCOMES))
+    p_query.add_argument('--limit', type=int, default=10)
+    p_query.add_argument('--render', choices=['text', 'gif'], help='見つかったハンドをリプレイとして書き出す')
+    p_query.add_argument('--output', help='リプレイの保存先 (省略時は query.txt / query.gif)')
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        from policies import find_models
+        model_files = find_models(args.save_dir)
+        if not model_files:
+            print(f"Error: No models found in {args.save_dir}")
+            sys.exit(1)
+        store = None
+        if args.from_store:
+            from trajectory_store import load_store
+            store = load_store(args.from_store, model_files)
+        ingest_models(model_files, args.db, args.games, args.seed, store)
+        print(f"Hand history saved to {args.db}")
+        return
+
+    if not os.path.exists(args.db):
+        print(f"Error: {args.db} not found. Run 'python hand_history.py ingest' first.")
+        sys.exit(1)
+
+    conn = connect(args.db)
+    filters = dict(personality=args.personality, player=args.player, soft=args.soft,
+                   dealer=args.dealer, actions=args.actions, outcome=args.outcome)
+    start = time.perf_counter()
+    total = count_hands(conn, **filters)
+    games = query_hands(conn, limit=args.limit, **filters)
+    print(f"{total} hands matched ({(time.perf_counter() - start) * 1000:.1f} ms)")
+
+    from blackjack_utils import print_hand, get_score
+    for game in games:
+        result = "WIN" if game['payoff'] > 0 else ("LOSE" if game['payoff'] < 0 else "DRAW")
+        actions = ''.join('H' if step['action'] == 0 else 'S' for step in game['steps'])
+        print(f"  [{game['personality']} #{game['game_no']}] {print_hand(game['player_hand'])} "
+              f"vs {print_hand(game['dealer_hand'])} | {actions} | {result} "
+              f"({get_score(game['player_hand'])} - {get_score(game['dealer_hand'])})")
+
+    if args.render and games:
+        output = args.output or f'query.{"txt" if args.render == "text" else "gif"}'
+        title = args.personality or 'query'
+        if args.render == 'text':
+            render_text(games, output, title)
+        else:
+            render_gif(games, output, title)
+        print(f"Replay saved to {output}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
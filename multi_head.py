@@ -0,0 +1,260 @@
+import os
+import csv
+import glob
+import copy
+import random
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+from blackjack_utils import load_reward_config
+from score_table import compile_reward_config, batch_rewards
+from batch_env import BatchBlackjackEnv, rollout, rollout_transitions
+from replay_buffer import RingMemory
+from evaluation import evaluate_models
+from numpy_policy import NumpyPolicy
+
+# ---------------------------------------------------------
+# 全性格をまとめて学習する (共有の経験 + 性格ごとの Q-net)
+# ---------------------------------------------------------
+# カードの流れは性格によらず同じで、違うのは calculate_custom_reward の報酬だけなので、
+# ゲームは1つの流れとしてまとめて進め、各エピソードの報酬を全性格の設定で付け直す。
+# 性格ごとの Q-net は重みを (性格, ...) 方向に積んだ1つのモデルにして、
+# 同じミニバッチで全員分を1回の forward / backward で更新する (Double DQN、DQNAgent と同じ既定値)。
+#
+# 行動は「ゲーム番号 % 性格数」の性格の Q-net で ε-greedy に選ぶ。Q学習は方策オフなので、
+# どの性格もすべてのゲームから学習できる。
+# 出力は train_and_save と同じ model_<性格>.pth (DQNAgent の Q-net の state_dict) と performance_<性格>.csv。
+#
+# 使い方:
+#   python multi_head.py
+#   python train_all.py --multi-head
+
+CONFIG_DIR = 'personality'
+SAVE_DIR = 'experiments/blackjack_custom_reward'
+NUM_EPISODES = 50000
+EVALUATE_EVERY = 500
+EVAL_GAMES = 10000
+EVAL_SEED = 42
+GAMES_PER_ROLLOUT = 32  # 1回にまとめて進めるゲーム数 (行動に使う Q-net はこの単位で更新される)
+
+# DQNAgent の既定値と同じ
+MLP_LAYERS = [128, 128]
+REPLAY_MEMORY_SIZE = 20000
+REPLAY_MEMORY_INIT_SIZE = 100
+UPDATE_TARGET_EVERY = 1000
+DISCOUNT_FACTOR = 0.99
+EPSILON_START = 1.0
+EPSILON_END = 0.1
+EPSILON_DECAY_STEPS = 20000
+BATCH_SIZE = 32
+TRAIN_EVERY = 1
+LEARNING_RATE = 0.00005
+BN_EPS = 1e-5
+BN_MOMENTUM = 0.1
+
+
+class StackedQNet(nn.Module):
+    """rlcard の EstimatorNetwork (BatchNorm -> [Linear -> Tanh] x n -> Linear) を P 個積んだもの
+
+    入力は (P, バッチ, 状態), 出力は (P, バッチ, 行動)。
+    """
+
+    def __init__(self, num_heads, state_dim=2, num_actions=2, mlp_layers=MLP_LAYERS):
+        super().__init__()
+        self.num_heads = num_heads
+        self.bn_weight = nn.Parameter(torch.ones(num_heads, state_dim))
+        self.bn_bias = nn.Parameter(torch.zeros(num_heads, state_dim))
+        self.register_buffer('running_mean', torch.zeros(num_heads, state_dim))
+        self.register_buffer('running_var', torch.ones(num_heads, state_dim))
+        self.register_buffer('num_batches_tracked', torch.zeros(num_heads, dtype=torch.long))
+
+        dims = [state_dim] + list(mlp_layers) + [num_actions]
+        self.weights = nn.ParameterList()
+        self.biases = nn.ParameterList()
+        for fan_in, fan_out in zip(dims[:-1], dims[1:]):
+            weight = torch.empty(num_heads, fan_out, fan_in)
+            bias = torch.empty(num_heads, fan_out)
+            for head in range(num_heads):
+                # DQNAgent と同じ初期化 (重みは Xavier、バイアスは nn.Linear の既定)
+                nn.init.xavier_uniform_(weight[head])
+                nn.init.uniform_(bias[head], -1 / np.sqrt(fan_in), 1 / np.sqrt(fan_in))
+            self.weights.append(nn.Parameter(weight))
+            self.biases.append(nn.Parameter(bias))
+
+    def forward(self, x):
+        if self.training:
+            mean = x.mean(dim=1)
+            var = x.var(dim=1, unbiased=False)
+            with torch.no_grad():
+                n = x.shape[1]
+                self.running_mean.mul_(1 - BN_MOMENTUM).add_(BN_MOMENTUM * mean)
+                self.running_var.mul_(1 - BN_MOMENTUM).add_(BN_MOMENTUM * var * n / max(n - 1, 1))
+                self.num_batches_tracked += 1
+        else:
+            mean, var = self.running_mean, self.running_var
+        x = (x - mean[:, None]) / torch.sqrt(var[:, None] + BN_EPS) * self.bn_weight[:, None] + self.bn_bias[:, None]
+
+        last = len(self.weights) - 1
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            x = torch.baddbmm(bias[:, None], x, weight.transpose(1, 2))
+            if i < last:
+                x = torch.tanh(x)
+        return x
+
+    def head_state_dict(self, head):
+        """head 番目の Q-net を DQNAgent の Q-net (EstimatorNetwork) と同じキーの state_dict にする"""
+        state = {
+            'fc_layers.1.weight': self.bn_weight[head],
+            'fc_layers.1.bias': self.bn_bias[head],
+            'fc_layers.1.running_mean': self.running_mean[head],
+            'fc_layers.1.running_var': self.running_var[head],
+            'fc_layers.1.num_batches_tracked': self.num_batches_tracked[head],
+        }
+        # EstimatorNetwork の fc_layers は Flatten, BatchNorm, Linear, Tanh, Linear, Tanh, Linear の順
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            state[f'fc_layers.{2 + 2 * i}.weight'] = weight[head]
+            state[f'fc_layers.{2 + 2 * i}.bias'] = bias[head]
+        return {k: v.detach().clone() for k, v in state.items()}
+
+
+class MultiHeadDQN:
+    """P 個の Q-net と、報酬を P 通り持つリプレイメモリ"""
+
+    def __init__(self, num_heads, state_shape=(2,), num_actions=2, mlp_layers=MLP_LAYERS):
+        self.num_heads = num_heads
+        self.num_actions = num_actions
+        self.qnet = StackedQNet(num_heads, state_shape[0], num_actions, mlp_layers)
+        self.qnet.eval()
+        self.target_qnet = copy.deepcopy(self.qnet)
+        self.optimizer = torch.optim.Adam(self.qnet.parameters(), lr=LEARNING_RATE)
+        self.memory = RingMemory(REPLAY_MEMORY_SIZE, BATCH_SIZE, state_shape, num_actions,
+                                 reward_shape=(num_heads,))
+        self.epsilons = np.linspace(EPSILON_START, EPSILON_END, EPSILON_DECAY_STEPS)
+        self.total_t = 0
+        self.train_t = 0
+
+    def predict(self, obs):
+        """全性格の Q値 (P, N, 行動)"""
+        with torch.no_grad():
+            x = torch.from_numpy(np.asarray(obs, dtype=np.float32))
+            return self.qnet(x.expand(self.num_heads, *x.shape)).numpy()
+
+    def act(self, obs, heads, rng):
+        """各ゲームを担当する性格 heads の Q-net で ε-greedy に行動を選ぶ"""
+        epsilon = self.epsilons[min(self.total_t, len(self.epsilons) - 1)]
+        q = self.predict(obs)
+        actions = np.argmax(q[heads, np.arange(len(obs))], axis=1)
+        explore = rng.random(len(obs)) < epsilon
+        actions[explore] = rng.integers(0, self.num_actions, size=int(explore.sum()))
+        return actions
+
+    def feed(self, states, actions, rewards, next_states, dones):
+        """遷移をまとめて保存し、DQNAgent.feed と同じ回数だけ学習する (rewards は (N, P))"""
+        self.memory.save_batch(states, actions, rewards, next_states, dones)
+        start = self.total_t
+        self.total_t += len(actions)
+        # total_t - replay_memory_init_size が 0 以上で train_every の倍数になるたびに1回
+        first = max(start + 1, REPLAY_MEMORY_INIT_SIZE)
+        first += (-(first - REPLAY_MEMORY_INIT_SIZE)) % TRAIN_EVERY
+        for _ in range(first, self.total_t + 1, TRAIN_EVERY):
+            self.train()
+
+    def train(self):
+        states, actions, rewards, next_states, dones, _ = self.memory.sample()
+        heads = self.num_heads
+        next_states = torch.from_numpy(next_states.astype(np.float32)).expand(heads, -1, -1)
+        with torch.no_grad():
+            # Double DQN: 行動は学習中の Q-net で選び、その価値はターゲットの Q-net で測る
+            best_actions = self.qnet(next_states).argmax(dim=-1, keepdim=True)
+            next_values = self.target_qnet(next_states).gather(-1, best_actions).squeeze(-1)
+            not_done = torch.from_numpy(~dones).float()
+            targets = torch.from_numpy(rewards.T.copy()) + not_done * DISCOUNT_FACTOR * next_values
+
+        self.optimizer.zero_grad()
+        self.qnet.train()
+        states = torch.from_numpy(states.astype(np.float32)).expand(heads, -1, -1)
+        index = torch.from_numpy(actions.astype(np.int64)).expand(heads, -1).unsqueeze(-1)
+        q = self.qnet(states).gather(-1, index).squeeze(-1)
+        # 性格ごとの平均二乗誤差の和 (各性格の勾配は別々に学習したときと同じ)
+        loss = ((q - targets) ** 2).mean(dim=1).sum()
+        loss.backward()
+        self.optimizer.step()
+        self.qnet.eval()
+
+        if self.train_t % UPDATE_TARGET_EVERY == 0:
+            self.target_qnet = copy.deepcopy(self.qnet)
+        self.train_t += 1
+        return loss.item()
+
+
+def train_multi_head(config_files, num_episodes=NUM_EPISODES, evaluate_every=EVALUATE_EVERY,
+                     eval_games=EVAL_GAMES, games_per_rollout=GAMES_PER_ROLLOUT, seed=None,
+                     save_dir=SAVE_DIR):
+    """config_files の全性格を1つの経験の流れから同時に学習する"""
+    from train_all import personality_from_config
+
+    names = [personality_from_config(path) for path in config_files]
+    reward_tables = [compile_reward_config(load_reward_config(path)) for path in config_files]
+    os.makedirs(save_dir, exist_ok=True)
+    log_paths = {name: os.path.join(save_dir, f'performance_{name}.csv') for name in names}
+
+    seeds = np.random.SeedSequence(seed).spawn(3)
+    torch.manual_seed(int(seeds[0].generate_state(1)[0]))
+    random.seed(int(seeds[1].generate_state(1)[0]))  # リプレイのサンプリング (random.sample)
+    rng = np.random.default_rng(seeds[2])
+    env = BatchBlackjackEnv(games_per_rollout, seed=rng.integers(2 ** 32))
+
+    model = MultiHeadDQN(len(names))
+    print(f"Start multi-head training ({', '.join(names)})...")
+
+    episode = 0
+    next_eval = 0
+    while episode < num_episodes:
+        if episode >= next_eval:
+            policies = {name: NumpyPolicy.from_state_dict(
+                            {k: v.numpy() for k, v in model.qnet.head_state_dict(head).items()})
+                        for head, name in enumerate(names)}
+            # train_and_save の tournament と同じく平均払い戻し (全性格が同じデッキで対戦する)
+            results = evaluate_models(policies, eval_games, seed=EVAL_SEED)
+            for res in results:
+                with open(log_paths[res['name']], 'a', newline='') as f:
+                    csv.writer(f).writerow([episode, res['mean_payoff']])
+            print(f"Episode: {episode}, " + ', '.join(f"{res['name']}: {res['mean_payoff']:.4f}" for res in results))
+            next_eval += evaluate_every
+
+        heads = (episode + np.arange(games_per_rollout)) % len(names)
+        data = rollout(env, lambda obs, soft: model.act(obs, heads[env.active], rng))
+        states, actions, next_states, dones, games = rollout_transitions(data)
+
+        # 同じエピソードの報酬を全性格の設定で付け直す (P, N) -> 遷移ごとの (N遷移, P)
+        rewards = np.stack([batch_rewards(table, env.payoffs, env.player_score) for table in reward_tables], axis=1)
+        model.feed(states, actions, rewards[games].astype(np.float32), next_states, dones)
+        episode += games_per_rollout
+
+    for head, name in enumerate(names):
+        model_path = os.path.join(save_dir, f'model_{name}.pth')
+        torch.save(model.qnet.head_state_dict(head), model_path)
+        print(f"Model saved to {model_path}")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全性格を1つの経験の流れから同時に学習する')
+    parser.add_argument('--episodes', type=int, default=NUM_EPISODES)
+    parser.add_argument('--evaluate-every', type=int, default=EVALUATE_EVERY)
+    parser.add_argument('--eval-games', type=int, default=EVAL_GAMES)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--save-dir', default=SAVE_DIR)
+    args = parser.parse_args()
+
+    config_files = sorted(glob.glob(os.path.join(CONFIG_DIR, 'config_*.csv')))
+    if not config_files:
+        print(f"Error: No config files found in {CONFIG_DIR}")
+        return
+    train_multi_head(config_files, args.episodes, args.evaluate_every, args.eval_games,
+                     seed=args.seed, save_dir=args.save_dir)
+
+
+if __name__ == '__main__':
+    main()
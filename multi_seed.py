@@ -0,0 +1,238 @@
+import os
+import csv
+import glob
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sweep import read_curve, rolling_mean
+
+# ---------------------------------------------------------
+# 複数シードでの学習と学習曲線の集計
+# ---------------------------------------------------------
+# 1つの報酬設定を S 個のシードで並列に学習し、シードごとのばらつきを見えるようにする。
+# シードは --base-seed から SeedSequence.spawn で作るので、同じコマンドなら同じ結果になる
+# (各学習の中では train_and_save.rng_seeds で env / torch / numpy 用にさらに分ける)。
+#
+# 使い方:
+#   python multi_seed.py --seeds 5 --workers 5
+#   python multi_seed.py --seeds 8 --learner tabular --config personality/config_normal.csv
+#
+# 保存形式 (SAVE_DIR/seeds/<性格>/):
+#   seed_<k>/                   シード k の学習の出力 (performance_<性格>.csv, model_<性格>.*, train.log)
+#   seeds.json                  シードの値と、シードごとの最終評価・選ばれたシード
+#   curve_<性格>.csv            エピソードごとの平均・標準偏差・信頼区間 (全シードで評価が揃った範囲)
+#   curve_<性格>.png            その図
+# 最終評価が最も良いシードのモデルは SAVE_DIR/model_<性格>.* にコピーする
+# (show_result.py などはこれまで通りそれを読む)。
+
+CONFIG_DIR = 'personality'
+SAVE_DIR = 'experiments/blackjack_custom_reward'
+NUM_SEEDS = 5
+BASE_SEED = 42
+WINDOW = 5  # 最終評価 (最後の評価の移動平均) の幅
+
+# 自由度 1〜30 の t 分布の 97.5% 点 (95% 信頼区間用)。それ以上は正規分布で近似する
+T_975 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+         2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def seed_values(base_seed, num_seeds):
+    """base_seed から互いに独立したシードを num_seeds 個作る"""
+    children = np.random.SeedSequence(base_seed).spawn(num_seeds)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def seed_dir(save_dir, personality, k):
+    return os.path.join(save_dir, 'seeds', personality, f'seed_{k}')
+
+
+# ---------------------------------------------------------
+# 学習曲線の集計
+# ---------------------------------------------------------
+def aggregate_curves(curves):
+    """シードごとの (episodes, results) を、全シードに評価があるエピソードで揃えて集計する
+
+    Returns:
+        dict: 'episode', 'mean', 'std', 'low', 'high' (95% 信頼区間) の配列と、シード数 'n'
+    """
+    common = None
+    for episodes, _ in curves:
+        common = set(episodes.tolist()) if common is None else common & set(episodes.tolist())
+    episodes = np.array(sorted(common or []), dtype=np.int64)
+    values = np.array([[dict(zip(eps.tolist(), res.tolist()))[e] for e in episodes] for eps, res in curves])
+
+    n = len(curves)
+    mean = values.mean(axis=0) if n else np.zeros(0)
+    std = values.std(axis=0, ddof=1) if n > 1 else np.zeros_like(mean)
+    t = T_975[n - 2] if 2 <= n <= len(T_975) + 1 else 1.96
+    half = t * std / np.sqrt(max(n, 1))
+    return {'episode': episodes, 'mean': mean, 'std': std, 'low': mean - half, 'high': mean + half, 'n': n}
+
+
+def write_curve(path, curve):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['episode', 'mean', 'std', 'low', 'high', 'seeds'])
+        for i, episode in enumerate(curve['episode']):
+            writer.writerow([int(episode), curve['mean'][i], curve['std'][i], curve['low'][i], curve['high'][i],
+                             curve['n']])
+
+
+def plot_curve(path, personality, curves, curve):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for episodes, results in curves:
+        ax.plot(episodes, results, color='gray', alpha=0.3, linewidth=0.8)
+    ax.plot(curve['episode'], curve['mean'], color='tab:blue', label=f"mean of {curve['n']} seeds")
+    ax.fill_between(curve['episode'], curve['low'], curve['high'], color='tab:blue', alpha=0.2, label='95% CI')
+    ax.set_title(f'Learning Curve: {personality}')
+    ax.set_xlabel('Episode')
+    ax.set_ylabel('Win Rate')
+    ax.legend()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def final_score(results, window=WINDOW):
+    """最後の評価の移動平均 (評価がなければ -inf)"""
+    smoothed = rolling_mean(results, window)
+    return float(smoothed[-1]) if len(smoothed) else -np.inf
+
+
+def collect(save_dir, personality, seeds, window=WINDOW):
+    """シードごとの結果を集計し、最良のシードのモデルを SAVE_DIR/model_<性格>.* にコピーする"""
+    base = os.path.join(save_dir, 'seeds', personality)
+    curves, runs = [], []
+    for k, seed in enumerate(seeds):
+        run_dir = seed_dir(save_dir, personality, k)
+        episodes, results = read_curve(os.path.join(run_dir, f'performance_{personality}.csv'))
+        models = glob.glob(os.path.join(run_dir, f'model_{personality}.*'))
+        curves.append((episodes, results))
+        runs.append({'seed_index': k, 'seed': seed, 'final': final_score(results, window),
+                     'model': max(models, key=os.path.getmtime) if models else None})
+
+    curve = aggregate_curves(curves)
+    curve_path = os.path.join(base, f'curve_{personality}.csv')
+    write_curve(curve_path, curve)
+    plot_curve(os.path.join(base, f'curve_{personality}.png'), personality, curves, curve)
+
+    finished = [run for run in runs if run['model'] is not None]
+    best = max(finished, key=lambda run: run['final']) if finished else None
+    if best is not None:
+        export_path = os.path.join(save_dir, os.path.basename(best['model']))
+        shutil.copy2(best['model'], export_path)
+        best['export'] = export_path
+
+    finals = np.array([run['final'] for run in runs if np.isfinite(run['final'])])
+    summary = {
+        'personality': personality,
+        'runs': runs,
+        'best_seed_index': best['seed_index'] if best is not None else None,
+        'final_mean': float(finals.mean()) if len(finals) else None,
+        'final_std': float(finals.std(ddof=1)) if len(finals) > 1 else None,
+        'curve': curve_path,
+    }
+    with open(os.path.join(base, 'seeds.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+# ---------------------------------------------------------
+# 実行
+# ---------------------------------------------------------
+def run_seeds(config_files, num_seeds=NUM_SEEDS, base_seed=BASE_SEED, workers=1, torch_threads=1,
+              learner='dqn', train_kwargs=None, save_dir=SAVE_DIR):
+    """全設定 x 全シードをプロセスプールで学習し、設定ごとに集計する"""
+    from train_all import personality_from_config, _init_worker, _train_worker
+
+    seeds = seed_values(base_seed, num_seeds)
+    jobs = []
+    for config_path in config_files:
+        personality = personality_from_config(config_path)
+        for k, seed in enumerate(seeds):
+            run_dir = seed_dir(save_dir, personality, k)
+            os.makedirs(run_dir, exist_ok=True)
+            # 前回の評価が残っていると追記されてしまうので消しておく
+            log_path = os.path.join(run_dir, f'performance_{personality}.csv')
+            if os.path.exists(log_path) and not (train_kwargs or {}).get('resume'):
+                os.remove(log_path)
+            kwargs = dict(train_kwargs or {}, save_dir=run_dir, seed=seed)
+            jobs.append((config_path, personality, os.path.join(run_dir, 'train.log'), learner, kwargs))
+
+    print(f"Training {len(config_files)} personalities x {num_seeds} seeds with {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(torch_threads,)) as executor:
+        futures = [executor.submit(_train_worker, *job) for job in jobs]
+        for future in as_completed(futures):
+            res = future.result()
+            print(f"  [{res['status']}] {res['name']} ({res['time']:.1f}s) -> {res['log']}")
+
+    summaries = []
+    for config_path in config_files:
+        summary = collect(save_dir, personality_from_config(config_path), seeds)
+        summaries.append(summary)
+    return summaries
+
+
+def print_summary(summaries):
+    print("\n##########################################")
+    print(" MULTI-SEED SUMMARY (final win rate)")
+    print("##########################################")
+    print(f"{'Personality':<15} {'Mean':>8} {'Std':>8} {'Best':>8}  Seeds")
+    print("-" * 60)
+    for summary in summaries:
+        finals = [run['final'] for run in summary['runs']]
+        best = summary['best_seed_index']
+        mean = f"{summary['final_mean']:.4f}" if summary['final_mean'] is not None else '-'
+        std = f"{summary['final_std']:.4f}" if summary['final_std'] is not None else '-'
+        best_text = f"{finals[best]:.4f}" if best is not None else '-'
+        print(f"{summary['personality']:<15} {mean:>8} {std:>8} {best_text:>8}  "
+              + ' '.join(f"{value:.3f}" for value in finals))
+        if best is not None:
+            print(f"    best: seed_{best} -> {summary['runs'][best]['export']}")
+    print("##########################################")
+
+
+def main():
+    from train_all import LEARNERS
+
+    parser = argparse.ArgumentParser(description='各報酬設定を複数のシードで並列に学習し、学習曲線を集計する')
+    parser.add_argument('--seeds', type=int, default=NUM_SEEDS, help='設定ごとのシード数')
+    parser.add_argument('--base-seed', type=int, default=BASE_SEED, help='シードを作る元のシード')
+    parser.add_argument('--config', action='append', default=None,
+                        help='学習する設定ファイル (省略時は personality/config_*.csv すべて)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='並列に学習するプロセス数')
+    parser.add_argument('--torch-threads', type=int, default=1, help='各ワーカーが使う torch のスレッド数')
+    parser.add_argument('--learner', choices=sorted(LEARNERS), default='dqn')
+    parser.add_argument('--episodes', type=int, default=None, help='学習エピソード数 (省略時は学習方法の既定値)')
+    parser.add_argument('--eval-games', type=int, default=None, help='1回の評価で対戦するゲーム数')
+    parser.add_argument('--save-dir', default=SAVE_DIR)
+    args = parser.parse_args()
+
+    config_files = args.config or sorted(glob.glob(os.path.join(CONFIG_DIR, 'config_*.csv')))
+    if not config_files:
+        print(f"Error: No config files found in {CONFIG_DIR}")
+        return
+
+    train_kwargs = {}
+    if args.episodes is not None:
+        train_kwargs['num_episodes'] = args.episodes
+    if args.eval_games is not None:
+        train_kwargs['eval_games'] = args.eval_games
+
+    start = time.time()
+    summaries = run_seeds(config_files, args.seeds, args.base_seed, args.workers, args.torch_threads,
+                          args.learner, train_kwargs, args.save_dir)
+    print_summary(summaries)
+    print(f"Total wall time: {time.time() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
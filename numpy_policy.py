@@ -0,0 +1,134 @@
+import os
+import glob
+import argparse
+import numpy as np
+
+# ---------------------------------------------------------
+# torch を使わない推論
+# ---------------------------------------------------------
+# DQNAgent の Q-net (BatchNorm -> Linear -> Tanh -> Linear -> Tanh -> Linear) を NumPy の行列演算だけで計算する。
+# export_model で model_<性格>.pth を model_<性格>.npz (kind='mlp') に変換しておけば、
+# policies.find_models は新しい方の .npz を選ぶので、評価・可視化のスクリプトは torch を読み込まずに動く。
+#
+# 保存形式 (.npz):
+#   kind            'mlp'
+#   num_layers      Linear の数
+#   w<i>, b<i>      i 番目の Linear の重みとバイアス (float32)。BatchNorm (評価モード) は最初の Linear に畳み込む
+#   quantized       True なら w<i> は int8 で、行ごとのスケール w<i>_scale (float32) を掛けて戻す
+
+BN_PREFIX = 'fc_layers.1.'  # EstimatorNetwork の BatchNorm1d
+
+
+def fold_state_dict(state_dict):
+    """Q-net の state_dict を [(W, b), ...] (float32) にする
+
+    評価モードの BatchNorm は y = (x - mean) / sqrt(var + eps) * gamma + beta なので、
+    x の各成分への拡大と平行移動として次の Linear に含められる。
+    """
+    state_dict = {k: np.asarray(v, dtype=np.float64) for k, v in state_dict.items()}
+    scale = state_dict[BN_PREFIX + 'weight'] / np.sqrt(state_dict[BN_PREFIX + 'running_var'] + 1e-5)
+    shift = state_dict[BN_PREFIX + 'bias'] - state_dict[BN_PREFIX + 'running_mean'] * scale
+
+    linear_keys = sorted((k[:-len('.weight')] for k in state_dict
+                          if k.endswith('.weight') and not k.startswith(BN_PREFIX)),
+                         key=lambda k: int(k.split('.')[1]))
+    layers = []
+    for i, key in enumerate(linear_keys):
+        w, b = state_dict[key + '.weight'], state_dict[key + '.bias']
+        if i == 0:
+            b = b + w @ shift
+            w = w * scale
+        layers.append((w.astype(np.float32), b.astype(np.float32)))
+    return layers
+
+
+def quantize(w):
+    """出力ごと (行ごと) の対称 int8 量子化。(int8 の重み, スケール) を返す"""
+    scale = np.abs(w).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    return np.round(w / scale[:, None]).astype(np.int8), scale.astype(np.float32)
+
+
+def export_model(model_path, out_path=None, quantized=False):
+    """model_<性格>.pth を NumPy で読める .npz に変換する (変換にだけ torch が要る)"""
+    import torch
+
+    if out_path is None:
+        out_path = os.path.splitext(model_path)[0] + '.npz'
+    state_dict = {k: v.cpu().numpy() for k, v in torch.load(model_path).items()}
+    arrays = {'kind': 'mlp', 'quantized': quantized}
+    layers = fold_state_dict(state_dict)
+    arrays['num_layers'] = len(layers)
+    for i, (w, b) in enumerate(layers):
+        if quantized:
+            arrays[f'w{i}'], arrays[f'w{i}_scale'] = quantize(w)
+        else:
+            arrays[f'w{i}'] = w
+        arrays[f'b{i}'] = b
+    np.savez(out_path, **arrays)
+    return out_path
+
+
+class NumpyPolicy:
+    """export_model で変換した Q-net を NumPy で計算するポリシー (policies.TorchPolicy と同じ使い方)"""
+
+    def __init__(self, layers):
+        # 行列積を x @ W にするため転置して連続した配列で持つ
+        self.layers = [(np.ascontiguousarray(w.T), b) for w, b in layers]
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        layers = []
+        for i in range(int(data['num_layers'])):
+            w = data[f'w{i}']
+            if bool(data['quantized']):
+                w = w.astype(np.float32) * data[f'w{i}_scale'][:, None]
+            layers.append((w.astype(np.float32), data[f'b{i}'].astype(np.float32)))
+        return cls(layers)
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        return cls(fold_state_dict(state_dict))
+
+    def q_values(self, obs, soft=None):
+        x = np.asarray(obs, dtype=np.float32).reshape(-1, self.layers[0][0].shape[0])
+        last = len(self.layers) - 1
+        for i, (w, b) in enumerate(self.layers):
+            x = x @ w
+            x += b
+            if i < last:
+                np.tanh(x, out=x)
+        return x
+
+    def eval_step(self, state):
+        """DQNAgent.eval_step と同じ (action, info) を返す (合法でない行動は選ばない)"""
+        q_values = self.q_values(state['obs'])[0]
+        legal_actions = list(state['legal_actions'].keys())
+        masked = np.full(len(q_values), -np.inf)
+        masked[legal_actions] = q_values[legal_actions]
+        best_action = int(np.argmax(masked))
+
+        info = {}
+        info['values'] = {state['raw_legal_actions'][i]: float(q_values[legal_actions[i]])
+                          for i in range(len(legal_actions))}
+        return best_action, info
+
+
+def main():
+    parser = argparse.ArgumentParser(description='model_*.pth を torch なしで読める model_*.npz に変換する')
+    parser.add_argument('--save-dir', default='experiments/blackjack_custom_reward', help='モデルがある場所')
+    parser.add_argument('--quantize', action='store_true', help='重みを int8 で保存する (ファイルが約1/4になる)')
+    args = parser.parse_args()
+
+    model_files = sorted(glob.glob(os.path.join(args.save_dir, 'model_*.pth')))
+    if not model_files:
+        print(f"Error: No models found in {args.save_dir}")
+        return
+    for model_path in model_files:
+        out_path = export_model(model_path, quantized=args.quantize)
+        print(f"{model_path} -> {out_path} ({os.path.getsize(out_path)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
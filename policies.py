@@ -0,0 +1,83 @@
+import os
+import glob
+import numpy as np
+
+# ---------------------------------------------------------
+# 学習済みモデルの読み込み
+# ---------------------------------------------------------
+# どのポリシーも次の2つを持つ:
+#   q_values(obs, soft=None) : 観測のバッチ (N, 2) -> Q値 (N, 2)
+#   eval_step(state)         : DQNAgent.eval_step と同じ (action, info) を返す
+# soft は手札がソフトかどうかの配列 (観測に含まれないので、使うポリシーだけが参照する)
+
+MLP_LAYERS = [128, 128] # 学習時と同じネットワーク構造
+
+
+def personality_from_model(model_path):
+    # ファイル名から性格名を取得 (例: model_aggressive.pth -> aggressive)
+    file_name = os.path.basename(model_path)
+    return os.path.splitext(file_name)[0].replace('model_', '', 1)
+
+
+def find_models(save_dir):
+    """save_dir 内の model_*.pth / model_*.npz を取得する
+
+    同じ性格のファイルが複数ある場合は更新日時が新しい方を使う。
+    """
+    latest = {}
+    for pattern in ['model_*.pth', 'model_*.npz']:
+        for model_path in glob.glob(os.path.join(save_dir, pattern)):
+            name = personality_from_model(model_path)
+            if name not in latest or os.path.getmtime(model_path) > os.path.getmtime(latest[name]):
+                latest[name] = model_path
+    return sorted(latest.values())
+
+
+class TorchPolicy:
+    """torch で保存した DQNAgent の Q-net をそのまま使うポリシー
+
+    model_path の代わりに state_dict (テンソルか NumPy 配列の辞書) からも作れる。
+    """
+
+    def __init__(self, model_path=None, state_dict=None, mlp_layers=MLP_LAYERS):
+        import torch
+        from rlcard.agents import DQNAgent
+
+        self.agent = DQNAgent(
+            num_actions=2,
+            state_shape=[2],
+            mlp_layers=mlp_layers,
+            device=torch.device("cpu")
+        )
+        if model_path is not None:
+            state_dict = torch.load(model_path)
+        if state_dict is not None:
+            self.load_state_dict(state_dict)
+
+    def load_state_dict(self, state_dict):
+        import torch
+        state_dict = {k: torch.as_tensor(v) for k, v in state_dict.items()}
+        self.agent.q_estimator.qnet.load_state_dict(state_dict)
+
+    def q_values(self, obs, soft=None):
+        return self.agent.q_estimator.predict_nograd(np.asarray(obs))
+
+    def eval_step(self, state):
+        return self.agent.eval_step(state)
+
+
+def load_policy(model_path, server=None):
+    """model_path のモデルを読み込む (server を指定したら policy_server.py に問い合わせるクライアントを返す)"""
+    if server is not None:
+        from policy_server import RemotePolicy
+        return RemotePolicy(server, personality_from_model(model_path))
+    if model_path.endswith('.npz'):
+        kind = str(np.load(model_path)['kind'])
+        if kind == 'tabular':
+            from tabular_agent import TabularAgent
+            return TabularAgent.load(model_path)
+        if kind == 'mlp':
+            from numpy_policy import NumpyPolicy
+            return NumpyPolicy.load(model_path)
+        raise ValueError(f"Unknown model kind '{kind}' in {model_path}")
+    return TorchPolicy(model_path)
@@ -0,0 +1,435 @@
+import os
+import io
+import json
+import time
+import queue
+import argparse
+import threading
+import http.client
+import numpy as np
+from urllib.parse import urlsplit
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from policies import find_models, load_policy, personality_from_model
+from numpy_policy import NumpyPolicy
+
+# ---------------------------------------------------------
+# ローカルの推論サーバー
+# ---------------------------------------------------------
+# save_dir の全モデルを1回だけ読み込み、localhost の HTTP で Q値を返す。
+# 同時に届いたリクエストは性格ごとにまとめて1回の q_values (forward) で計算する (マイクロバッチ)。
+# モデルのファイルが更新されたら読み直すので、学習中のモデルもサーバーを止めずに使える。
+#
+# エンドポイント:
+#   POST /q/<性格>   本文は np.savez の obs (N, 2) と soft (N,) -> np.save の Q値 (N, 2)
+#                    (Content-Type: application/json なら {"obs": [...], "soft": [...]} -> {"q_values": [...]})
+#   GET  /models     読み込んでいるモデルの一覧
+#   GET  /stats      リクエスト数・バッチの大きさ・レイテンシ・スループット
+#
+# 使い方:
+#   python policy_server.py                       # サーバーを起動
+#   show_result.py などの POLICY_SERVER = 'http://127.0.0.1:8765' にするとクライアントとして動く
+
+HOST = '127.0.0.1'
+PORT = 8765
+MAX_WAIT = 0.002          # 最初のリクエストが来てから、まとめる相手を待つ時間 (秒)
+MAX_BATCH_ROWS = 65536    # 1回の forward にまとめる観測数の上限
+RELOAD_INTERVAL = 2.0     # モデルファイルの更新を調べる間隔 (秒)
+RELOAD_SETTLE = 0.5       # 書き込み途中を読まないよう、更新からこの秒数たったファイルだけ読む
+LATENCY_WINDOW = 10000    # レイテンシの分位点を計算する直近のリクエスト数
+
+
+# ---------------------------------------------------------
+# 統計
+# ---------------------------------------------------------
+class ServerStats:
+    """リクエストとバッチの統計 (複数スレッドから更新される)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.reloads = 0
+        self.per_model = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record_batch(self, name, num_requests, num_rows):
+        with self.lock:
+            self.batches += 1
+            self.requests += num_requests
+            self.rows += num_rows
+            self.per_model[name] = self.per_model.get(name, 0) + num_requests
+
+    def record_latency(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def record_reload(self):
+        with self.lock:
+            self.reloads += 1
+
+    def snapshot(self):
+        with self.lock:
+            uptime = time.time() - self.started
+            latencies = np.array(self.latencies) * 1000.0
+            result = {
+                'uptime': uptime,
+                'requests': self.requests,
+                'rows': self.rows,
+                'batches': self.batches,
+                'errors': self.errors,
+                'reloads': self.reloads,
+                'requests_per_batch': self.requests / self.batches if self.batches else 0.0,
+                'requests_per_sec': self.requests / uptime,
+                'rows_per_sec': self.rows / uptime,
+                'per_model': dict(self.per_model),
+            }
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            result['latency_ms'] = {'p50': p50, 'p95': p95, 'p99': p99, 'max': float(latencies.max())}
+        return result
+
+
+def format_stats(stats):
+    line = (f"{stats['requests']} requests ({stats['requests_per_sec']:.1f}/s, "
+            f"{stats['rows_per_sec']:.0f} obs/s), {stats['requests_per_batch']:.2f} requests/batch, "
+            f"{stats['reloads']} reloads, {stats['errors']} errors")
+    if 'latency_ms' in stats:
+        lat = stats['latency_ms']
+        line += f", latency p50 {lat['p50']:.2f} ms / p99 {lat['p99']:.2f} ms"
+    return line
+
+
+# ---------------------------------------------------------
+# モデルの管理とマイクロバッチ
+# ---------------------------------------------------------
+class _Request:
+    def __init__(self, name, obs, soft):
+        self.name = name
+        self.obs = obs
+        self.soft = soft
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PolicyServer:
+    """save_dir のモデルを持ち、届いたリクエストをまとめて計算する"""
+
+    def __init__(self, save_dir, max_wait=MAX_WAIT, max_batch_rows=MAX_BATCH_ROWS,
+                 reload_interval=RELOAD_INTERVAL):
+        self.save_dir = save_dir
+        self.max_wait = max_wait
+        self.max_batch_rows = max_batch_rows
+        self.reload_interval = reload_interval
+        self.stats = ServerStats()
+        self.models = {}  # 性格 -> {'policy', 'path', 'mtime', 'version', 'loaded_at'}
+        self.models_lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.stop_event = threading.Event()
+        self.reload()
+        self.threads = [threading.Thread(target=self._dispatch, daemon=True),
+                        threading.Thread(target=self._watch, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    # --- ホットリロード ---
+    def reload(self):
+        """更新されたモデルファイルを読み直す (読み込みに失敗したら古いモデルのまま次の機会に再挑戦する)"""
+        now = time.time()
+        for model_path in find_models(self.save_dir):
+            name = personality_from_model(model_path)
+            try:
+                mtime = os.path.getmtime(model_path)
+            except OSError:
+                continue
+            current = self.models.get(name)
+            if current is not None and current['path'] == model_path and current['mtime'] == mtime:
+                continue
+            if current is not None and now - mtime < RELOAD_SETTLE:
+                continue
+            try:
+                policy = load_policy(model_path)
+            except Exception as e:
+                print(f"Error loading {model_path}: {e}")
+                continue
+            with self.models_lock:
+                version = current['version'] + 1 if current is not None else 1
+                self.models[name] = {'policy': policy, 'path': model_path, 'mtime': mtime,
+                                     'version': version, 'loaded_at': now}
+            if current is not None:
+                self.stats.record_reload()
+            print(f"Loaded {name} from {model_path} (version {version})")
+
+    def _watch(self):
+        while not self.stop_event.wait(self.reload_interval):
+            self.reload()
+
+    def model_info(self):
+        with self.models_lock:
+            return {name: {k: v for k, v in m.items() if k != 'policy'} for name, m in self.models.items()}
+
+    # --- マイクロバッチ ---
+    def q_values(self, name, obs, soft):
+        """リクエストを列に入れ、まとめて計算されるのを待つ"""
+        start = time.perf_counter()
+        request = _Request(name, obs, soft)
+        self.requests.put(request)
+        request.done.wait()
+        self.stats.record_latency(time.perf_counter() - start)
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        """最初の1件から max_wait の間に届いたリクエストを集める"""
+        first = self.requests.get()
+        batch = [first]
+        rows = len(first.obs)
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch_rows:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            rows += len(request.obs)
+        return batch
+
+    def _dispatch(self):
+        # forward はこのスレッドだけが行う (torch のモデルを複数スレッドから同時に呼ばない)
+        while not self.stop_event.is_set():
+            batch = self._collect()
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.name, []).append(request)
+            for name, group in groups.items():
+                self._run_group(name, group)
+
+    def _run_group(self, name, group):
+        with self.models_lock:
+            model = self.models.get(name)
+        try:
+            if model is None:
+                raise KeyError(f"Unknown personality '{name}'")
+            obs = np.concatenate([r.obs for r in group])
+            soft = np.concatenate([r.soft for r in group])
+            q = np.asarray(model['policy'].q_values(obs, soft=soft), dtype=np.float32)
+            self.stats.record_batch(name, len(group), len(obs))
+            pos = 0
+            for request in group:
+                request.result = q[pos:pos + len(request.obs)]
+                pos += len(request.obs)
+        except Exception as e:
+            self.stats.record_error()
+            for request in group:
+                request.error = e
+        for request in group:
+            request.done.set()
+
+    def close(self):
+        self.stop_event.set()
+        # 受付待ちの _collect を起こす
+        self.requests.put(_Request(None, np.zeros((0, 2)), np.zeros(0, dtype=bool)))
+
+
+# ---------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------
+def encode_arrays(**arrays):
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode_arrays(data):
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive で接続を使い回す
+    server_version = 'PolicyServer'
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, obj):
+        self._send(status, json.dumps(obj).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        policy_server = self.server.policy_server
+        if self.path == '/models':
+            self._send_json(200, {'models': policy_server.model_info()})
+        elif self.path == '/stats':
+            self._send_json(200, policy_server.stats.snapshot())
+        else:
+            self._send_json(404, {'error': f'Not found: {self.path}'})
+
+    def do_POST(self):
+        policy_server = self.server.policy_server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/q/'):
+            self._send_json(404, {'error': f'Not found: {self.path}'})
+            return
+        name = self.path[len('/q/'):]
+        as_json = self.headers.get('Content-Type', '').startswith('application/json')
+        try:
+            if as_json:
+                data = json.loads(body)
+                obs = np.asarray(data['obs'], dtype=np.float32).reshape(-1, 2)
+                soft = np.asarray(data.get('soft', np.zeros(len(obs))), dtype=bool)
+            else:
+                data = decode_arrays(body)
+                obs, soft = data['obs'].reshape(-1, 2), data['soft']
+        except Exception as e:
+            self._send_json(400, {'error': f'Bad request: {e}'})
+            return
+
+        try:
+            q = policy_server.q_values(name, obs, soft)
+        except KeyError as e:
+            self._send_json(404, {'error': str(e.args[0])})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+
+        if as_json:
+            self._send_json(200, {'q_values': q.tolist()})
+        else:
+            buffer = io.BytesIO()
+            np.save(buffer, q, allow_pickle=False)
+            self._send(200, buffer.getvalue(), 'application/octet-stream')
+
+    def log_message(self, format, *args):
+        pass  # リクエストごとのログは出さない (/stats で見る)
+
+
+def serve(save_dir, host=HOST, port=PORT, max_wait=MAX_WAIT, reload_interval=RELOAD_INTERVAL, stats_every=60.0):
+    policy_server = PolicyServer(save_dir, max_wait=max_wait, reload_interval=reload_interval)
+    if not policy_server.models:
+        print(f"Warning: No models found in {save_dir} yet (waiting for files)")
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.policy_server = policy_server
+
+    def report():
+        while not policy_server.stop_event.wait(stats_every):
+            print(format_stats(policy_server.stats.snapshot()))
+
+    if stats_every:
+        threading.Thread(target=report, daemon=True).start()
+    print(f"Serving {len(policy_server.models)} models from {save_dir} on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        policy_server.close()
+        print(format_stats(policy_server.stats.snapshot()))
+
+
+# ---------------------------------------------------------
+# クライアント
+# ---------------------------------------------------------
+class _Connection:
+    """keep-alive の HTTP 接続 (切れていたら1回だけ繋ぎ直す)"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        with self.lock:
+            for attempt in range(2):
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                try:
+                    self.conn.request(method, path, body=body, headers=headers or {})
+                    response = self.conn.getresponse()
+                    return response.status, response.getheader('Content-Type', ''), response.read()
+                except (http.client.HTTPException, ConnectionError):
+                    self.conn.close()
+                    self.conn = None
+                    if attempt == 1:
+                        raise
+
+
+def _check(status, content_type, data):
+    if status != 200:
+        message = json.loads(data)['error'] if content_type.startswith('application/json') else data[:200]
+        raise RuntimeError(f"Policy server error ({status}): {message}")
+
+
+def remote_models(url):
+    """サーバーが読み込んでいるモデルの一覧 {性格: {'path', 'mtime', 'version', 'loaded_at'}}"""
+    status, content_type, data = _Connection(url).request('GET', '/models')
+    _check(status, content_type, data)
+    return json.loads(data)['models']
+
+
+def remote_stats(url):
+    status, content_type, data = _Connection(url).request('GET', '/stats')
+    _check(status, content_type, data)
+    return json.loads(data)
+
+
+class RemotePolicy:
+    """推論サーバーに Q値を問い合わせるポリシー (policies.TorchPolicy と同じ使い方)"""
+
+    def __init__(self, url, personality):
+        self.url = url
+        self.personality = personality
+        self.connection = _Connection(url)
+        # 読み込みエラーをその場で出すため、サーバーにモデルがあるか最初に確かめる
+        if personality not in remote_models(url):
+            raise KeyError(f"Policy server {url} has no model '{personality}'")
+
+    def q_values(self, obs, soft=None):
+        obs = np.asarray(obs, dtype=np.float32).reshape(-1, 2)
+        soft = np.zeros(len(obs), dtype=bool) if soft is None else np.asarray(soft, dtype=bool)
+        status, content_type, data = self.connection.request(
+            'POST', f'/q/{self.personality}', body=encode_arrays(obs=obs, soft=soft),
+            headers={'Content-Type': 'application/octet-stream'})
+        _check(status, content_type, data)
+        return np.load(io.BytesIO(data), allow_pickle=False)
+
+    # 合法手の扱いと info の形は NumpyPolicy と同じ
+    eval_step = NumpyPolicy.eval_step
+
+
+def main():
+    parser = argparse.ArgumentParser(description='学習済みモデルの Q値を localhost の HTTP で返す推論サーバー')
+    parser.add_argument('--save-dir', default='experiments/blackjack_custom_reward', help='モデルがある場所')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT * 1000,
+                        help='リクエストをまとめるために待つ時間 (ミリ秒)')
+    parser.add_argument('--reload-interval', type=float, default=RELOAD_INTERVAL,
+                        help='モデルファイルの更新を調べる間隔 (秒)')
+    parser.add_argument('--stats-every', type=float, default=60.0, help='統計を表示する間隔 (秒, 0 で表示しない)')
+    args = parser.parse_args()
+
+    serve(args.save_dir, args.host, args.port, max_wait=args.max_wait_ms / 1000,
+          reload_interval=args.reload_interval, stats_every=args.stats_every)
+
+
+if __name__ == '__main__':
+    main()
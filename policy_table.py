@@ -0,0 +1,43 @@
+import numpy as np
+
+# ---------------------------------------------------------
+# 戦略表の抽出
+# ---------------------------------------------------------
+# シミュレーションせずに、表の全マス (プレイヤー合計, ディーラーのアップカード, ソフトか)
+# の観測を直接作り、1回のバッチ推論で行動とQ値を求める
+
+# 行: プレイヤー (21〜12), 列: ディーラー (2〜A=11)  ※plot.py のヒートマップと同じ並び
+PLAYER_RANGE = range(21, 11, -1)
+DEALER_RANGE = range(2, 12)
+
+
+def cell_observations():
+    """表の全マスの観測 (hard の全マス -> soft の全マス の順) とソフトフラグを返す"""
+    players, dealers = np.meshgrid(list(PLAYER_RANGE), list(DEALER_RANGE), indexing='ij')
+    obs = np.stack([players.ravel(), dealers.ravel()], axis=1).astype(np.int64)
+    obs = np.concatenate([obs, obs])
+    n_cells = players.size
+    soft = np.concatenate([np.zeros(n_cells, dtype=bool), np.ones(n_cells, dtype=bool)])
+    return obs, soft
+
+
+def extract_policy(policy):
+    """ポリシーの Hard/Soft 戦略表を返す
+
+    Returns:
+        dict: 'hard' / 'soft' は行動 (0=Hit, 1=Stand) の (10, 10) 配列、
+              'hard_q' / 'soft_q' は Q値の (10, 10, 2) 配列
+    """
+    obs, soft = cell_observations()
+    q = np.asarray(policy.q_values(obs, soft=soft), dtype=np.float64)
+    shape = (len(PLAYER_RANGE), len(DEALER_RANGE))
+    n_cells = shape[0] * shape[1]
+
+    # DQNAgent.eval_step と同じく np.argmax (同点なら Hit)
+    actions = np.argmax(q, axis=1)
+    return {
+        'hard': actions[:n_cells].reshape(shape),
+        'soft': actions[n_cells:].reshape(shape),
+        'hard_q': q[:n_cells].reshape(shape + (2,)),
+        'soft_q': q[n_cells:].reshape(shape + (2,)),
+    }
@@ -0,0 +1,141 @@
+import os
+import sys
+import csv
+import json
+import time
+from contextlib import nullcontext
+
+# ---------------------------------------------------------
+# 学習ループの計測 (オプトイン)
+# ---------------------------------------------------------
+# with profiler.phase('env.step'): ... でフェーズごとの経過時間と呼び出し回数を、
+# profiler.count('transitions', n) で件数を記録する。
+# 無効時は NullProfiler を使い、phase() は使い回しの nullcontext を返すだけなのでほぼコストがない。
+
+_NULL_CONTEXT = nullcontext()
+
+
+def peak_memory_mb():
+    """このプロセスの最大常駐メモリ (MB)。resource がない環境 (Windows) では None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS は byte で返る
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class _Phase:
+    """1つのフェーズの合計時間と回数を貯めるコンテキストマネージャ"""
+    __slots__ = ('seconds', 'calls', '_start')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self._start
+        self.calls += 1
+        return False
+
+
+class Profiler:
+    """フェーズごとの時間・カウンタ・最大メモリを記録する"""
+
+    enabled = True
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+        self._end = None
+
+    def phase(self, name):
+        timer = self.phases.get(name)
+        if timer is None:
+            timer = self.phases[name] = _Phase()
+        return timer
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def stop(self):
+        self._end = time.perf_counter()
+
+    def report(self):
+        """計測結果を辞書にまとめる (カウンタは毎秒の値も付ける)"""
+        total = (self._end or time.perf_counter()) - self._start
+        phases = {
+            name: {
+                'seconds': timer.seconds,
+                'calls': timer.calls,
+                'share': timer.seconds / total if total > 0 else 0.0,
+                'us_per_call': timer.seconds / timer.calls * 1e6 if timer.calls else 0.0,
+            }
+            for name, timer in self.phases.items()
+        }
+        counters = {
+            name: {'count': value, 'per_second': value / total if total > 0 else 0.0}
+            for name, value in self.counters.items()
+        }
+        return {
+            'total_seconds': total,
+            'peak_memory_mb': peak_memory_mb(),
+            'phases': phases,
+            'counters': counters,
+        }
+
+    def save(self, save_dir, target_personality):
+        """profile_<性格>.json と profile_<性格>.csv を書き出してパスを返す"""
+        report = self.report()
+        json_path = os.path.join(save_dir, f'profile_{target_personality}.json')
+        csv_path = os.path.join(save_dir, f'profile_{target_personality}.csv')
+
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'name', 'value', 'calls_or_rate', 'share'])
+            for name, p in report['phases'].items():
+                writer.writerow(['phase', name, p['seconds'], p['calls'], p['share']])
+            for name, c in report['counters'].items():
+                writer.writerow(['counter', name, c['count'], c['per_second'], ''])
+            writer.writerow(['total', 'seconds', report['total_seconds'], '', ''])
+            if report['peak_memory_mb'] is not None:
+                writer.writerow(['memory', 'peak_mb', report['peak_memory_mb'], '', ''])
+        return json_path, csv_path
+
+    def summary(self):
+        """最後に表示する集計表"""
+        report = self.report()
+        lines = [f"{'phase':<16}{'seconds':>10}{'share':>8}{'calls':>10}{'us/call':>10}"]
+        for name, p in sorted(report['phases'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"{name:<16}{p['seconds']:>10.2f}{p['share']:>8.1%}{p['calls']:>10d}{p['us_per_call']:>10.1f}")
+        lines.append(f"{'total':<16}{report['total_seconds']:>10.2f}")
+        for name, c in report['counters'].items():
+            lines.append(f"{name:<16}{c['count']:>10d}  ({c['per_second']:.1f}/s)")
+        if report['peak_memory_mb'] is not None:
+            lines.append(f"peak memory: {report['peak_memory_mb']:.1f} MB")
+        return '\n'.join(lines)
+
+
+class NullProfiler:
+    """計測しないときの代わり (同じメソッドを持つが何もしない)"""
+
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_CONTEXT
+
+    def count(self, name, n=1):
+        pass
+
+    def stop(self):
+        pass
@@ -0,0 +1,178 @@
+import random
+import numpy as np
+
+# ---------------------------------------------------------
+# 配列のリングバッファによるリプレイメモリ
+# ---------------------------------------------------------
+# rlcard の Memory は遷移ごとに Transition (観測の配列2つ + Python の数値 + 合法手のリスト) を作って
+# リストに積むので、1遷移あたり数百バイトかかり、満杯になると pop(0) でリスト全体をずらす。
+# RingMemory は列ごとの配列を最初に確保し、観測は int8 で持つ (ブラックジャックの観測は 0〜31)。
+#
+# sample() は Memory.sample と同じ形を返すので DQNAgent.train はそのまま使える。
+# 古い順に並べたときの番号を random.sample で選ぶので、同じ乱数の状態なら Memory と同じ遷移が選ばれる。
+
+STATE_DTYPE = np.int8
+
+
+class RingMemory:
+    """DQNAgent.memory と差し替えられる、先に確保した配列のリングバッファ"""
+
+    def __init__(self, memory_size, batch_size, state_shape=(2,), num_actions=2, state_dtype=STATE_DTYPE,
+                 reward_shape=()):
+        self.memory_size = memory_size
+        self.batch_size = batch_size
+        self.num_actions = num_actions
+        self.states = np.zeros((memory_size, *state_shape), dtype=state_dtype)
+        self.next_states = np.zeros_like(self.states)
+        self.actions = np.zeros(memory_size, dtype=np.int8)
+        # reward_shape=(P,) なら1つの遷移に P 通りの報酬を持てる (multi_head.py)
+        self.rewards = np.zeros((memory_size, *reward_shape), dtype=np.float32)
+        self.dones = np.zeros(memory_size, dtype=bool)
+        self.legal = np.ones((memory_size, num_actions), dtype=bool)  # 次の状態の合法手
+        self.pos = 0  # 次に書き込む位置 (満杯なら一番古い遷移の位置)
+        self.size = 0
+        # DQNAgent.train に渡す合法手のリストは組み合わせごとに使い回す
+        self._legal_lists = {}
+        self._legal_bits = 1 << np.arange(num_actions)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.states, self.next_states, self.actions, self.rewards,
+                                      self.dones, self.legal))
+
+    def save(self, state, action, reward, next_state, legal_actions, done):
+        """Memory.save と同じ引数で1遷移を保存する"""
+        legal = np.zeros((1, self.num_actions), dtype=bool)
+        legal[0, list(legal_actions)] = True
+        self.save_batch(np.asarray(state)[None], [action], [reward], np.asarray(next_state)[None], [done], legal)
+
+    def save_batch(self, states, actions, rewards, next_states, dones, legal=None):
+        """複数の遷移を古い順にまとめて保存する (legal を省略したら全行動が合法)"""
+        n = len(actions)
+        if n > self.memory_size:
+            # 入りきらない古い方は、書いてすぐ上書きされるのと同じなので捨てる
+            drop = n - self.memory_size
+            states, actions, rewards = states[drop:], actions[drop:], rewards[drop:]
+            next_states, dones = next_states[drop:], dones[drop:]
+            legal = legal[drop:] if legal is not None else None
+            self.pos = (self.pos + drop) % self.memory_size
+            n = self.memory_size
+
+        end = self.pos + n
+        if end <= self.memory_size:
+            index = slice(self.pos, end)
+        else:
+            index = np.arange(self.pos, end) % self.memory_size
+        self.states[index] = states
+        self.next_states[index] = next_states
+        self.actions[index] = actions
+        self.rewards[index] = rewards
+        self.dones[index] = dones
+        self.legal[index] = True if legal is None else legal
+        self.pos = end % self.memory_size
+        self.size = min(self.size + n, self.memory_size)
+
+    def _legal_batch(self, index):
+        keys = self.legal[index] @ self._legal_bits
+        lists = []
+        for key in keys.tolist():
+            if key not in self._legal_lists:
+                self._legal_lists[key] = [a for a in range(self.num_actions) if key >> a & 1]
+            lists.append(self._legal_lists[key])
+        return lists
+
+    def sample(self):
+        """Memory.sample と同じ (states, actions, rewards, next_states, dones, legal_actions) を返す"""
+        index = np.array(random.sample(range(self.size), self.batch_size))
+        if self.size == self.memory_size:
+            # 一番古い遷移を 0 番として数える (Memory のリストと同じ並び)
+            index = (index + self.pos) % self.memory_size
+        return (self.states[index], self.actions[index], self.rewards[index],
+                self.next_states[index], self.dones[index], self._legal_batch(index))
+
+    def _ordered(self, array):
+        """保存されている遷移を古い順に並べた配列"""
+        if self.size < self.memory_size:
+            return array[:self.size]
+        return np.roll(array, -self.pos, axis=0)
+
+    def state_dict(self):
+        """チェックポイント用 (古い順に並べた配列)"""
+        return {
+            'memory_size': self.memory_size,
+            'states': self._ordered(self.states).copy(),
+            'next_states': self._ordered(self.next_states).copy(),
+            'actions': self._ordered(self.actions).copy(),
+            'rewards': self._ordered(self.rewards).copy(),
+            'dones': self._ordered(self.dones).copy(),
+            'legal': self._ordered(self.legal).copy(),
+        }
+
+    def load_state_dict(self, state):
+        self.pos = 0
+        self.size = 0
+        self.save_batch(state['states'], state['actions'], state['rewards'], state['next_states'],
+                        state['dones'], state['legal'])
+
+    def load_transitions(self, transitions):
+        """rlcard の Memory に入っていた Transition のリストを読み込む (古いチェックポイント用)"""
+        self.pos = 0
+        self.size = 0
+        for t in transitions:
+            self.save(t.state, t.action, t.reward, t.next_state, t.legal_actions, t.done)
+
+
+def use_ring_memory(agent, state_shape=(2,), state_dtype=STATE_DTYPE):
+    """DQNAgent のリプレイメモリを同じ大きさの RingMemory に差し替える"""
+    memory = agent.memory
+    agent.memory = RingMemory(memory.memory_size, memory.batch_size, state_shape, agent.num_actions, state_dtype)
+    return agent.memory
+
+
+# ---------------------------------------------------------
+# まとめて feed
+# ---------------------------------------------------------
+def episode_arrays(trajectory, final_state, reward, num_actions=2, state_dtype=STATE_DTYPE):
+    """rlcard の1エピソード [(state, action), ...] を遷移の配列にする (報酬は全ステップ同じ)
+
+    Returns:
+        tuple: feed_batch にそのまま渡せる (states, actions, rewards, next_states, dones, legal)
+    """
+    states = [s for s, _ in trajectory] + [final_state]
+    obs = np.array([s['obs'] for s in states], dtype=state_dtype)
+    n = len(trajectory)
+    actions = np.array([a for _, a in trajectory], dtype=np.int8)
+    rewards = np.full(n, reward, dtype=np.float32)
+    dones = np.zeros(n, dtype=bool)
+    dones[-1] = True
+    legal = np.zeros((n, num_actions), dtype=bool)
+    for i, s in enumerate(states[1:]):
+        legal[i, list(s['legal_actions'])] = True
+    return obs[:-1], actions, rewards, obs[1:], dones, legal
+
+
+def feed_batch(agent, states, actions, rewards, next_states, dones, legal=None):
+    """遷移ごとに agent.feed を呼ぶのと同じ学習を、配列のまままとめて保存しながら行う
+
+    agent.feed は1遷移ごとに total_t を進め、replay_memory_init_size 以降は train_every 回ごとに
+    agent.train を呼ぶ。ここでは次に学習が走る位置までをまとめて保存してから学習するので、
+    学習が見るメモリの中身と乱数の使い方は agent.feed と同じになる。
+    """
+    n = len(actions)
+    start = 0
+    while start < n:
+        # あと何遷移保存したら学習が走るか
+        t0 = agent.total_t - agent.replay_memory_init_size
+        k = max(1, -t0)
+        k += (-(t0 + k)) % agent.train_every
+        end = min(start + k, n)
+        agent.memory.save_batch(states[start:end], actions[start:end], rewards[start:end],
+                                next_states[start:end], dones[start:end],
+                                legal[start:end] if legal is not None else None)
+        agent.total_t += end - start
+        if end - start == k:
+            agent.train()
+        start = end
@@ -1,62 +1,60 @@
-import rlcard
-from rlcard.agents import DQNAgent
-import torch
 import os
-import glob
+import argparse
 from blackjack_utils import get_score, print_hand, decode_card, get_action_name
+from trajectory_store import load_store, play_game
+from policies import find_models, load_policy, personality_from_model
 
 # ---------------------------------------------------------
-# 設定
+# 設定 (コマンドライン引数の既定値)
 # ---------------------------------------------------------
 SAVE_DIR = 'experiments/blackjack_custom_reward' # モデルがある場所
 LOG_DIR = 'logs'                                 # ログ保存先
 GAMES_PER_MODEL = 5                              # 記録するゲーム数
-
-# ログ保存用フォルダを作成
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
+# trajectory_store.py で記録した軌跡 (全モデル分が最新ならシミュレーションせずにその先頭のゲームを書き出す)
+TRAJECTORY_DIR = 'experiments/blackjack_custom_reward/trajectories'
+# policy_server.py の URL (例: 'http://127.0.0.1:8765')。指定するとモデルを読み込まずにサーバーに問い合わせる
+POLICY_SERVER = None
 
 # ---------------------------------------------------------
-# 1. 準備
+# ログ出力
 # ---------------------------------------------------------
-env = rlcard.make('blackjack')
-agent = DQNAgent(
-    num_actions=env.num_actions,
-    state_shape=env.state_shape[0],
-    mlp_layers=[128, 128],
-    device=torch.device("cpu")
-)
-env.set_agents([agent])
+def log_game(log, game):
+    for step_count, step in enumerate(game['steps'], 1):
+        p_hand = step['player_hand']
+        p_score = get_score(p_hand)
+        d_up_card = decode_card(step['dealer_up']) if step['dealer_up'] else "?"
+        act_str = get_action_name(step['action'])
 
-# モデルファイルを探す
-model_files = glob.glob(os.path.join(SAVE_DIR, 'model_*.pth'))
-model_files.sort()
+        # ログ記録
+        log(f"  Step {step_count}:")
+        log(f"    Player: {print_hand(p_hand)} (Score: {p_score})")
+        log(f"    Dealer: {d_up_card} (Hidden)")
+        log(f"    -> Action: {act_str}")
 
-if not model_files:
-    print(f"Error: No models found in {SAVE_DIR}")
-    exit()
+    # --- 最終結果 ---
+    p_final = game['player_hand']
+    d_final = game['dealer_hand']
 
-print(f"Found {len(model_files)} models. Saving logs to '{LOG_DIR}/'...\n")
+    p_final_score = get_score(p_final)
+    d_final_score = get_score(d_final)
 
-# ---------------------------------------------------------
-# 2. モデルごとにログ保存しながら実行
-# ---------------------------------------------------------
-for model_path in model_files:
-    # ファイル名から性格名を取得
-    personality = os.path.basename(model_path).replace('model_', '').replace('.pth', '')
-    
-    # 保存するログファイルのパス
-    log_file_path = os.path.join(LOG_DIR, f"log_{personality}.txt")
-    
-    print(f"Processing {personality}... (Saving to {log_file_path})")
-
-    # モデルのロード
-    try:
-        agent.q_estimator.qnet.load_state_dict(torch.load(model_path))
-    except Exception as e:
-        print(f"  Load Error: {e}")
-        continue
+    score = game['payoff']
+
+    if score > 0:
+        result = "WIN 🏆"
+    elif score < 0:
+        result = "LOSE 💀"
+    else:
+        result = "DRAW 🤝"
+
+    log(f"  [Result] {result}")
+    log(f"    Player Final: {print_hand(p_final)} (Score: {p_final_score})")
+    log(f"    Dealer Final: {print_hand(d_final)} (Score: {d_final_score})")
 
+
+
+def write_log(log_file_path, personality, games):
+    """ゲームの記録 (trajectory_store の game 形式) を1つのログファイルに書き出す"""
     # ファイルを開いて書き込む準備
     # encoding='utf-8' にすることで絵文字（🏆など）の文字化けを防ぎます
     with open(log_file_path, 'w', encoding='utf-8') as f:
@@ -72,52 +70,69 @@ for model_path in model_files:
         log("="*60)
 
         # ゲーム実行ループ
-        for i in range(GAMES_PER_MODEL):
+        for i, game in enumerate(games):
             log(f"\n--- Game {i+1} ---")
-            state, player_id = env.reset()
-            
-            step_count = 1
-            while not env.is_over():
-                raw_obs = state['raw_obs']
-                p_hand = raw_obs['player0 hand']
-                d_hand = raw_obs['dealer hand']
-                
-                p_score = get_score(p_hand)
-                d_up_card = decode_card(d_hand[0]) if d_hand else "?"
-
-                # AIの決断
-                action, _ = agent.eval_step(state)
-                act_str = get_action_name(action)
-
-                # ログ記録
-                log(f"  Step {step_count}:")
-                log(f"    Player: {print_hand(p_hand)} (Score: {p_score})")
-                log(f"    Dealer: {d_up_card} (Hidden)")
-                log(f"    -> Action: {act_str}")
-
-                state, next_player_id = env.step(action, player_id)
-                step_count += 1
-
-            # --- 最終結果 ---
-            final_obs = state['raw_obs']
-            p_final = final_obs['player0 hand']
-            d_final = final_obs['dealer hand']
-            
-            p_final_score = get_score(p_final)
-            d_final_score = get_score(d_final)
-            
-            payoffs = env.get_payoffs()
-            score = payoffs[player_id]
-
-            if score > 0:
-                result = "WIN 🏆"
-            elif score < 0:
-                result = "LOSE 💀"
-            else:
-                result = "DRAW 🤝"
-
-            log(f"  [Result] {result}")
-            log(f"    Player Final: {print_hand(p_final)} (Score: {p_final_score})")
-            log(f"    Dealer Final: {print_hand(d_final)} (Score: {d_final_score})")
-
-print("\nAll logs saved successfully! Check the 'logs' folder.")
\ No newline at end of file
+            log_game(log, game)
+
+# ---------------------------------------------------------
+# メイン処理
+# ---------------------------------------------------------
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='学習済みモデルのゲームをテキストのログに書き出す')
+    parser.add_argument('--save-dir', default=SAVE_DIR, help='モデルがある場所')
+    parser.add_argument('--log-dir', default=LOG_DIR, help='ログ保存先')
+    parser.add_argument('--games', type=int, default=GAMES_PER_MODEL, help='記録するゲーム数 (モデルごと)')
+    parser.add_argument('--trajectory-dir', default=TRAJECTORY_DIR, help='trajectory_store.py で記録した軌跡の場所')
+    parser.add_argument('--server', default=POLICY_SERVER, help='policy_server.py の URL (指定したらサーバーに問い合わせる)')
+    args = parser.parse_args(argv)
+
+    # ログ保存用フォルダを作成
+    if not os.path.exists(args.log_dir):
+        os.makedirs(args.log_dir)
+
+    # 1. モデルファイルを探す (.npz に変換済みなら torch なしで動く)
+    model_files = find_models(args.save_dir)
+
+    if not model_files:
+        print(f"Error: No models found in {args.save_dir}")
+        return
+
+    store = load_store(args.trajectory_dir, model_files, min_games=args.games)
+    # 記録がないときだけ rlcard の環境でシミュレーションする
+    env = None
+    if store is None:
+        import rlcard
+        env = rlcard.make('blackjack')
+
+    print(f"Found {len(model_files)} models. Saving logs to '{args.log_dir}/'...\n")
+
+    # 2. モデルごとにログ保存しながら実行
+    for model_path in model_files:
+        # ファイル名から性格名を取得
+        personality = personality_from_model(model_path)
+
+        # 保存するログファイルのパス
+        log_file_path = os.path.join(args.log_dir, f"log_{personality}.txt")
+
+        print(f"Processing {personality}... (Saving to {log_file_path})")
+
+        # モデルのロード (記録を使うときは不要)
+        if store is None:
+            try:
+                agent = load_policy(model_path, server=args.server)
+            except Exception as e:
+                print(f"  Load Error: {e}")
+                continue
+
+        # 記録があればその先頭のゲーム、なければその場でシミュレーションする
+        if store is not None:
+            games = [store[personality].game(i) for i in range(args.games)]
+        else:
+            games = [play_game(env, agent) for _ in range(args.games)]
+        write_log(log_file_path, personality, games)
+
+    print(f"\nAll logs saved successfully! Check the '{args.log_dir}' folder.")
+
+
+if __name__ == '__main__':
+    main()
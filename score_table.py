@@ -0,0 +1,91 @@
+import numpy as np
+from custom_reward import reward_from_score
+
+# ---------------------------------------------------------
+# カードの整数エンコードと事前計算テーブル
+# ---------------------------------------------------------
+# rlcard の init_standard_deck() と同じ並び (スート × ランク) で 0〜51 の整数に対応させる
+SUITS = ['S', 'H', 'D', 'C']
+RANKS = ['A', '2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K']
+
+# カードコード -> 点数 (Aは1として数える)
+CARD_VALUES = np.array([min(r + 1, 10) for _ in SUITS for r in range(len(RANKS))], dtype=np.int16)
+# カードコード -> Aかどうか
+CARD_IS_ACE = np.array([r == 0 for _ in SUITS for r in range(len(RANKS))], dtype=bool)
+
+# 空きマス (-1) を0点として引けるように末尾に番兵を足したもの
+_PADDED_VALUES = np.append(CARD_VALUES, 0)
+_PADDED_IS_ACE = np.append(CARD_IS_ACE, False)
+
+# 文字列のカード -> コード / (点数, Aかどうか)
+CARD_CODES = {s + r: i * len(RANKS) + j for i, s in enumerate(SUITS) for j, r in enumerate(RANKS)}
+_CARD_RAW = {card: (int(CARD_VALUES[code]), bool(CARD_IS_ACE[code])) for card, code in CARD_CODES.items()}
+
+# Aを1とした合計 (raw) と A を含むか -> スコア / ソフトか
+MAX_RAW = 255
+_raw = np.arange(MAX_RAW + 1)
+SCORE_TABLE = np.stack([_raw, np.where(_raw <= 11, _raw + 10, _raw)], axis=1).astype(np.int16)
+SOFT_TABLE = np.stack([np.zeros(MAX_RAW + 1, dtype=bool), _raw <= 11], axis=1)
+
+# 報酬テーブルで区別する最大スコア (これ以上はすべてバーストとして同じ報酬)
+MAX_SCORE = 31
+
+
+def card_str(code):
+    """カードコードを rlcard と同じ文字列 (例: 'SA', 'HT') に戻す"""
+    code = int(code)
+    return SUITS[code // len(RANKS)] + RANKS[code % len(RANKS)]
+
+
+def encode_hand(hand):
+    """rlcard 形式の手札 (['SA', 'HT', ...]) を int8 のコード配列にする"""
+    return np.array([CARD_CODES[card] for card in hand], dtype=np.int8)
+
+
+def hand_score(raw, has_ace):
+    """Aを1として数えた合計からスコアを引く (blackjack_utils.get_score と同じ結果)"""
+    return SCORE_TABLE[raw, np.asarray(has_ace, dtype=np.int64)]
+
+
+def fast_get_score(hand):
+    """blackjack_utils.get_score と同じ結果を、文字列の解析なしで求める"""
+    raw = 0
+    has_ace = False
+    for card in hand:
+        value, ace = _CARD_RAW[card]
+        raw += value
+        has_ace |= ace
+    return int(SCORE_TABLE[raw, int(has_ace)])
+
+
+def batch_scores(cards):
+    """コード配列 (N, K) (-1 は空き) のスコアとソフトかどうかをまとめて求める"""
+    cards = np.asarray(cards)
+    raw = _PADDED_VALUES[cards].sum(axis=1)
+    has_ace = _PADDED_IS_ACE[cards].any(axis=1).astype(np.int64)
+    return SCORE_TABLE[raw, has_ace], SOFT_TABLE[raw, has_ace]
+
+
+# ---------------------------------------------------------
+# 報酬テーブル
+# ---------------------------------------------------------
+def compile_reward_config(reward_config):
+    """報酬設定を [払い戻し+1, 最終スコア] で引ける配列 (3, MAX_SCORE+1) にする"""
+    table = np.zeros((3, MAX_SCORE + 1), dtype=np.float64)
+    for payoff in (-1, 0, 1):
+        for score in range(MAX_SCORE + 1):
+            table[payoff + 1, score] = reward_from_score(payoff, score, reward_config)
+    return table
+
+
+def lookup_reward(table, payoff, hand):
+    """calculate_custom_reward(payoff, state, reward_config) と同じ値をテーブルから引く"""
+    if hand is None:
+        return payoff
+    return table[int(payoff) + 1, min(fast_get_score(hand), MAX_SCORE)]
+
+
+def batch_rewards(table, payoffs, scores):
+    """払い戻しと最終スコアの配列から、全エピソードの報酬をまとめて引く"""
+    payoffs = np.asarray(payoffs, dtype=np.int64)
+    return table[payoffs + 1, np.minimum(scores, MAX_SCORE)]
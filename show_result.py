@@ -1,146 +1,209 @@
-import rlcard
-from rlcard.agents import DQNAgent
-import torch
-import os
-import glob
-from blackjack_utils import get_score, print_hand, decode_card, get_action_name
+import argparse
+import numpy as np
+from blackjack_utils import get_score, print_hand, get_action_name
+from policies import find_models, load_policy, personality_from_model
+from trajectory_store import load_store
+from stat_eval import evaluate_with_ci, summarize, compare, sequential_compare, sequential_looks
 
 # ---------------------------------------------------------
-# 設定
+# 設定 (コマンドライン引数の既定値)
 # ---------------------------------------------------------
 SAVE_DIR = 'experiments/blackjack_custom_reward'
-NUM_GAMES = 1000 # テストするゲーム数
-SHOW_LOGS = False # Trueなら1戦ごとのログを表示、Falseなら結果だけ表示(推奨)
+NUM_GAMES = 100000 # テストするゲーム数 (モデルごと)
+BATCH_SIZE = 65536 # 1回にまとめて進めるゲーム数
+SEED = None # 評価用デッキのシード (Noneなら毎回ランダム、全モデルで共通)
+SHOW_LOGS = False # Trueなら最初の LOG_GAMES 戦のログを表示、Falseなら結果だけ表示(推奨)
+LOG_GAMES = 10
+# trajectory_store.py で記録した軌跡 (全モデル分が最新ならシミュレーションせずにこれを集計する)
+TRAJECTORY_DIR = 'experiments/blackjack_custom_reward/trajectories'
+# policy_server.py の URL (例: 'http://127.0.0.1:8765')。指定するとモデルを読み込まずにサーバーに問い合わせる
+POLICY_SERVER = None
+# 順位が隣り合うモデルを比べるときの信頼度。SEQUENTIAL なら差があるか同等と言えるまで追加で対戦させる
+CONFIDENCE = 0.95
+SEQUENTIAL = True
 
 # ---------------------------------------------------------
-# 1. 環境とエージェントの準備 (共通)
+# 1. モデルファイルを探して全部読み込む
 # ---------------------------------------------------------
-env = rlcard.make('blackjack')
-
-# 学習時と同じネットワーク構造 [128, 128] に合わせる
-agent = DQNAgent(
-    num_actions=env.num_actions,
-    state_shape=env.state_shape[0],
-    mlp_layers=[128, 128], 
-    device=torch.device("cpu")
-)
-env.set_agents([agent])
+def load_policies(model_files, server=POLICY_SERVER):
+    """{性格: ポリシー} を返す (読み込めなかったモデルはエラーを表示して飛ばす)"""
+    policies = {}
+    for model_path in model_files:
+        # ファイル名から性格名を取得 (例: model_aggressive.pth -> aggressive)
+        personality_name = personality_from_model(model_path)
+        try:
+            policies[personality_name] = load_policy(model_path, server=server)
+        except Exception as e:
+            print(f"Error loading {personality_name}: {e}")
+    return policies
 
 # ---------------------------------------------------------
-# 2. モデルファイルを探す
+# 2. ログ表示 (最初のバッチの先頭 log_games 戦を表示)
 # ---------------------------------------------------------
-# experimentsフォルダ内の model_*.pth をすべて取得
-model_files = glob.glob(os.path.join(SAVE_DIR, 'model_*.pth'))
-model_files.sort()
+def print_game_log(i, p_final, d_final, payoff):
+    print(f"--- Game {i+1} ---")
+    # 最後の1枚以外はすべて Hit、バーストしていなければ最後に Stand
+    num_hits = len(p_final) - 2
+    for k in range(num_hits + 1):
+        p_hand = p_final[:2 + k]
+        if k == num_hits and get_score(p_hand) > 21:
+            break
+        action = 0 if k < num_hits else 1
+        print(f"  Hand: {print_hand(p_hand)} ({get_score(p_hand)}) | AI: {get_action_name(action)}")
+
+    outcome = "WIN" if payoff > 0 else ("LOSE" if payoff < 0 else "DRAW")
+    print(f"  Result: {outcome} (Player: {get_score(p_final)}, Dealer: {get_score(d_final)})\n")
+
+
+def print_log_header(name):
+    print(f"==========================================")
+    print(f" Game Logs: {name}")
+    print(f"==========================================")
 
-if not model_files:
-    print(f"Error: Model files not found in {SAVE_DIR}")
-    exit()
 
-# 結果比較用のリスト
-summary_results = []
+def log_printer(log_games):
+    """evaluate_with_ci の on_batch に渡す、最初のバッチのログを表示する関数"""
+    def show_logs(name, batch_no, env):
+        if batch_no != 0:
+            return
+        print_log_header(name)
+        for i in range(min(log_games, env.num_envs)):
+            print_game_log(i, env.player_hand(i), env.dealer_hand(i), env.payoffs[i])
+    return show_logs
+
+
+def results_from_store(store, names, num_games=None, confidence=CONFIDENCE, show_logs=False, log_games=LOG_GAMES):
+    """記録済みの軌跡の先頭 num_games ゲームから evaluate_with_ci と同じ形の結果を作る (記録は全モデル同じデッキ)"""
+    results = []
+    payoffs = {}
+    for name in names:
+        games = store[name]
+        if show_logs:
+            print_log_header(name)
+            for i in range(min(log_games, len(games))):
+                print_game_log(i, games.player_hand(i), games.dealer_hand(i), int(games['payoffs'][i]))
+        payoffs[name] = np.asarray(games['payoffs'][:num_games])
+        results.append(summarize(name, payoffs[name], confidence))
+    return results, payoffs
 
 # ---------------------------------------------------------
-# 3. モデルごとにテスト実行
+# 3. 結果の表示
 # ---------------------------------------------------------
-print(f"\nFound {len(model_files)} models. Starting evaluation...\n")
-
-for model_path in model_files:
-    # ファイル名から性格名を取得 (例: model_aggressive.pth -> aggressive)
-    personality_name = os.path.basename(model_path).replace('model_', '').replace('.pth', '')
-    
-    print(f"==========================================")
-    print(f" Testing Model: {personality_name}")
-    print(f"==========================================")
+def print_results(summary_results):
+    for res in summary_results:
+        num_games = res['win'] + res['lose'] + res['draw']
+        print(f"==========================================")
+        print(f" Testing Model: {res['name']}")
+        print(f"==========================================")
+        print(f"  Results ({num_games} games):")
+        print(f"    WIN : {res['win']}")
+        print(f"    LOSE: {res['lose']}")
+        print(f"    DRAW: {res['draw']}")
+        low, high = res['rate_ci']
+        print(f"    Win Rate (excl. draws): {res['rate']:.2%} [{low:.2%}, {high:.2%}]")
+        low, high = res['payoff_ci']
+        print(f"    Mean Payoff: {res['mean_payoff']:+.4f} [{low:+.4f}, {high:+.4f}]")
+        print("\n")
+
+
+def print_ranking(summary_results, confidence=CONFIDENCE):
+    """勝率が高い順の最終ランキング (summary_results はその順に並べ替える)"""
+    summary_results.sort(key=lambda x: x['rate'], reverse=True)
+
+    print("##########################################")
+    print(" FINAL RANKING (Win Rate excl. draws)")
+    print("##########################################")
+    print(f"{'Rank':<5} {'Personality':<15} {'Rate':<10} {f'{confidence:.0%} CI':<18} {'W-L-D':<10}")
+    print("-" * 65)
+
+    for rank, res in enumerate(summary_results, 1):
+        low, high = res['rate_ci']
+        ci = f"[{low:.2%}, {high:.2%}]"
+        print(f"{rank:<5} {res['name']:<15} {res['rate']:.2%}     {ci:<18} {res['win']}-{res['lose']}-{res['draw']}")
+    print("##########################################")
 
-    # モデルのロード
-    try:
-        checkpoint = torch.load(model_path)
-        agent.q_estimator.qnet.load_state_dict(checkpoint)
-    except Exception as e:
-        print(f"Error loading {personality_name}: {e}")
-        continue
-
-    # --- ゲーム実行 ---
-    total_win = 0
-    total_draw = 0
-    total_lose = 0
-
-    for i in range(NUM_GAMES):
-        state, player_id = env.reset()
-        
-        step_count = 1
-        # ログ表示がONの場合のみ詳細を表示
-        if SHOW_LOGS:
-            print(f"--- Game {i+1} ---")
-
-        while not env.is_over():
-            action, _ = agent.eval_step(state)
-            
-            # ログ表示
-            if SHOW_LOGS:
-                raw_obs = state['raw_obs']
-                p_hand = raw_obs['player0 hand']
-                d_hand = raw_obs['dealer hand']
-                print(f"  Hand: {print_hand(p_hand)} ({get_score(p_hand)}) | AI: {get_action_name(action)}")
-
-            state, next_player_id = env.step(action, player_id)
-            step_count += 1
-
-        # 結果判定
-        payoffs = env.get_payoffs()
-        result_score = payoffs[player_id]
-        
-        if result_score > 0:
-            total_win += 1
-            outcome = "WIN"
-        elif result_score < 0:
-            total_lose += 1
-            outcome = "LOSE"
+# ---------------------------------------------------------
+# 4. 隣り合う順位の比較 (同じハンドでの払い戻しの差)
+# ---------------------------------------------------------
+def print_pairwise(summary_results, payoffs, policies=None, seed=None, confidence=CONFIDENCE, batch_size=BATCH_SIZE):
+    """policies と seed を渡すと、差があるか同等と言えるまで同じデッキの続きで追加対戦する"""
+    if len(summary_results) > 1:
+        if policies is not None:
+            # 逐次検定の区間は判定回数の上限で Bonferroni 補正しているので、ただの confidence の区間より広い
+            label = f"{confidence:.0%} CI, Bonferroni-adjusted for up to {sequential_looks(batch_size)} looks"
         else:
-            total_draw += 1
-            outcome = "DRAW"
-
-        if SHOW_LOGS:
-            final_obs = state['raw_obs']
-            print(f"  Result: {outcome} (Player: {get_score(final_obs['player0 hand'])}, Dealer: {get_score(final_obs['dealer hand'])})\n")
-
-    # --- 勝率計算 ---
-    # 引き分けを除いた勝率 (Win / (Win + Lose))
-    decisive_games = NUM_GAMES - total_draw
-    if decisive_games > 0:
-        win_rate = total_win / decisive_games
-    else:
-        win_rate = 0.0
-    
-    print(f"  Results ({NUM_GAMES} games):")
-    print(f"    WIN : {total_win}")
-    print(f"    LOSE: {total_lose}")
-    print(f"    DRAW: {total_draw}")
-    print(f"    Win Rate (excl. draws): {win_rate:.2%}")
-    print("\n")
-    
-    # 結果を保存
-    summary_results.append({
-        'name': personality_name,
-        'rate': win_rate,
-        'win': total_win,
-        'lose': total_lose,
-        'draw': total_draw
-    })
+            label = f"{confidence:.0%} CI"
+        print(f"\n Pairwise (mean payoff difference, {label})")
+        print("-" * 65)
+    for upper, lower in zip(summary_results, summary_results[1:]):
+        a, b = upper['name'], lower['name']
+        initial = (payoffs[a], payoffs[b])
+        if policies is not None:
+            comparison = sequential_compare(policies[a], policies[b], names=(a, b), seed=seed,
+                                            confidence=confidence, batch_size=batch_size, initial=initial)
+        else:
+            comparison = compare(a, payoffs[a], b, payoffs[b], confidence=confidence)
+        low, high = comparison['diff_ci']
+        verdict = {'separated': f"{comparison['better']} is better", 'tied': "tied"}.get(comparison['decision'], "undecided")
+        print(f"  {a} vs {b}: {comparison['diff']:+.4f} [{low:+.4f}, {high:+.4f}] "
+              f"-> {verdict} ({comparison['games']} games)")
 
 # ---------------------------------------------------------
-# 4. 最終ランキング表示
+# メイン処理
 # ---------------------------------------------------------
-# 勝率が高い順にソート
-summary_results.sort(key=lambda x: x['rate'], reverse=True)
-
-print("##########################################")
-print(" FINAL RANKING (Win Rate excl. draws)")
-print("##########################################")
-print(f"{'Rank':<5} {'Personality':<15} {'Rate':<10} {'W-L-D':<10}")
-print("-" * 45)
-
-for rank, res in enumerate(summary_results, 1):
-    print(f"{rank:<5} {res['name']:<15} {res['rate']:.2%}     {res['win']}-{res['lose']}-{res['draw']}")
-print("##########################################")
\ No newline at end of file
+def show_results(save_dir=SAVE_DIR, num_games=NUM_GAMES, batch_size=BATCH_SIZE, seed=SEED,
+                 show_logs=SHOW_LOGS, log_games=LOG_GAMES, trajectory_dir=TRAJECTORY_DIR,
+                 server=POLICY_SERVER, confidence=CONFIDENCE, sequential=SEQUENTIAL):
+    """save_dir の全モデルを同じデッキで評価し、結果・ランキング・隣り合う順位の比較を表示する"""
+    # experimentsフォルダ内の model_*.pth をすべて取得
+    model_files = find_models(save_dir)
+
+    if not model_files:
+        print(f"Error: Model files not found in {save_dir}")
+        return None
+
+    # 記録が使えるときはモデルを読み込まずに済ませる
+    # (記録が num_games 以上あり、シードを指定したなら記録時と同じシードのときだけ)
+    store = load_store(trajectory_dir, model_files, min_games=num_games, seed=seed)
+    if store is not None:
+        print(f"\nFound {len(model_files)} models. Using recorded trajectories in {trajectory_dir} "
+              f"(first {num_games} of {store.num_games} games, seed {store.seed})...\n")
+        policies = None
+        summary_results, payoffs = results_from_store(store, [personality_from_model(p) for p in model_files],
+                                                      num_games, confidence, show_logs, log_games)
+    else:
+        policies = load_policies(model_files, server)
+        print(f"\nFound {len(model_files)} models. Starting evaluation ({num_games} games each)...\n")
+        # 逐次検定で同じデッキの続きを使うため、シードはここで決めておく
+        seed = seed if seed is not None else int(np.random.SeedSequence().entropy % (2 ** 32))
+        summary_results, payoffs = evaluate_with_ci(policies, num_games, batch_size=batch_size, seed=seed,
+                                                    confidence=confidence,
+                                                    on_batch=log_printer(log_games) if show_logs else None)
+
+    print_results(summary_results)
+    print_ranking(summary_results, confidence)
+    print_pairwise(summary_results, payoffs, policies if sequential else None, seed, confidence, batch_size)
+    return summary_results
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='学習済みモデルを同じデッキで対戦させて勝率を比べる')
+    parser.add_argument('--save-dir', default=SAVE_DIR, help='モデルがある場所')
+    parser.add_argument('--games', type=int, default=NUM_GAMES, help='テストするゲーム数 (モデルごと)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='1回にまとめて進めるゲーム数')
+    parser.add_argument('--seed', type=int, default=SEED, help='評価用デッキのシード (省略したら毎回ランダム)')
+    parser.add_argument('--show-logs', action='store_true', default=SHOW_LOGS, help='最初の数戦のログを表示する')
+    parser.add_argument('--log-games', type=int, default=LOG_GAMES, help='--show-logs で表示するゲーム数')
+    parser.add_argument('--trajectory-dir', default=TRAJECTORY_DIR, help='trajectory_store.py で記録した軌跡の場所')
+    parser.add_argument('--server', default=POLICY_SERVER, help='policy_server.py の URL (指定したらサーバーに問い合わせる)')
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE, help='信頼区間の信頼度')
+    parser.add_argument('--no-sequential', dest='sequential', action='store_false', default=SEQUENTIAL,
+                        help='隣り合う順位の比較で追加の対戦をしない')
+    args = parser.parse_args(argv)
+
+    show_results(args.save_dir, args.games, args.batch_size, args.seed, args.show_logs, args.log_games,
+                 args.trajectory_dir, args.server, args.confidence, args.sequential)
+
+
+if __name__ == '__main__':
+    main()
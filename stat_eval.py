@@ -0,0 +1,208 @@
+import math
+from statistics import NormalDist
+import numpy as np
+from batch_env import BatchBlackjackEnv, play_games
+from evaluation import BATCH_SIZE, policy_act_fn, win_rate
+
+# ---------------------------------------------------------
+# 信頼区間つきの評価と逐次検定
+# ---------------------------------------------------------
+# 全モデルを同じシードのデッキで対戦させる (共通乱数)。同じハンドでの払い戻しの差を取れば
+# カード運のばらつきが打ち消され、モデル間の差の信頼区間がずっと狭くなる。
+#
+# 逐次検定 (sequential_compare) は2モデルをバッチごとに追加で対戦させ、
+#   - 払い戻しの差の信頼区間が 0 を含まなくなったら「差がある」
+#   - 信頼区間が ±TIE_MARGIN に収まったら「同等」
+# と判断した時点で止める。途中で何度も判定するぶん、判定1回あたりの有意水準は
+# 判定回数の上限で割っておく (Bonferroni)。
+
+CONFIDENCE = 0.95
+TIE_MARGIN = 0.005  # 1ゲームあたりの払い戻しの差がこれ以内なら同等とみなす
+MAX_GAMES = 2000000  # 逐次検定で1組に使うゲーム数の上限
+SEQUENTIAL_BATCH = 65536
+
+
+def z_value(confidence):
+    """両側 confidence の信頼区間に使う標準正規分布の分位点"""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def mean_ci(values, confidence=CONFIDENCE):
+    """平均とその信頼区間 (mean, low, high)"""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return 0.0, 0.0, 0.0
+    mean = values.mean()
+    half = z_value(confidence) * values.std(ddof=1) / math.sqrt(n) if n > 1 else math.inf
+    return float(mean), float(mean - half), float(mean + half)
+
+
+def wilson_ci(win, n, confidence=CONFIDENCE):
+    """勝率 win / n の Wilson 信頼区間 (rate, low, high)"""
+    if n == 0:
+        return 0.0, 0.0, 1.0
+    z = z_value(confidence)
+    p = win / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return p, center - half, center + half
+
+
+def summarize(name, payoffs, confidence=CONFIDENCE):
+    """払い戻しの配列から evaluate_models と同じ形の結果 (+ 信頼区間) を作る"""
+    payoffs = np.asarray(payoffs)
+    win, lose, draw = int((payoffs > 0).sum()), int((payoffs < 0).sum()), int((payoffs == 0).sum())
+    return {
+        'name': name,
+        'rate': win_rate(win, lose),
+        'win': win,
+        'lose': lose,
+        'draw': draw,
+        'mean_payoff': (win - lose) / max(len(payoffs), 1),
+        # 引き分けを除いた勝率と、1ゲームあたりの払い戻しの信頼区間
+        'rate_ci': wilson_ci(win, win + lose, confidence)[1:],
+        'payoff_ci': mean_ci(payoffs, confidence)[1:],
+    }
+
+
+# ---------------------------------------------------------
+# 共通乱数での対戦
+# ---------------------------------------------------------
+def paired_payoffs(policies, num_games, batch_size=BATCH_SIZE, seed=None, first_batch=0, on_batch=None):
+    """全モデルを同じデッキで num_games ゲームずつ対戦させ、ゲームごとの払い戻しを返す
+
+    デッキは evaluation.evaluate_models と同じく [seed, バッチ番号] から作るので、
+    払い戻しの配列は i 番目同士が同じカードの並びのゲームになる。
+
+    Returns:
+        dict: 性格名 -> 払い戻しの配列 (int8)
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+
+    act_fns = {name: policy_act_fn(policy) for name, policy in policies.items()}
+    chunks = {name: [] for name in policies}
+    played = 0
+    batch_no = first_batch
+    while played < num_games:
+        n = min(batch_size, num_games - played)
+        for name in policies:
+            env = BatchBlackjackEnv(n, seed=[seed, batch_no])
+            chunks[name].append(np.asarray(play_games(env, act_fns[name]), dtype=np.int8))
+            if on_batch is not None:
+                on_batch(name, batch_no, env)
+        played += n
+        batch_no += 1
+    return {name: np.concatenate(parts) if parts else np.zeros(0, dtype=np.int8)
+            for name, parts in chunks.items()}
+
+
+def evaluate_with_ci(policies, num_games, batch_size=BATCH_SIZE, seed=None, confidence=CONFIDENCE, on_batch=None):
+    """evaluate_models に信頼区間を付けたもの
+
+    Returns:
+        (list, dict): 性格ごとの結果 (summarize) と、性格名 -> 払い戻しの配列
+    """
+    payoffs = paired_payoffs(policies, num_games, batch_size, seed, on_batch=on_batch)
+    return [summarize(name, values, confidence) for name, values in payoffs.items()], payoffs
+
+
+# ---------------------------------------------------------
+# 2モデルの比較
+# ---------------------------------------------------------
+class PairedDiff:
+    """同じゲームでの払い戻しの差 (a - b) を積み上げて平均と信頼区間を求める"""
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def add(self, payoffs_a, payoffs_b):
+        diff = np.asarray(payoffs_a, dtype=np.int64) - np.asarray(payoffs_b, dtype=np.int64)
+        self.n += len(diff)
+        self.total += float(diff.sum())
+        self.total_sq += float((diff * diff).sum())
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+    def interval(self, z):
+        if self.n < 2:
+            return -math.inf, math.inf
+        var = max(self.total_sq - self.n * self.mean ** 2, 0.0) / (self.n - 1)
+        half = z * math.sqrt(var / self.n)
+        return self.mean - half, self.mean + half
+
+    def decision(self, z, tie_margin=TIE_MARGIN):
+        """'a' / 'b' (差がある、勝った方)、'tie' (同等)、None (まだ分からない)"""
+        low, high = self.interval(z)
+        if low > 0:
+            return 'a'
+        if high < 0:
+            return 'b'
+        if -tie_margin < low and high < tie_margin:
+            return 'tie'
+        return None
+
+
+def compare(name_a, payoffs_a, name_b, payoffs_b, confidence=CONFIDENCE, tie_margin=TIE_MARGIN):
+    """同じゲームの払い戻し (固定のゲーム数) から2モデルを比べる"""
+    diff = PairedDiff()
+    diff.add(payoffs_a, payoffs_b)
+    return _comparison(name_a, name_b, diff, z_value(confidence), tie_margin)
+
+
+def sequential_looks(batch_size=SEQUENTIAL_BATCH, max_games=MAX_GAMES):
+    """sequential_compare が判定する回数の上限 (信頼区間はこの回数で Bonferroni 補正する)"""
+    return max(1, math.ceil(max_games / batch_size))
+
+
+def _comparison(name_a, name_b, diff, z, tie_margin, looks=1):
+    decision = diff.decision(z, tie_margin)
+    low, high = diff.interval(z)
+    return {
+        'a': name_a,
+        'b': name_b,
+        'decision': {'a': 'separated', 'b': 'separated', 'tie': 'tied'}.get(decision, 'undecided'),
+        'better': {'a': name_a, 'b': name_b}.get(decision),
+        'diff': diff.mean,
+        'diff_ci': (low, high),
+        'games': diff.n,
+        'looks': looks,  # 1 より大きければ diff_ci は判定回数で補正した (広い) 区間
+    }
+
+
+def sequential_compare(policy_a, policy_b, names=('a', 'b'), seed=None, confidence=CONFIDENCE,
+                       tie_margin=TIE_MARGIN, batch_size=SEQUENTIAL_BATCH, max_games=MAX_GAMES,
+                       initial=None):
+    """差があるか同等と言えるまで2モデルを同じデッキで対戦させる
+
+    initial に (払い戻し a, 払い戻し b) を渡すと、それを最初の判定に使い、続きのバッチから対戦する
+    (evaluate_with_ci と同じ seed / batch_size なら同じデッキを二重に使わない)。
+
+    Returns:
+        dict: 'decision' ('separated' / 'tied' / 'undecided')、'better' (勝った方の名前)、
+              'diff' と 'diff_ci' (1ゲームあたりの払い戻しの差 a - b)、'games' (使ったゲーム数)、
+              'looks' (diff_ci の Bonferroni 補正に使った判定回数の上限)
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+    pair = {names[0]: policy_a, names[1]: policy_b}
+    # 判定の回数の上限で有意水準を割る
+    looks = sequential_looks(batch_size, max_games)
+    z = z_value(1 - (1 - confidence) / looks)
+
+    diff = PairedDiff()
+    batch_no = 0
+    if initial is not None:
+        diff.add(*initial)
+        batch_no = math.ceil(diff.n / batch_size)
+    while diff.decision(z, tie_margin) is None and diff.n < max_games:
+        n = min(batch_size, max_games - diff.n)
+        payoffs = paired_payoffs(pair, n, batch_size, seed, first_batch=batch_no)
+        diff.add(payoffs[names[0]], payoffs[names[1]])
+        batch_no += 1
+    return _comparison(names[0], names[1], diff, z, tie_margin, looks)
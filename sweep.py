@@ -0,0 +1,391 @@
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import itertools
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout, redirect_stderr
+from blackjack_utils import load_reward_config
+
+# ---------------------------------------------------------
+# 報酬設定のスイープ
+# ---------------------------------------------------------
+# calculate_custom_reward のキー (win_21 / loss_burst / ...) の値の範囲から設定を作り、
+# 1設定 = 1ジョブとしてディスク上のキューに積んでプロセスプールで学習する。
+# 他の設定より明らかに評価が悪い学習は途中で打ち切る。中断しても同じコマンドで続きから再開できる。
+#
+# 使い方:
+#   python sweep.py --name burst --param win_21=1.0:2.0:0.5 --param loss_burst=-2,-1,-0.5 --workers 4
+#   python sweep.py --name burst            (中断したスイープの再開)
+#
+# 保存形式 (SWEEP_ROOT/<名前>/):
+#   sweep.json                  スイープの設定
+#   jobs/<id>.json              ジョブの状態 (pending / running / done / stopped / failed)
+#   configs/config_<id>.csv     personality/ と同じ形式の報酬設定
+#   runs/<id>/                  学習の出力 (performance_<id>.csv, model_<id>.pth, train.log)
+#   results.csv                 全ジョブの結果
+
+SWEEP_ROOT = 'experiments/sweeps'
+# スイープしないキーの値と説明はこの設定から取る
+BASE_CONFIG = 'personality/config_normal.csv'
+# calculate_custom_reward が使うキー
+REWARD_KEYS = ['win_21', 'win_normal', 'loss_burst', 'loss_17_plus', 'loss_under_17']
+
+# 早期終了の既定値
+MIN_FRACTION = 0.2   # 学習の最初のこの割合は打ち切らない
+MARGIN = 0.05        # 最良の設定よりこれ以上低ければ「負けている」
+PATIENCE = 3         # 負けている評価がこの回数続いたら打ち切る
+WINDOW = 5           # 評価のノイズを均すための移動平均の幅
+MIN_RIVALS = 2       # 比べる相手がこれより少ないうちは打ち切らない
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+
+
+# ---------------------------------------------------------
+# 設定の生成
+# ---------------------------------------------------------
+def parse_param(text):
+    """'key=start:stop:step' (stop を含む) か 'key=v1,v2,...' を (key, 値のリスト) にする"""
+    key, _, spec = text.partition('=')
+    if key not in REWARD_KEYS:
+        raise ValueError(f"Unknown reward key '{key}' (choose from {', '.join(REWARD_KEYS)})")
+    if ':' in spec:
+        start, stop, step = (float(v) for v in spec.split(':'))
+        count = int(round((stop - start) / step)) + 1
+        values = [round(start + i * step, 10) for i in range(count)]
+    else:
+        values = [float(v) for v in spec.split(',')]
+    return key, values
+
+
+def generate_configs(ranges, base_config, samples=None, seed=0):
+    """範囲の全組み合わせ (samples を指定したらそこからランダムに samples 個) の設定を返す"""
+    keys = list(ranges)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(ranges[k] for k in keys))]
+    if samples is not None and samples < len(grid):
+        grid = random.Random(seed).sample(grid, samples)
+    return [{**base_config, **params} for params in grid]
+
+
+def write_config(path, config, descriptions):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['key', 'value', 'description'])
+        for key, value in config.items():
+            writer.writerow([key, value, descriptions.get(key, '')])
+
+
+def _descriptions(config_path):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return {row['key']: row.get('description', '') for row in csv.DictReader(f)}
+
+
+# ---------------------------------------------------------
+# ディスク上のジョブキュー
+# ---------------------------------------------------------
+class JobQueue:
+    """jobs/<id>.json を1ジョブとするキュー (更新は一時ファイルからの置き換えで行う)"""
+
+    def __init__(self, sweep_dir):
+        self.sweep_dir = sweep_dir
+        self.job_dir = os.path.join(sweep_dir, 'jobs')
+        os.makedirs(self.job_dir, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.job_dir, f'{job_id}.json')
+
+    def put(self, job):
+        tmp_path = self._path(job['id']) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp_path, self._path(job['id']))
+
+    def jobs(self):
+        jobs = []
+        for name in sorted(os.listdir(self.job_dir)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.job_dir, name)) as f:
+                    jobs.append(json.load(f))
+        return jobs
+
+    def recover(self, retry_failed=False):
+        """前回の実行で running のまま残ったジョブ (と retry_failed なら failed) を pending に戻す"""
+        for job in self.jobs():
+            if job['status'] == STATUS_RUNNING or (retry_failed and job['status'] == 'failed'):
+                job['status'] = STATUS_PENDING
+                self.put(job)
+
+    def pending(self):
+        return [job for job in self.jobs() if job['status'] == STATUS_PENDING]
+
+
+def create_sweep(sweep_dir, ranges, base_config_path, samples=None, seed=0, settings=None):
+    """設定ファイルとジョブを作り、(キュー, 学習の設定) を返す
+
+    既にあるスイープは作り直さず、作ったときの学習の設定 (sweep.json) をそのまま使う。
+    """
+    queue = JobQueue(sweep_dir)
+    if queue.jobs():
+        with open(os.path.join(sweep_dir, 'sweep.json')) as f:
+            saved = json.load(f)
+        print(f"Sweep {sweep_dir} already exists. Resuming with its saved settings.")
+        return queue, saved['settings']
+
+    base_config = load_reward_config(base_config_path)
+    descriptions = _descriptions(base_config_path)
+    config_dir = os.path.join(sweep_dir, 'configs')
+    os.makedirs(config_dir, exist_ok=True)
+
+    configs = generate_configs(ranges, base_config, samples, seed)
+    for i, config in enumerate(configs):
+        job_id = f'{i:04d}'
+        config_path = os.path.join(config_dir, f'config_{job_id}.csv')
+        write_config(config_path, config, descriptions)
+        queue.put({'id': job_id, 'config_path': config_path, 'params': config, 'status': STATUS_PENDING})
+
+    with open(os.path.join(sweep_dir, 'sweep.json'), 'w') as f:
+        json.dump({'ranges': ranges, 'base_config': base_config_path, 'samples': samples,
+                   'seed': seed, 'settings': settings}, f, indent=2)
+    print(f"Created {len(configs)} jobs in {sweep_dir}")
+    return queue, settings
+
+
+# ---------------------------------------------------------
+# 早期終了
+# ---------------------------------------------------------
+def read_curve(log_path):
+    """performance_*.csv を (エピソード配列, 結果配列) で読む"""
+    if not os.path.exists(log_path):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    with open(log_path, 'r', newline='') as f:
+        # 3列目 (打ち切りの理由) がある行は直前の評価の繰り返しなので除く
+        rows = [row for row in csv.reader(f) if len(row) == 2]
+    episodes = np.array([int(row[0]) for row in rows], dtype=np.int64)
+    results = np.array([float(row[1]) for row in rows])
+    return episodes, results
+
+
+def last_run(episodes, results):
+    """エピソードが増え続けている最後の区間だけを返す (学習をやり直して曲線が継ぎ足されたログ用)"""
+    restarts = np.flatnonzero(np.diff(episodes) <= 0)
+    if len(restarts) == 0:
+        return episodes, results
+    return episodes[restarts[-1] + 1:], results[restarts[-1] + 1:]
+
+
+def rolling_mean(values, window):
+    if len(values) == 0:
+        return values
+    cumsum = np.cumsum(np.insert(values, 0, 0.0))
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return (cumsum[1:] - cumsum[np.arange(1, len(values) + 1) - counts]) / counts
+
+
+class DominanceStopper:
+    """同じスイープの他のジョブと比べて、明らかに負けている学習を打ち切る
+
+    同じエピソード時点での移動平均が、他のジョブの最良値より margin 以上低い評価が
+    patience 回続いたら打ち切る (train_and_save / train_tabular の on_evaluate に渡す)。
+    """
+
+    def __init__(self, sweep_dir, job_id, min_episode, margin=MARGIN, patience=PATIENCE,
+                 window=WINDOW, min_rivals=MIN_RIVALS):
+        self.run_dir = os.path.join(sweep_dir, 'runs')
+        self.job_id = job_id
+        self.min_episode = min_episode
+        self.margin = margin
+        self.patience = patience
+        self.window = window
+        self.min_rivals = min_rivals
+        self.results = []
+        self.strikes = 0
+        self.stopped_at = None
+
+    def _rival_best(self, episode):
+        """他のジョブの、episode 時点までの移動平均の最良値"""
+        values = []
+        for job_id in os.listdir(self.run_dir):
+            if job_id == self.job_id:
+                continue
+            episodes, results = last_run(*read_curve(os.path.join(self.run_dir, job_id, f'performance_{job_id}.csv')))
+            reached = np.flatnonzero(episodes <= episode)
+            # まだ同じところまで進んでいない相手とは比べない
+            if len(reached) == 0 or episodes[-1] < episode:
+                continue
+            values.append(rolling_mean(results[:reached[-1] + 1], self.window)[-1])
+        return max(values) if len(values) >= self.min_rivals else None
+
+    def __call__(self, episode, result):
+        if not self.results and episode > 0:
+            # 途中から再開した学習なら、それまでの評価も移動平均に含める
+            episodes, results = last_run(*read_curve(os.path.join(self.run_dir, self.job_id,
+                                                                   f'performance_{self.job_id}.csv')))
+            self.results = results[episodes < episode].tolist()
+        self.results.append(result)
+        if episode < self.min_episode:
+            return False
+        best = self._rival_best(episode)
+        own = rolling_mean(np.array(self.results), self.window)[-1]
+        if best is not None and own < best - self.margin:
+            self.strikes += 1
+        else:
+            self.strikes = 0
+        if self.strikes >= self.patience:
+            self.stopped_at = episode
+            return f'dominated: {own:.4f} vs best {best:.4f} for {self.strikes} evaluations'
+        return False
+
+
+# ---------------------------------------------------------
+# ジョブの実行
+# ---------------------------------------------------------
+def _run_job(sweep_dir, job, learner, train_kwargs, stop_kwargs):
+    """ワーカープロセスで1ジョブを学習する (出力は runs/<id>/train.log へ)"""
+    from train_all import LEARNERS
+
+    job_id = job['id']
+    run_dir = os.path.join(sweep_dir, 'runs', job_id)
+    os.makedirs(run_dir, exist_ok=True)
+    log_path = os.path.join(run_dir, f'performance_{job_id}.csv')
+    # チェックポイントから再開しない学習は 0 エピソードから評価を書き直すので、
+    # 中断前の曲線が残っていたら消しておく (残すと2本目の曲線が継ぎ足される)
+    resumable = (learner == 'dqn' and train_kwargs.get('resume')
+                 and os.path.exists(os.path.join(run_dir, f'checkpoint_{job_id}.pt')))
+    if not resumable and os.path.exists(log_path):
+        os.remove(log_path)
+    stopper = DominanceStopper(sweep_dir, job_id, **stop_kwargs) if stop_kwargs is not None else None
+
+    start = time.time()
+    status, error = 'done', ''
+    with open(os.path.join(run_dir, 'train.log'), 'a', encoding='utf-8') as log_file:
+        with redirect_stdout(log_file), redirect_stderr(log_file):
+            try:
+                LEARNERS[learner](job['config_path'], job_id, save_dir=run_dir, on_evaluate=stopper,
+                                  **train_kwargs)
+            except Exception as e:
+                traceback.print_exc()
+                status, error = 'failed', repr(e)
+    if status == 'done' and stopper is not None and stopper.stopped_at is not None:
+        status = 'stopped'
+
+    episodes, results = last_run(*read_curve(log_path))
+    window = stop_kwargs['window'] if stop_kwargs is not None else WINDOW
+    smoothed = rolling_mean(results, window)
+    return {
+        **job,
+        'status': status,
+        'error': error,
+        'time': time.time() - start,
+        'episodes': int(episodes[-1]) if len(episodes) else 0,
+        'final': float(smoothed[-1]) if len(smoothed) else None,
+        'best': float(smoothed.max()) if len(smoothed) else None,
+    }
+
+
+def write_results(sweep_dir, jobs):
+    """全ジョブの結果を最終評価 (移動平均) の良い順に results.csv へ書く"""
+    jobs = sorted(jobs, key=lambda job: -(job.get('final') if job.get('final') is not None else -np.inf))
+    path = os.path.join(sweep_dir, 'results.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'status', 'final', 'best', 'episodes', 'time'] + REWARD_KEYS)
+        for job in jobs:
+            writer.writerow([job['id'], job['status'], job.get('final'), job.get('best'), job.get('episodes'),
+                             job.get('time')] + [job['params'].get(key) for key in REWARD_KEYS])
+    return jobs, path
+
+
+def run_sweep(sweep_dir, queue, workers, torch_threads, learner, train_kwargs, stop_kwargs):
+    from train_all import _init_worker
+
+    jobs = queue.pending()
+    print(f"{len(jobs)} jobs to run ({workers} workers)")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(torch_threads,)) as executor:
+        futures = {}
+        for job in jobs:
+            job['status'] = STATUS_RUNNING
+            queue.put(job)
+            futures[executor.submit(_run_job, sweep_dir, job, learner, train_kwargs, stop_kwargs)] = job
+        for future in as_completed(futures):
+            result = future.result()
+            queue.put(result)
+            final = f"{result['final']:.4f}" if result['final'] is not None else '-'
+            print(f"  [{result['id']}] {result['status']:<8} final={final} "
+                  f"episodes={result['episodes']} ({result['time']:.1f}s)")
+
+
+def settings_from_args(args):
+    """学習方法・学習の引数・早期終了の引数 (スイープを作るときに sweep.json に保存する)"""
+    train_kwargs = {}
+    if args.episodes is not None:
+        train_kwargs['num_episodes'] = args.episodes
+    if args.learner == 'dqn':
+        # 中断したジョブは最後のチェックポイントから再開する
+        train_kwargs['checkpoint_every'] = args.checkpoint_every
+        train_kwargs['resume'] = True
+
+    stop_kwargs = None
+    if not args.no_early_stop:
+        import inspect
+        from train_all import LEARNERS
+        num_episodes = args.episodes or inspect.signature(LEARNERS[args.learner]).parameters['num_episodes'].default
+        stop_kwargs = {'min_episode': int(num_episodes * MIN_FRACTION), 'margin': args.margin,
+                       'patience': args.patience, 'window': args.window}
+    return {'learner': args.learner, 'train_kwargs': train_kwargs, 'stop_kwargs': stop_kwargs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='報酬設定の範囲をスイープして学習する')
+    parser.add_argument('--name', required=True, help='スイープ名 (保存先のフォルダ名)')
+    parser.add_argument('--param', action='append', default=[],
+                        help="スイープするキーと値 (例: win_21=1.0:2.0:0.5, loss_burst=-2,-1,-0.5)")
+    parser.add_argument('--base-config', default=BASE_CONFIG, help='スイープしないキーの値を取る設定')
+    parser.add_argument('--samples', type=int, default=None, help='全組み合わせからランダムに選ぶ数')
+    parser.add_argument('--seed', type=int, default=0, help='--samples の抽選のシード')
+    parser.add_argument('--learner', choices=['dqn', 'tabular'], default='dqn')
+    parser.add_argument('--episodes', type=int, default=None, help='1ジョブの学習エピソード数')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--torch-threads', type=int, default=1)
+    parser.add_argument('--checkpoint-every', type=int, default=5000,
+                        help='DQN の途中保存の間隔 (中断したジョブはここから再開する)')
+    parser.add_argument('--no-early-stop', action='store_true', help='早期終了しない')
+    parser.add_argument('--margin', type=float, default=MARGIN)
+    parser.add_argument('--patience', type=int, default=PATIENCE)
+    parser.add_argument('--window', type=int, default=WINDOW)
+    parser.add_argument('--retry-failed', action='store_true', help='失敗したジョブもやり直す')
+    args = parser.parse_args()
+
+    ranges = dict(parse_param(text) for text in args.param)
+    sweep_dir = os.path.join(SWEEP_ROOT, args.name)
+    queue = JobQueue(sweep_dir)
+    if not queue.jobs() and not ranges:
+        parser.error('新しいスイープには --param が必要です')
+    queue, settings = create_sweep(sweep_dir, ranges, args.base_config, args.samples, args.seed,
+                                   settings=settings_from_args(args))
+    queue.recover(retry_failed=args.retry_failed)
+
+    os.makedirs(os.path.join(sweep_dir, 'runs'), exist_ok=True)
+    start = time.time()
+    run_sweep(sweep_dir, queue, args.workers, args.torch_threads, settings['learner'],
+              settings['train_kwargs'], settings['stop_kwargs'])
+
+    jobs, path = write_results(sweep_dir, queue.jobs())
+    counts = {status: sum(job['status'] == status for job in jobs) for status in ('done', 'stopped', 'failed')}
+    print(f"\nSweep finished in {time.time() - start:.1f}s: "
+          f"{counts['done']} done, {counts['stopped']} stopped early, {counts['failed']} failed")
+    print(f"Results saved to {path}")
+    print(f"\n{'id':<6}{'final':>9}  " + '  '.join(f'{key:>13}' for key in REWARD_KEYS))
+    for job in jobs[:10]:
+        if job.get('final') is None:
+            continue
+        print(f"{job['id']:<6}{job['final']:>9.4f}  " + '  '.join(f"{job['params'].get(key, '-'):>13}" for key in REWARD_KEYS))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import os
+import csv
+import numpy as np
+from blackjack_utils import load_reward_config, is_soft_hand
+from score_table import compile_reward_config, batch_rewards
+from batch_env import BatchBlackjackEnv, rollout
+from convergence import ConvergenceMonitor, policy_actions, min_episode_for
+
+# ---------------------------------------------------------
+# 表形式 (Q-table) の Q学習
+# ---------------------------------------------------------
+# 状態は (プレイヤー合計, ディーラーのアップカード, ソフトか) だけなので、
+# DQN の代わりに NumPy の Q-table を直接学習する。
+# 保存形式は model_<性格>.npz (policies.load_policy で読み込める)
+
+# Q-table の大きさ: プレイヤー合計 0〜21, アップカード 0〜11, ソフト 0/1, 行動 Hit/Stand
+TABLE_SHAPE = (22, 12, 2, 2)
+
+
+class TabularAgent:
+    """Q-table をもつエージェント (DQNAgent.eval_step と同じ形で使える)"""
+
+    def __init__(self, q_table=None, counts=None, min_step_size=0.002):
+        self.q_table = np.zeros(TABLE_SHAPE) if q_table is None else q_table
+        self.counts = np.zeros(TABLE_SHAPE, dtype=np.int64) if counts is None else counts
+        # 1/訪問回数 の学習率がこれより小さくならないようにする (ε を下げた後の方策に追従させるため)
+        self.min_step_size = min_step_size
+
+    def q_values(self, obs, soft=None):
+        obs = np.asarray(obs)
+        if soft is None:
+            soft = np.zeros(len(obs), dtype=bool)
+        player = np.minimum(obs[:, 0], TABLE_SHAPE[0] - 1)
+        return self.q_table[player, obs[:, 1], np.asarray(soft, dtype=np.int64)]
+
+    def act(self, obs, soft, epsilon, rng):
+        """ε-greedy でバッチの行動を選ぶ"""
+        actions = np.argmax(self.q_values(obs, soft), axis=1)
+        explore = rng.random(len(obs)) < epsilon
+        actions[explore] = rng.integers(0, 2, size=int(explore.sum()))
+        return actions
+
+    def update(self, data, rewards):
+        """rollout の全遷移でまとめて Q学習の更新をする
+
+        途中の遷移は報酬0で次状態の max Q を、最後の遷移はそのエピソードのカスタム報酬を目標にする。
+        同じマスに入る目標はバッチ内で平均してから1回だけ更新する。
+        """
+        valid = data['valid']
+        next_valid = np.zeros_like(valid)
+        next_valid[:-1] = valid[1:]
+        terminal = valid & ~next_valid
+
+        # 次状態の価値 (終端以外)。終端の位置はバーストなどで範囲外になりうるので切り詰める
+        next_obs = np.roll(data['obs'], -1, axis=0)
+        next_soft = np.roll(data['soft'], -1, axis=0).astype(np.int64)
+        next_player = np.minimum(next_obs[..., 0], TABLE_SHAPE[0] - 1)
+        next_dealer = np.minimum(next_obs[..., 1], TABLE_SHAPE[1] - 1)
+        next_value = self.q_table[next_player, next_dealer, next_soft].max(axis=-1)
+        targets = np.where(terminal, np.broadcast_to(rewards, valid.shape), next_value)[valid]
+
+        obs = data['obs'][valid]
+        index = (obs[:, 0], obs[:, 1], data['soft'][valid].astype(np.int64), data['actions'][valid].astype(np.int64))
+        sums = np.zeros(TABLE_SHAPE)
+        visits = np.zeros(TABLE_SHAPE, dtype=np.int64)
+        np.add.at(sums, index, targets)
+        np.add.at(visits, index, 1)
+
+        seen = visits > 0
+        self.counts += visits
+        step_size = np.maximum(visits[seen] / self.counts[seen], np.minimum(visits[seen] * self.min_step_size, 1.0))
+        batch_mean = sums[seen] / visits[seen]
+        self.q_table[seen] += step_size * (batch_mean - self.q_table[seen])
+
+    def eval_step(self, state):
+        raw_obs = state.get('raw_obs')
+        soft = is_soft_hand(raw_obs['player0 hand']) if raw_obs else False
+        q_values = self.q_values(np.expand_dims(state['obs'], 0), [soft])[0]
+        best_action = int(np.argmax(q_values))
+        info = {}
+        info['values'] = {name: float(q_values[i]) for i, name in enumerate(['hit', 'stand'])}
+        return best_action, info
+
+    def save(self, path):
+        np.savez(path, kind='tabular', q_table=self.q_table, counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(q_table=data['q_table'], counts=data['counts'])
+
+
+def episode_rewards(env, reward_table):
+    """終了した全ゲームのカスタム報酬 (score_table.compile_reward_config のテーブルから引く)"""
+    return batch_rewards(reward_table, env.payoffs, env.player_score)
+
+
+def evaluate_tabular(agent, num_games, seed=42):
+    """rlcard.utils.tournament と同じく平均払い戻しを返す"""
+    from evaluation import evaluate_models
+    return evaluate_models({'agent': agent}, num_games, seed=seed)[0]['mean_payoff']
+
+
+def train_tabular(config_path, target_personality, num_episodes=1000000, batch_size=1000,
+                  evaluate_every=10000, eval_games=10000, epsilon_start=1.0, epsilon_end=0.05,
+                  seed=42, save_dir='experiments/blackjack_custom_reward', on_evaluate=None, converge=False):
+    """on_evaluate(episode, result) が True (か理由の文字列) を返したらそこで学習を打ち切る (sweep.py の早期終了用)
+    converge=True なら戦略表の安定や勝率の頭打ちで収束したところで打ち切る (convergence.py)
+    打ち切った場合は performance ログの最後に [エピソード, 結果, 理由] の行を追加する
+    """
+    # 1. 対応するCSVファイルを読み込む
+    reward_config = load_reward_config(config_path)
+    reward_table = compile_reward_config(reward_config)
+
+    if not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+
+    log_path = os.path.join(save_dir, f'performance_{target_personality}.csv')
+    model_save_name = f'model_{target_personality}.npz'
+
+    # 2. 環境とエージェント
+    env = BatchBlackjackEnv(batch_size, seed=seed)
+    rng = np.random.default_rng(seed)
+    agent = TabularAgent()
+
+    monitor = ConvergenceMonitor(min_episode_for(num_episodes)) if converge else None
+
+    # 3. 学習ループ (batch_size エピソードずつ)
+    decay_episodes = max(num_episodes // 2, 1)
+    print(f"Start tabular training ({target_personality}) using {config_path}...")
+
+    episode = 0
+    next_eval = 0
+    while episode < num_episodes:
+        if episode >= next_eval:
+            result = evaluate_tabular(agent, eval_games)
+            print(f'Episode: {episode}, Win Rate: {result:.4f}')
+
+            with open(log_path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow([episode, result])
+            next_eval += evaluate_every
+
+            reason = monitor.update(episode, result, policy_actions(agent)) if monitor is not None else None
+            if reason is None and on_evaluate is not None:
+                stop = on_evaluate(episode, result)
+                if stop:
+                    reason = stop if isinstance(stop, str) else 'stopped early'
+            if reason is not None:
+                print(f"Stopped early at episode {episode} ({reason})")
+                with open(log_path, 'a', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow([episode, result, reason])
+                break
+
+        # ε は学習の前半で epsilon_start -> epsilon_end に線形に下げる
+        epsilon = epsilon_end + (epsilon_start - epsilon_end) * max(0.0, 1.0 - episode / decay_episodes)
+        data = rollout(env, lambda obs, soft: agent.act(obs, soft, epsilon, rng))
+        agent.update(data, episode_rewards(env, reward_table))
+        episode += batch_size
+
+    final_save_path = os.path.join(save_dir, model_save_name)
+    agent.save(final_save_path)
+    print(f"Training finished. Model saved to {final_save_path}")
+    return agent
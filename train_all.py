@@ -1,44 +1,193 @@
-import rlcard
-from rlcard.agents import DQNAgent
-from rlcard.utils import tournament
-import torch
 import os
 import csv
 import glob
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout, redirect_stderr
 from train_and_save import train_and_save
+from tabular_agent import train_tabular
+from actor_learner import train_actor_learner
 
 # --- 設定 ---
 # configファイルが入っているフォルダ
-CONFIG_DIR = 'personality' 
+CONFIG_DIR = 'personality'
 # 保存先フォルダ
 SAVE_DIR = 'experiments/blackjack_custom_reward'
+# 学習方法: DQN (train_and_save) / Q-table (train_tabular) / アクター・ラーナー型の DQN (train_actor_learner)
+LEARNERS = {'dqn': train_and_save, 'tabular': train_tabular, 'actor': train_actor_learner}
 
-if not os.path.exists(SAVE_DIR):
-    os.makedirs(SAVE_DIR)
-
-# ---------------------------------------------------------
-# 1. personalityフォルダから設定ファイルを全取得
-# ---------------------------------------------------------
-search_pattern = os.path.join(CONFIG_DIR, 'config_*.csv')
-config_files = glob.glob(search_pattern)
-config_files.sort()
-
-if not config_files:
-    print(f"エラー: '{CONFIG_DIR}' フォルダに config_*.csv が見つかりません。")
-    exit()
-
-# ---------------------------------------------------------
-# 2. ファイルごとにループして学習実行
-# ---------------------------------------------------------
-for config_path in config_files:
-    
+
+def personality_from_config(config_path):
     # ファイル名から性格名を取得 (例: personality/config_aggressive.csv -> aggressive)
     file_name = os.path.basename(config_path)
-    target_personality = file_name.replace('config_', '').replace('.csv', '')
-    
-    print(f"\n==================================================")
-    print(f" START TRAINING: {target_personality}")
-    print(f" Config File   : {config_path}")
-    print(f"==================================================")
-
-    train_and_save(config_path,target_personality)
\ No newline at end of file
+    return file_name.replace('config_', '').replace('.csv', '')
+
+
+def _init_worker(torch_threads):
+    """ワーカープロセスごとに torch のスレッド数を制限する"""
+    import torch
+    torch.set_num_threads(torch_threads)
+    try:
+        torch.set_num_interop_threads(torch_threads)
+    except RuntimeError:
+        # 既に並列処理が始まっている場合は変更できない
+        pass
+
+
+def _train_worker(config_path, target_personality, log_path, learner='dqn', train_kwargs=None):
+    """1つの性格を学習する (出力はその性格専用のログファイルへ)"""
+    start = time.time()
+    status, error = 'ok', ''
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        with redirect_stdout(log_file), redirect_stderr(log_file):
+            try:
+                LEARNERS[learner](config_path, target_personality, **(train_kwargs or {}))
+            except Exception as e:
+                traceback.print_exc()
+                status, error = 'failed', repr(e)
+    return {
+        'name': target_personality,
+        'status': status,
+        'error': error,
+        'time': time.time() - start,
+        'log': log_path,
+    }
+
+
+def print_summary(results, wall_time):
+    print("\n##########################################")
+    print(" TRAINING SUMMARY")
+    print("##########################################")
+    print(f"{'Personality':<15} {'Status':<8} {'Time[s]':>9}  Log")
+    print("-" * 60)
+    for res in sorted(results, key=lambda x: x['name']):
+        print(f"{res['name']:<15} {res['status']:<8} {res['time']:>9.1f}  {res['log']}")
+        if res['error']:
+            print(f"    Error: {res['error']}")
+    print(f"Total wall time: {wall_time:.1f}s")
+    print("##########################################")
+
+
+def run_sequential(config_files, learner='dqn', train_kwargs=None):
+    results = []
+    for config_path in config_files:
+        target_personality = personality_from_config(config_path)
+
+        print(f"\n==================================================")
+        print(f" START TRAINING: {target_personality}")
+        print(f" Config File   : {config_path}")
+        print(f"==================================================")
+
+        start = time.time()
+        LEARNERS[learner](config_path, target_personality, **(train_kwargs or {}))
+        results.append({'name': target_personality, 'status': 'ok', 'error': '',
+                        'time': time.time() - start, 'log': '(stdout)'})
+    return results
+
+
+def run_parallel(config_files, workers, torch_threads, learner='dqn', train_kwargs=None, save_dir=SAVE_DIR):
+    print(f"Training {len(config_files)} personalities with {workers} workers "
+          f"({torch_threads} torch threads each)...")
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(torch_threads,)) as executor:
+        futures = {}
+        for config_path in config_files:
+            target_personality = personality_from_config(config_path)
+            log_path = os.path.join(save_dir, f'train_{target_personality}.log')
+            futures[executor.submit(_train_worker, config_path, target_personality, log_path,
+                                    learner, train_kwargs)] = target_personality
+
+        for future in as_completed(futures):
+            res = future.result()
+            print(f"  [{res['status']}] {res['name']} ({res['time']:.1f}s) -> {res['log']}")
+            results.append(res)
+    return results
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='personality フォルダの全設定で学習する')
+    parser.add_argument('--config-dir', default=CONFIG_DIR, help='config_*.csv があるフォルダ')
+    parser.add_argument('--save-dir', default=SAVE_DIR, help='モデルと学習ログの保存先')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='並列に学習するプロセス数 (1なら従来通り順番に実行)')
+    parser.add_argument('--torch-threads', type=int, default=1,
+                        help='並列モードで各ワーカーが使う torch のスレッド数')
+    parser.add_argument('--learner', choices=sorted(LEARNERS), default='dqn',
+                        help='学習方法 (dqn: DQNAgent / tabular: Q-table の Q学習 / actor: アクター・ラーナー型の DQN)')
+    parser.add_argument('--actors', type=int, default=None,
+                        help='--learner actor でゲームを進めるアクタープロセスの数')
+    parser.add_argument('--multi-head', action='store_true',
+                        help='全性格を1つのゲームの流れと積み重ねた Q-net で同時に学習する (multi_head.py)')
+    parser.add_argument('--async-eval', action='store_true',
+                        help='DQN の評価をバックグラウンドのプロセスで行い、学習を止めない')
+    parser.add_argument('--eval-games', type=int, default=None,
+                        help='1回の評価で対戦するゲーム数')
+    parser.add_argument('--checkpoint-every', type=int, default=None,
+                        help='DQN の学習状態を保存する間隔 (エピソード数)')
+    parser.add_argument('--resume', action='store_true',
+                        help='checkpoint_<性格>.pt があればそこから学習を再開する')
+    parser.add_argument('--converge', action='store_true',
+                        help='戦略表の安定や勝率の頭打ちで収束したら学習を打ち切る')
+    parser.add_argument('--profile', action='store_true',
+                        help='学習ループのフェーズごとの時間を計測して profile_<性格>.json / .csv に保存する')
+    args = parser.parse_args(argv)
+    if args.learner != 'dqn' and (args.async_eval or args.checkpoint_every or args.resume or args.profile):
+        parser.error('--async-eval / --checkpoint-every / --resume / --profile は --learner dqn でのみ使えます')
+    if args.actors is not None and args.learner != 'actor':
+        parser.error('--actors は --learner actor でのみ使えます')
+    if args.multi_head and (args.learner != 'dqn' or args.workers > 1 or args.async_eval or args.checkpoint_every
+                            or args.resume or args.profile or args.converge):
+        parser.error('--multi-head は --eval-games 以外のオプションと一緒に使えません')
+
+    if not os.path.exists(args.save_dir):
+        os.makedirs(args.save_dir)
+
+    # ---------------------------------------------------------
+    # 1. personalityフォルダから設定ファイルを全取得
+    # ---------------------------------------------------------
+    search_pattern = os.path.join(args.config_dir, 'config_*.csv')
+    config_files = glob.glob(search_pattern)
+    config_files.sort()
+
+    if not config_files:
+        print(f"エラー: '{args.config_dir}' フォルダに config_*.csv が見つかりません。")
+        return
+
+    # ---------------------------------------------------------
+    # 2. ファイルごとに学習実行 (順番に / プロセスプールで並列に)
+    # ---------------------------------------------------------
+    train_kwargs = {'save_dir': args.save_dir}
+    if args.eval_games is not None:
+        train_kwargs['eval_games'] = args.eval_games
+    if args.async_eval:
+        train_kwargs['async_eval'] = True
+    if args.checkpoint_every:
+        train_kwargs['checkpoint_every'] = args.checkpoint_every
+    if args.resume:
+        train_kwargs['resume'] = True
+    if args.profile:
+        train_kwargs['profile'] = True
+    if args.converge:
+        train_kwargs['converge'] = True
+    if args.actors is not None:
+        train_kwargs['num_actors'] = args.actors
+
+    start = time.time()
+    if args.multi_head:
+        from multi_head import train_multi_head
+        train_multi_head(config_files, **train_kwargs)
+        results = [{'name': personality_from_config(path), 'status': 'ok', 'error': '',
+                    'time': time.time() - start, 'log': '(stdout)'} for path in config_files]
+    elif args.workers > 1:
+        results = run_parallel(config_files, args.workers, args.torch_threads, args.learner, train_kwargs,
+                               save_dir=args.save_dir)
+    else:
+        results = run_sequential(config_files, args.learner, train_kwargs)
+    print_summary(results, time.time() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,64 @@
-import rlcard
-from rlcard.agents import DQNAgent
-from rlcard.utils import tournament
-import torch
 import os
 import csv
+import random
+import argparse
+import numpy as np
 from blackjack_utils import load_reward_config
-from custom_reward import  calculate_custom_reward
+from score_table import compile_reward_config, lookup_reward
+from async_eval import AsyncEvaluator
+from profiler import Profiler, NullProfiler
+from convergence import ConvergenceMonitor, policy_actions, min_episode_for
+from replay_buffer import use_ring_memory, episode_arrays, feed_batch
 
 
-def train_and_save(config_path,target_personality):
+def rng_seeds(seed):
+    """1つのシードから乱数ごとの独立したシードを作る (SeedSequence.spawn)"""
+    names = ['env', 'eval_env', 'torch', 'numpy', 'python']
+    children = np.random.SeedSequence(seed).spawn(len(names))
+    return {name: int(child.generate_state(1)[0]) for name, child in zip(names, children)}
+
+
+def train_and_save(config_path,target_personality, async_eval=False, eval_games=100,
+                   checkpoint_every=None, resume=False, profile=False,
+                   num_episodes=50000, evaluate_every=500, save_dir='experiments/blackjack_custom_reward',
+                   on_evaluate=None, converge=False, seed=None):
+    """async_eval=True なら評価をバックグラウンドのプロセスに任せて学習を止めない
+    checkpoint_every エピソードごとに checkpoint_<性格>.pt を保存し、resume=True ならそこから再開する
+    profile=True ならフェーズごとの時間を計測して profile_<性格>.json / .csv に書き出す
+    on_evaluate(episode, result) が True (か理由の文字列) を返したらそこで学習を打ち切る (sweep.py の早期終了用)
+    converge=True なら戦略表の安定や勝率の頭打ちで収束したところで打ち切る (convergence.py)
+    打ち切った場合は performance ログの最後に [エピソード, 結果, 理由] の行を追加する
+    seed を渡すと env / 評価 / torch / numpy / python の乱数をそこから作った別々のシードで初期化する
+    (None なら従来通り env だけを 42 で固定する)
+    """
+    # rlcard / torch は学習するときだけ読み込む (このモジュールを import するだけなら軽い)
+    import rlcard
+    import torch
+    from rlcard.agents import DQNAgent
+    from rlcard.utils import tournament
+    from checkpoint import save_checkpoint, load_checkpoint, truncate_log
+
     # 1. 対応するCSVファイルを読み込む
     reward_config=load_reward_config(config_path)
+    # 報酬設定を (払い戻し, 最終スコア) で引けるテーブルにしておく
+    reward_table = compile_reward_config(reward_config)
 
-    save_dir = 'experiments/blackjack_custom_reward'
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
 
     log_path = os.path.join(save_dir, f'performance_{target_personality}.csv')
     model_save_name = f'model_{target_personality}.pth'
+    checkpoint_path = os.path.join(save_dir, f'checkpoint_{target_personality}.pt')
 
     # 2. 環境設定
-    env = rlcard.make('blackjack', config={'seed': 42})
-    eval_env = rlcard.make('blackjack', config={'seed': 42})
+    seeds = rng_seeds(seed) if seed is not None else {'env': 42, 'eval_env': 42}
+    if seed is not None:
+        # Q-net の初期値・εの探索・リプレイのサンプリングもシードごとに変える
+        torch.manual_seed(seeds['torch'])
+        np.random.seed(seeds['numpy'])
+        random.seed(seeds['python'])
+    env = rlcard.make('blackjack', config={'seed': seeds['env']})
+    eval_env = rlcard.make('blackjack', config={'seed': seeds['eval_env']})
 
     # 3. エージェント設定
     agent = DQNAgent(
@@ -30,44 +67,155 @@ def train_and_save(config_path,target_personality):
         mlp_layers=[128, 128], 
         device=torch.device("cpu")
     )
+    # 遷移は観測の配列だけを int8 のリングバッファに持つ (学習の結果は rlcard の Memory と同じ)
+    use_ring_memory(agent, state_shape=env.state_shape[0])
 
     env.set_agents([agent])
     eval_env.set_agents([agent])
 
+    start_episode = 0
+    if resume and os.path.exists(checkpoint_path):
+        start_episode = load_checkpoint(checkpoint_path, agent, env, eval_env)
+        truncate_log(log_path, start_episode)
+        print(f"Resumed from {checkpoint_path} at episode {start_episode}")
+
     # 4. 学習ループ
-    num_episodes = 50000 
-    evaluate_every = 500
     print(f"Start training ({target_personality}) using {config_path}...")
 
-    for episode in range(num_episodes):
-        state, player_id = env.reset()
+    evaluator = AsyncEvaluator(log_path, num_games=eval_games, seed=seeds['eval_env']) if async_eval else None
+    profiler = Profiler() if profile else NullProfiler()
+    start_train_t = agent.train_t
+    monitor = ConvergenceMonitor(min_episode_for(num_episodes)) if converge else None
+    # 非同期評価では、評価を依頼した時点の戦略表を結果が届くまで覚えておく
+    pending_actions = {}
+    stop = None
+
+    def stop_reason(done_episode, result, actions):
+        """評価1回分から学習を止める理由を返す (止めないなら None)"""
+        if monitor is not None:
+            reason = monitor.update(done_episode, result, actions)
+            if reason is not None:
+                return reason
+        if on_evaluate is not None:
+            reason = on_evaluate(done_episode, result)
+            if reason:
+                return reason if isinstance(reason, str) else 'stopped early'
+        return None
+
+    for episode in range(start_episode, num_episodes):
+        with profiler.phase('env.reset'):
+            state, player_id = env.reset()
         trajectory = [] 
 
         while not env.is_over():
-            action = agent.step(state)
-            next_state, next_player_id = env.step(action, player_id)
+            with profiler.phase('agent.step'):
+                action = agent.step(state)
+            with profiler.phase('env.step'):
+                next_state, next_player_id = env.step(action, player_id)
             trajectory.append((state, action))
             state = next_state
 
-        payoffs = env.get_payoffs()
-        original_payoff = payoffs[player_id]
-        
-        # ★変更: 引数から personality を削除 (ロード済みデータを使うため)
-        custom_reward = calculate_custom_reward(original_payoff, state,reward_config)
+        with profiler.phase('trajectory'):
+            payoffs = env.get_payoffs()
+            original_payoff = payoffs[player_id]
+            
+            # calculate_custom_reward と同じ値をテーブルから引く
+            custom_reward = lookup_reward(reward_table, original_payoff, state['raw_obs'].get('player0 hand'))
+
+            # (s, a, custom_reward, next_s, done) をエピソード分まとめて配列にする
+            transitions = episode_arrays(trajectory, state, custom_reward, env.num_actions)
 
-        for i, (s, a) in enumerate(trajectory):
-            done = (i == len(trajectory) - 1)
-            next_s = trajectory[i+1][0] if not done else state
-            agent.feed((s, a, custom_reward, next_s, done))
+        # agent.feed を遷移ごとに呼ぶのと同じく、リプレイメモリが溜まるたびに学習 (agent.train) が走る
+        with profiler.phase('agent.feed'):
+            feed_batch(agent, *transitions)
+        profiler.count('episodes')
+        profiler.count('transitions', len(trajectory))
 
         if episode % evaluate_every == 0:
-            result = tournament(eval_env, 100)[0]
-            print(f'Episode: {episode}, Win Rate: {result:.4f}')
-            
-            with open(log_path, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([episode, result])
+            if evaluator is not None:
+                # 重みのスナップショットを渡すだけ (評価と記録はワーカーが行う)
+                evaluator.submit(episode, agent.q_estimator.qnet)
+                if monitor is not None:
+                    pending_actions[episode] = policy_actions(agent)
+                for done_episode, result in evaluator.poll():
+                    print(f'Episode: {done_episode}, Win Rate: {result:.4f}')
+                    reason = stop_reason(done_episode, result, pending_actions.pop(done_episode, None))
+                    if reason is not None and stop is None:
+                        stop = (done_episode, result, reason)
+            else:
+                with profiler.phase('evaluate'):
+                    result = tournament(eval_env, eval_games)[0]
+                print(f'Episode: {episode}, Win Rate: {result:.4f}')
+
+                with open(log_path, 'a', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow([episode, result])
+
+                reason = stop_reason(episode, result, policy_actions(agent) if monitor is not None else None)
+                if reason is not None:
+                    stop = (episode, result, reason)
+
+        if checkpoint_every and (episode + 1) % checkpoint_every == 0:
+            with profiler.phase('checkpoint'):
+                save_checkpoint(checkpoint_path, agent, env, eval_env, episode + 1)
+
+        if stop is not None:
+            print(f"Stopped early at episode {episode} ({stop[2]})")
+            break
+
+    if evaluator is not None:
+        for done_episode, result in evaluator.close(discard_after=stop[0] if stop is not None else None):
+            print(f'Episode: {done_episode}, Win Rate: {result:.4f}')
+
+    if stop is not None:
+        if evaluator is not None:
+            # 打ち切りを決める前にワーカーが書いた、打ち切り位置より後の評価は消す
+            truncate_log(log_path, stop[0] + 1)
+        # 評価ワーカーが書き終わってから、打ち切った位置と理由を最後の行に残す
+        with open(log_path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(list(stop))
+
+    if checkpoint_every:
+        # 最後の状態も保存しておけば、エピソード数を増やして学習を続けられる
+        save_checkpoint(checkpoint_path, agent, env, eval_env, episode + 1 if stop is not None else num_episodes)
 
     final_save_path = os.path.join(save_dir, model_save_name)
     torch.save(agent.q_estimator.qnet.state_dict(), final_save_path)
-    print(f"Training finished. Model saved to {final_save_path}")
\ No newline at end of file
+    print(f"Training finished. Model saved to {final_save_path}")
+
+    if profiler.enabled:
+        profiler.stop()
+        profiler.count('train_steps', agent.train_t - start_train_t)
+        json_path, _ = profiler.save(save_dir, target_personality)
+        print(profiler.summary())
+        print(f"Profile saved to {json_path}")
+
+
+def main(argv=None, prog=None):
+    from train_all import personality_from_config
+
+    parser = argparse.ArgumentParser(prog=prog, description='1つの報酬設定で DQN を学習して model_<性格>.pth を保存する')
+    parser.add_argument('config', help='報酬設定 (personality/config_*.csv)')
+    parser.add_argument('--personality', default=None, help='保存するファイルの性格名 (省略したら設定ファイル名から決める)')
+    parser.add_argument('--episodes', type=int, default=50000)
+    parser.add_argument('--evaluate-every', type=int, default=500, help='評価する間隔 (エピソード数)')
+    parser.add_argument('--eval-games', type=int, default=100, help='1回の評価で対戦するゲーム数')
+    parser.add_argument('--async-eval', action='store_true', help='評価をバックグラウンドのプロセスで行う')
+    parser.add_argument('--checkpoint-every', type=int, default=None, help='学習状態を保存する間隔 (エピソード数)')
+    parser.add_argument('--resume', action='store_true', help='checkpoint_<性格>.pt があればそこから再開する')
+    parser.add_argument('--profile', action='store_true', help='フェーズごとの時間を計測する')
+    parser.add_argument('--converge', action='store_true', help='収束したら学習を打ち切る')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--save-dir', default='experiments/blackjack_custom_reward')
+    args = parser.parse_args(argv)
+
+    train_and_save(args.config, args.personality or personality_from_config(args.config),
+                   async_eval=args.async_eval, eval_games=args.eval_games,
+                   checkpoint_every=args.checkpoint_every, resume=args.resume, profile=args.profile,
+                   num_episodes=args.episodes, evaluate_every=args.evaluate_every, save_dir=args.save_dir,
+                   converge=args.converge, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
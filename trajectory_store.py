@@ -0,0 +1,297 @@
+import os
+import json
+import argparse
+import numpy as np
+from batch_env import BatchBlackjackEnv, ACTION_STAND
+from score_table import card_str
+
+# ---------------------------------------------------------
+# 軌跡の記録と読み込み
+# ---------------------------------------------------------
+# モデルごとに1回だけゲームを進め、その記録 (カード・行動・Q値・払い戻し) を列ごとの .npy に保存する。
+# replay_text.py / replay_gif.py / show_result.py / plot.py はここから読めば、
+# 同じハンドのログ・GIF・ランキングとそのときの戦略表を使える。
+#
+# 保存形式 (TRAJECTORY_DIR):
+#   meta.json               記録条件と、記録したモデルファイルの更新日時
+#   <性格>/<列名>.npy       列ごとの配列 (np.load(mmap_mode='r') で必要な部分だけ読める)
+#
+# 列:
+#   player_cards, dealer_cards (N, K) int8  カードコード (-1 は空き)
+#   player_count, dealer_count (N,)   int8  手札の枚数
+#   actions                    (N, S) int8  各ステップの行動 (-1 は終了後)
+#   q_values                   (N, S, 2) float32  各ステップの Q値
+#   payoffs                    (N,)   int8
+#   policy_hard, policy_soft   (10, 10) int8  記録時の戦略表 (policy_table.extract_policy)
+#   policy_hard_q, policy_soft_q (10, 10, 2) float32
+
+TRAJECTORY_DIR = 'experiments/blackjack_custom_reward/trajectories'
+NUM_GAMES = 100000
+BATCH_SIZE = 65536
+SEED = 42
+
+COLUMNS = ['player_cards', 'dealer_cards', 'player_count', 'dealer_count',
+           'actions', 'q_values', 'payoffs']
+POLICY_COLUMNS = ['hard', 'soft', 'hard_q', 'soft_q']
+
+
+def _pad_concat(chunks, fill):
+    """2次元目以降の長さが違う配列を fill で埋めて縦に連結する"""
+    width = max(chunk.shape[1] for chunk in chunks)
+    padded = []
+    for chunk in chunks:
+        pad = [(0, 0)] * chunk.ndim
+        pad[1] = (0, width - chunk.shape[1])
+        padded.append(np.pad(chunk, pad, constant_values=fill))
+    return np.concatenate(padded)
+
+
+def _record_batch(policy, num_games, seed):
+    env = BatchBlackjackEnv(num_games, seed=seed)
+    obs = env.reset()
+    action_steps, q_steps = [], []
+    while not env.is_over():
+        active = env.active
+        q = np.zeros((num_games, 2), dtype=np.float32)
+        actions = np.full(num_games, -1, dtype=np.int8)
+        q[active] = policy.q_values(obs[active], soft=env.player_soft[active])
+        # DQNAgent.eval_step と同じく np.argmax (同点なら Hit)
+        actions[active] = np.argmax(q[active], axis=1)
+        action_steps.append(actions)
+        q_steps.append(q)
+        obs, _ = env.step(np.where(actions < 0, ACTION_STAND, actions))
+
+    width = max(int(env.player_count.max()), int(env.dealer_count.max()))
+    return {
+        'player_cards': env.player_cards[:, :width].copy(),
+        'dealer_cards': env.dealer_cards[:, :width].copy(),
+        'player_count': env.player_count.astype(np.int8),
+        'dealer_count': env.dealer_count.astype(np.int8),
+        'actions': np.stack(action_steps, axis=1),
+        'q_values': np.stack(q_steps, axis=1),
+        'payoffs': env.payoffs.copy(),
+    }
+
+
+def record_policy(policy, num_games, batch_size=BATCH_SIZE, seed=SEED):
+    """1つのポリシーで num_games ゲームを進め、列ごとの配列を返す
+
+    デッキは evaluation.evaluate_models と同じく [seed, バッチ番号] から作るので、
+    同じシードならモデル間・評価結果とも同じカードの並びになる。
+    """
+    chunks = []
+    played = 0
+    batch_no = 0
+    while played < num_games:
+        n = min(batch_size, num_games - played)
+        chunks.append(_record_batch(policy, n, [seed, batch_no]))
+        played += n
+        batch_no += 1
+
+    columns = {}
+    for name in COLUMNS:
+        parts = [chunk[name] for chunk in chunks]
+        if parts[0].ndim == 1:
+            columns[name] = np.concatenate(parts)
+        else:
+            columns[name] = _pad_concat(parts, 0 if name == 'q_values' else -1)
+    return columns
+
+
+def record_models(model_files, path=TRAJECTORY_DIR, num_games=NUM_GAMES, batch_size=BATCH_SIZE, seed=SEED):
+    """全モデルの軌跡と戦略表を path に保存する"""
+    from policies import load_policy, personality_from_model
+    from policy_table import extract_policy
+
+    meta = {'num_games': num_games, 'seed': seed, 'models': {}}
+    for model_path in model_files:
+        name = personality_from_model(model_path)
+        print(f"Recording {name} ({num_games} games)...")
+        policy = load_policy(model_path)
+
+        model_dir = os.path.join(path, name)
+        os.makedirs(model_dir, exist_ok=True)
+        for column, array in record_policy(policy, num_games, batch_size, seed).items():
+            np.save(os.path.join(model_dir, f'{column}.npy'), array)
+
+        table = extract_policy(policy)
+        for column in POLICY_COLUMNS:
+            dtype = np.float32 if column.endswith('_q') else np.int8
+            np.save(os.path.join(model_dir, f'policy_{column}.npy'), np.asarray(table[column], dtype=dtype))
+
+        meta['models'][name] = {'path': model_path, 'mtime': os.path.getmtime(model_path)}
+
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# ---------------------------------------------------------
+# 読み込み
+# ---------------------------------------------------------
+class ModelTrajectories:
+    """1つのモデルの記録 (列は最初に使ったときに mmap で開く)"""
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self._columns = {}
+
+    def __getitem__(self, column):
+        if column not in self._columns:
+            self._columns[column] = np.load(os.path.join(self.path, f'{column}.npy'), mmap_mode='r')
+        return self._columns[column]
+
+    def __len__(self):
+        return len(self['payoffs'])
+
+    def counts(self):
+        """(win, lose, draw)"""
+        payoffs = np.asarray(self['payoffs'])
+        return int((payoffs > 0).sum()), int((payoffs < 0).sum()), int((payoffs == 0).sum())
+
+    def policy_table(self):
+        """記録時の戦略表 (policy_table.extract_policy と同じ形)"""
+        return {column: np.asarray(self[f'policy_{column}']) for column in POLICY_COLUMNS}
+
+    def player_hand(self, i):
+        return [card_str(c) for c in self['player_cards'][i, :self['player_count'][i]]]
+
+    def dealer_hand(self, i):
+        return [card_str(c) for c in self['dealer_cards'][i, :self['dealer_count'][i]]]
+
+    def game(self, i):
+        """ゲーム i の記録
+
+        Returns:
+            dict: 'steps' は判断ごとの {'player_hand', 'dealer_up', 'action', 'q_values'}、
+                  'player_hand' / 'dealer_hand' は最終的な手札、'payoff' は払い戻し
+        """
+        player_final = self.player_hand(i)
+        dealer_final = self.dealer_hand(i)
+        actions = self['actions'][i]
+        q_values = self['q_values'][i]
+        steps = []
+        for k, action in enumerate(actions):
+            if action < 0:
+                break
+            steps.append({
+                # k 回 Hit した後の手札 (rlcard と同じくディーラーは2枚目だけが見えている)
+                'player_hand': player_final[:2 + k],
+                'dealer_up': dealer_final[1],
+                'action': int(action),
+                'q_values': q_values[k].tolist(),
+            })
+        return {
+            'steps': steps,
+            'player_hand': player_final,
+            'dealer_hand': dealer_final,
+            'payoff': int(self['payoffs'][i]),
+        }
+
+
+class TrajectoryStore:
+    """record_models で保存した記録を読む"""
+
+    def __init__(self, path=TRAJECTORY_DIR):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+    @property
+    def names(self):
+        return list(self.meta['models'])
+
+    @property
+    def num_games(self):
+        return self.meta['num_games']
+
+    @property
+    def seed(self):
+        return self.meta['seed']
+
+    def __contains__(self, name):
+        return name in self.meta['models']
+
+    def __getitem__(self, name):
+        return ModelTrajectories(os.path.join(self.path, name), name)
+
+    def is_current(self, name, model_path):
+        """記録がこのモデルファイルのもので、その後に更新されていないか"""
+        info = self.meta['models'].get(name)
+        return (info is not None
+                and os.path.abspath(info['path']) == os.path.abspath(model_path)
+                and os.path.getmtime(model_path) <= info['mtime'])
+
+
+def play_game(env, agent):
+    """rlcard の env で1ゲーム進め、ModelTrajectories.game と同じ形の記録を返す (記録がないとき用)"""
+    state, player_id = env.reset()
+    steps = []
+    while not env.is_over():
+        raw_obs = state['raw_obs']
+        d_hand = raw_obs['dealer hand']
+        action, info = agent.eval_step(state)
+        steps.append({
+            'player_hand': raw_obs['player0 hand'],
+            # 対戦中の 'dealer hand' は伏せたカードを除いたもの
+            'dealer_up': d_hand[0] if d_hand else None,
+            'action': int(action),
+            'q_values': list(info.get('values', {}).values()),
+        })
+        state, _ = env.step(action, player_id)
+
+    final_obs = state['raw_obs']
+    return {
+        'steps': steps,
+        'player_hand': final_obs['player0 hand'],
+        'dealer_hand': final_obs['dealer hand'],
+        'payoff': int(env.get_payoffs()[player_id]),
+    }
+
+
+def load_store(path, model_files, min_games=None, seed=None):
+    """全モデルの最新の記録があれば TrajectoryStore を、なければ None を返す
+
+    min_games を渡すと記録がそれより少ないとき、seed を渡すと記録時のシードと違うときも None を返す
+    (呼び出し側はその場でシミュレーションする)。
+    """
+    from policies import personality_from_model
+
+    if path is None or not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    store = TrajectoryStore(path)
+    if min_games is not None and store.num_games < min_games:
+        print(f"Trajectory store {path} has only {store.num_games} games ({min_games} needed). Simulating instead.")
+        return None
+    if seed is not None and store.seed != seed:
+        print(f"Trajectory store {path} was recorded with seed {store.seed} (not {seed}). Simulating instead.")
+        return None
+    for model_path in model_files:
+        if not store.is_current(personality_from_model(model_path), model_path):
+            print(f"Trajectory store {path} is out of date ({model_path}). Simulating instead.")
+            return None
+    return store
+
+
+def main():
+    from policies import find_models
+
+    parser = argparse.ArgumentParser(description='全モデルのゲームを1回だけ進めて軌跡を保存する')
+    parser.add_argument('--save-dir', default='experiments/blackjack_custom_reward', help='モデルがある場所')
+    parser.add_argument('--output', default=TRAJECTORY_DIR, help='軌跡の保存先')
+    parser.add_argument('--games', type=int, default=NUM_GAMES, help='モデルごとのゲーム数')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--seed', type=int, default=SEED, help='デッキのシード (全モデルで共通)')
+    args = parser.parse_args()
+
+    model_files = find_models(args.save_dir)
+    if not model_files:
+        print(f"Error: No models found in {args.save_dir}")
+        return
+    record_models(model_files, args.output, args.games, args.batch_size, args.seed)
+    print(f"Trajectories saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()